@@ -1,11 +1,31 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions, serializers, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
 from datetime import datetime, timedelta
-from django.db.models import Q
+from django.db.models import Count, Max, Q
+import hashlib
+from dataclasses import asdict
 
-from .models import Project, Tag, Task, FocusSession, TaskRelationship, Event, TimeSlot, CalendarTask
+from . import sync
+from .availability import BELGRADE_TZ, DayAvailability, localize
+from .batching import deferred_deletes
+from .bulk import BulkWriteMixin
+from .caching import bump_version
+from .closure import add_edge, rebuild, relationship_edge, would_create_cycle
+from .critical_path import critical_path
+from .filters import CalendarTaskFilter, EventFilter, FocusSessionFilter, TaskFilter
+from .mind_map import mind_map
+from .models import (
+    Project, Tag, Task, FocusSession, TaskRelationship, TaskClosure, Event, TimeSlot, CalendarTask, UserPreferences,
+)
+from .occurrences import refresh_occurrences, single_events, occurrences_between
+from .pagination import UpdatedKeysetPagination
+from .project_order import move_project, reorder_projects
+from .scheduling import shift_due_dates
 from .serializers import (
     ProjectSerializer, TagSerializer, TaskSerializer, FocusSessionSerializer, 
     TaskRelationshipSerializer, EventSerializer, TimeSlotSerializer, CalendarTaskSerializer
@@ -21,6 +41,11 @@ class ProjectViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         return Project.objects.filter(user=self.request.user).order_by('priority', 'name')
+    
+    def perform_destroy(self, instance):
+        # The cascade to tasks and relationships is journaled and unindexed once
+        with transaction.atomic(), deferred_deletes():
+            instance.delete()
 
 class TagViewSet(viewsets.ModelViewSet):
     serializer_class = TagSerializer
@@ -29,35 +54,97 @@ class TagViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Tag.objects.all()
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuth]
     ordering_fields = ['title', 'created_at', 'due_at', 'priority']
+    # Opt-in pages ordered by (updated_at, id); see UpdatedKeysetPagination
+    pagination_class = UpdatedKeysetPagination
+    filterset_class = TaskFilter
     
     def get_queryset(self):
-        return Task.objects.filter(user=self.request.user)
+        return Task.objects.filter(user=self.request.user).prefetch_related('tags')
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic(), deferred_deletes():
+            instance.delete()
+    
+    def after_bulk_write(self, created, updated):
+        sync.record_changes(self.request.user.pk, Task, [task.id for task in created + updated])
+        bump_version(self.request.user.pk, 'tasks')
 
 class FocusSessionViewSet(viewsets.ModelViewSet):
     serializer_class = FocusSessionSerializer
     permission_classes = [IsAuth]
+    pagination_class = UpdatedKeysetPagination
+    filterset_class = FocusSessionFilter
     
     def get_queryset(self):
         return FocusSession.objects.filter(user=self.request.user)
 
-class TaskRelationshipViewSet(viewsets.ModelViewSet):
+CYCLE_ERROR = 'This relationship would create a dependency cycle.'
+
+class TaskRelationshipViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     serializer_class = TaskRelationshipSerializer
     permission_classes = [IsAuth]
     
     def get_queryset(self):
         return TaskRelationship.objects.filter(from_task__user=self.request.user)
+    
+    def after_bulk_write(self, created, updated):
+        user_id = self.request.user.pk
+        if updated:
+            # Edits can move edges anywhere: reindex, then reject every
+            # written relationship that now sits on a cycle
+            rebuild(self.request.user)
+            self._reject_cycles(created, updated)
+        else:
+            # Index new edges one at a time so cycles within the batch are caught too
+            for index, relationship in enumerate(created):
+                if would_create_cycle(relationship.from_task_id, relationship.to_task_id,
+                                      relationship.relationship_type):
+                    raise serializers.ValidationError({'create': {index: [CYCLE_ERROR]}})
+                edge = relationship_edge(relationship.from_task_id, relationship.to_task_id,
+                                         relationship.relationship_type)
+                if edge:
+                    add_edge(user_id, *edge)
+        sync.record_changes(user_id, TaskRelationship, [r.id for r in created + updated])
+        bump_version(user_id, 'relationships')
+    
+    def _reject_cycles(self, created, updated):
+        edges = {
+            (operation, index): relationship_edge(r.from_task_id, r.to_task_id, r.relationship_type)
+            for operation, written in (('create', created), ('update', updated))
+            for index, r in enumerate(written)
+        }
+        edges = {key: edge for key, edge in edges.items() if edge}
+        # An edge before -> after closes a cycle when after also reaches before
+        closing = set(TaskClosure.objects.filter(
+            ancestor_id__in={after for _, after in edges.values()},
+            descendant_id__in={before for before, _ in edges.values()},
+        ).values_list('ancestor_id', 'descendant_id'))
+        errors = {}
+        for (operation, index), (before, after) in edges.items():
+            if before == after or (after, before) in closing:
+                errors.setdefault(operation, {})[index] = [CYCLE_ERROR]
+        if errors:
+            raise serializers.ValidationError(errors)
 
 # New calendar viewsets
-class EventViewSet(viewsets.ModelViewSet):
+class EventViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     serializer_class = EventSerializer
     permission_classes = [IsAuth]
+    pagination_class = UpdatedKeysetPagination
+    filterset_class = EventFilter
     
     def get_queryset(self):
         return Event.objects.filter(user=self.request.user)
+    
+    def after_bulk_write(self, created, updated):
+        for event in created + updated:
+            refresh_occurrences(event)
+        sync.record_changes(self.request.user.pk, Event, [event.id for event in created + updated])
+        bump_version(self.request.user.pk, 'calendar')
 
 class TimeSlotViewSet(viewsets.ModelViewSet):
     serializer_class = TimeSlotSerializer
@@ -69,9 +156,25 @@ class TimeSlotViewSet(viewsets.ModelViewSet):
 class CalendarTaskViewSet(viewsets.ModelViewSet):
     serializer_class = CalendarTaskSerializer
     permission_classes = [IsAuth]
+    pagination_class = UpdatedKeysetPagination
+    filterset_class = CalendarTaskFilter
     
     def get_queryset(self):
         return CalendarTask.objects.filter(user=self.request.user)
+    
+    # Scheduled tasks are written in bulk by the planner, so they bump the
+    # calendar version explicitly instead of through signals
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        bump_version(self.request.user.pk, 'calendar')
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_version(self.request.user.pk, 'calendar')
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_version(self.request.user.pk, 'calendar')
 
 # API Views
 from rest_framework.views import APIView
@@ -80,20 +183,39 @@ class ShiftScheduleView(APIView):
     permission_classes = [IsAuth]
     
     def post(self, request):
-        """Shift task schedule by specified minutes"""
-        minutes = request.data.get('minutes', 30)
+        """Shift due dates and calendar placements by specified minutes
+
+        `scope` is one of scheduling.SCOPES; without it a `task_id` shifts that
+        single task. 'range' takes `start` and `end`, 'project' a `project_id`,
+        'tag' a `tag` name and 'dependents' a `task_id`. With `dry_run` only the
+        counts are returned.
+        """
         task_id = request.data.get('task_id')
-        
+        scope = request.data.get('scope') or ('task' if task_id is not None else None)
         try:
-            task = Task.objects.get(id=task_id, user=request.user)
-            if task.due_at:
-                task.due_at += timedelta(minutes=int(minutes))
-                task.save()
-                return Response({'success': True})
-        except Task.DoesNotExist:
-            return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
+            minutes = int(request.data.get('minutes', 30))
+            if scope in ('task', 'dependents'):
+                task_id = int(task_id)
+                if not Task.objects.filter(id=task_id, user=request.user).exists():
+                    return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
+            start = request.data.get('start')
+            end = request.data.get('end')
+            result = shift_due_dates(
+                request.user, minutes, scope,
+                dry_run=str(request.data.get('dry_run', '')).lower() in ('1', 'true'),
+                start=parse_datetime(start) if start else None,
+                end=parse_datetime(end) if end else None,
+                project_id=request.data.get('project_id'),
+                tag=request.data.get('tag'),
+                task_id=task_id,
+            )
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e) or 'Invalid request'}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({'error': 'Invalid request'}, status=status.HTTP_400_BAD_REQUEST)
+        if scope == 'task' and not result.tasks:
+            # The task has no due date
+            return Response({'error': 'Invalid request'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': True, **asdict(result)})
 
 class TaskRelationshipView(APIView):
     permission_classes = [IsAuth]
@@ -108,6 +230,12 @@ class TaskRelationshipView(APIView):
             from_task = Task.objects.get(id=from_task_id, user=request.user)
             to_task = Task.objects.get(id=to_task_id, user=request.user)
             
+            if would_create_cycle(from_task.id, to_task.id, relationship_type):
+                return Response(
+                    {'error': 'This relationship would create a dependency cycle'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
             relationship, created = TaskRelationship.objects.get_or_create(
                 from_task=from_task,
                 to_task=to_task,
@@ -126,25 +254,192 @@ class ProjectPriorityView(APIView):
     permission_classes = [IsAuth]
 
     def post(self, request):
-        """Update project priorities via drag and drop reordering"""
-        project_orders = request.data.get('project_orders', [])
+        """Update project priorities via drag and drop reordering
 
+        Either the whole order as `project_orders` ([{project_id, priority}]),
+        or a single move as `project_id` plus `after_id` (omit it to move the
+        project to the top).
+        """
         try:
-            for order_data in project_orders:
+            if 'project_id' in request.data:
+                after_id = request.data.get('after_id')
+                result = move_project(
+                    request.user, int(request.data['project_id']),
+                    int(after_id) if after_id is not None else None,
+                )
+                return Response(dict(result, success=True))
+
+            priorities = {}
+            for order_data in request.data.get('project_orders', []):
                 project_id = order_data.get('project_id')
                 new_priority = order_data.get('priority')
-
                 if project_id is not None and new_priority is not None:
-                    project = Project.objects.get(id=project_id)
-                    project.priority = new_priority
-                    project.save()
-
-            return Response({'success': True, 'message': 'Project priorities updated successfully'})
+                    priorities[int(project_id)] = int(new_priority)
+            updated = reorder_projects(request.user, priorities)
+            return Response({
+                'success': True,
+                'updated': updated,
+                'message': 'Project priorities updated successfully',
+            })
         except Project.DoesNotExist:
             return Response({'error': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
+        except (TypeError, ValueError, AttributeError) as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+class CalendarWeekView(APIView):
+    """Compact JSON for one calendar week with ETag revalidation.
+
+    The ETag is built from the row counts and latest updated_at/created_at of
+    everything shown in the week, so a conditional GET is answered with 304
+    after a few aggregate queries, before the payload is built.
+    """
+    permission_classes = [IsAuth]
+
+    def get(self, request):
+        try:
+            week_offset = int(request.GET.get('week', 0))
+        except ValueError:
+            week_offset = 0
+
+        today = timezone.now().date()
+        start_of_week = today - timedelta(days=today.weekday()) + timedelta(weeks=week_offset)
+        end_of_week = start_of_week + timedelta(days=6)
+
+        events = single_events(request.user).filter(
+            start_time__date__gte=start_of_week,
+            start_time__date__lte=end_of_week
+        )
+        occurrences = occurrences_between(request.user, start_of_week, end_of_week)
+        calendar_tasks = CalendarTask.objects.filter(
+            user=request.user,
+            calendar_date__gte=start_of_week,
+            calendar_date__lte=end_of_week
+        )
+        time_slots = TimeSlot.objects.filter(user=request.user, is_active=True)
+
+        signature = [
+            start_of_week.isoformat(),
+            events.aggregate(count=Count('id'), changed=Max('updated_at')),
+            occurrences.aggregate(count=Count('id'), changed=Max('event__updated_at')),
+            calendar_tasks.aggregate(
+                count=Count('id'), changed=Max('updated_at'), task_changed=Max('task__updated_at'),
+                project_changed=Max('task__project__updated_at'),
+            ),
+            time_slots.aggregate(count=Count('id'), changed=Max('updated_at')),
+        ]
+        etag = quote_etag(hashlib.sha1(repr(signature).encode()).hexdigest())
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        data = {
+            'week': week_offset,
+            'start': start_of_week,
+            'end': end_of_week,
+            'events': [
+                {'id': event.id, 'title': event.title, 'start': event.start_time, 'end': event.end_time}
+                for event in events.order_by('start_time')
+            ],
+            'occurrences': [
+                {
+                    'event_id': occurrence.event_id, 'title': occurrence.event.title,
+                    'start': occurrence.start_time, 'end': occurrence.end_time,
+                }
+                for occurrence in occurrences
+            ],
+            'tasks': [
+                {
+                    'id': calendar_task.id, 'task_id': calendar_task.task_id,
+                    'title': calendar_task.task.title, 'priority': calendar_task.task.priority,
+                    'project': calendar_task.task.project.name if calendar_task.task.project else None,
+                    'date': calendar_task.calendar_date,
+                    'start': calendar_task.scheduled_start, 'end': calendar_task.scheduled_end,
+                }
+                for calendar_task in calendar_tasks.select_related('task__project').order_by('scheduled_start')
+            ],
+            'time_slots': [
+                {
+                    'id': time_slot.id, 'name': time_slot.name, 'start': time_slot.start_time,
+                    'end': time_slot.end_time, 'days': time_slot.days_of_week,
+                }
+                for time_slot in time_slots
+            ],
+        }
+        return Response(data, headers=headers)
+
+class FreeSlotsView(APIView):
+    """Free time on a day after events, time slots and scheduled tasks."""
+    permission_classes = [IsAuth]
+
+    def get(self, request):
+        try:
+            day = datetime.strptime(request.GET['date'], '%Y-%m-%d').date() if 'date' in request.GET else timezone.localdate()
+            minutes = int(request.GET.get('minutes', 30))
+            after = datetime.strptime(request.GET['after'], '%H:%M').time() if 'after' in request.GET else None
+        except ValueError:
+            return Response({'error': 'Invalid date, time or minutes'}, status=status.HTTP_400_BAD_REQUEST)
+
+        preferences = UserPreferences.get_or_create_for_user(request.user)
+        day_start = localize(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        busy = list(single_events(request.user).filter(
+            start_time__lt=day_end, end_time__gt=day_start
+        ).values_list('start_time', 'end_time'))
+        busy += occurrences_between(request.user, day - timedelta(days=1), day + timedelta(days=1)).filter(
+            start_time__lt=day_end, end_time__gt=day_start
+        ).values_list('start_time', 'end_time')
+        busy += CalendarTask.objects.filter(
+            user=request.user, scheduled_start__lt=day_end, scheduled_end__gt=day_start
+        ).values_list('scheduled_start', 'scheduled_end')
+        time_slots = TimeSlot.objects.filter(user=request.user, is_active=True)
+
+        availability = DayAvailability.for_day(
+            day, preferences.work_start_time, preferences.work_end_time, busy, time_slots
+        )
+        earliest = localize(day, after) if after else day_start
+        first_fit = availability.first_fit(earliest, minutes)
+        return Response({
+            'date': day,
+            'free': availability.as_list(),
+            'total_free_minutes': availability.total_free_minutes,
+            'first_fit': first_fit.astimezone(BELGRADE_TZ) if first_fit else None,
+        })
+
+class CriticalPathView(APIView):
+    """Critical path, earliest/latest start and slack for every open task."""
+    permission_classes = [IsAuth]
+
+    def get(self, request):
+        return Response(critical_path(request.user))
+
+class MindMapView(APIView):
+    """Mind map nodes with server-side layout, edges, components and cycles."""
+    permission_classes = [IsAuth]
+
+    def get(self, request):
+        return Response(mind_map(request.user))
+
+class SyncView(APIView):
+    """Rows changed or deleted since a change token, for offline clients.
+
+    Without `since` the response is a full snapshot. Either way it carries the
+    token for the next call; while `more` is set the client should call again
+    straight away.
+    """
+    permission_classes = [IsAuth]
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if not since:
+            return Response(sync.snapshot(request.user))
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({'error': 'Invalid change token'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(sync.changes_since(request.user, since))
+
 # Router setup
 from rest_framework.routers import DefaultRouter
 
@@ -1,9 +1,14 @@
 from django.urls import path, include
-from .api import router, ShiftScheduleView, TaskRelationshipView, ProjectPriorityView
+from .api import router, ShiftScheduleView, TaskRelationshipView, ProjectPriorityView, CalendarWeekView, FreeSlotsView, MindMapView, CriticalPathView, SyncView
 
 urlpatterns = [
     path('', include(router.urls)),
     path('schedule/shift/', ShiftScheduleView.as_view(), name='api_schedule_shift'),
     path('task-relationships/', TaskRelationshipView.as_view(), name='api_task_relationships'),
     path('project-priorities/', ProjectPriorityView.as_view(), name='api_project_priorities'),
+    path('calendar/week/', CalendarWeekView.as_view(), name='api_calendar_week'),
+    path('calendar/free-slots/', FreeSlotsView.as_view(), name='api_calendar_free_slots'),
+    path('mind-map/', MindMapView.as_view(), name='api_mind_map'),
+    path('critical-path/', CriticalPathView.as_view(), name='api_critical_path'),
+    path('sync/', SyncView.as_view(), name='api_sync'),
 ] 
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""Per-day availability index.
+
+A day's free time is kept as sorted, non-overlapping intervals together with
+prefix sums of their lengths and a sparse table of the longest interval in
+every power-of-two run. "How much is free" and "where is the first gap of N
+minutes after T" are then answered with binary searches instead of walking
+every event and time slot. The planner and the free-slot API share it.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import pytz
+
+BELGRADE_TZ = pytz.timezone('Europe/Belgrade')
+
+Interval = Tuple[datetime, datetime]
+
+
+def localize(day: date, time_of_day) -> datetime:
+    """Combine a date and a time into an aware datetime in the planner timezone."""
+    return BELGRADE_TZ.localize(datetime.combine(day, time_of_day))
+
+
+def subtract_interval(intervals: List[Interval], busy_start: datetime,
+                      busy_end: datetime) -> List[Interval]:
+    """Remove [busy_start, busy_end) from a sorted list of free intervals."""
+    result = []
+    for start, end in intervals:
+        if busy_end <= start or busy_start >= end:
+            result.append((start, end))
+            continue
+        if start < busy_start:
+            result.append((start, busy_start))
+        if busy_end < end:
+            result.append((busy_end, end))
+    return result
+
+
+def free_intervals(day_start: datetime, day_end: datetime, busy: Iterable[Interval]) -> List[Interval]:
+    """Free parts of [day_start, day_end) once every busy interval is removed.
+
+    Busy intervals are sorted once and swept, so building a day costs
+    O(k log k) for k events and time slots.
+    """
+    free = []
+    cursor = day_start
+    for start, end in sorted(busy):
+        if end <= cursor:
+            continue
+        if start >= day_end:
+            break
+        if start > cursor:
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < day_end:
+        free.append((cursor, day_end))
+    return free
+
+
+def time_slot_intervals(day: date, time_slots) -> List[Interval]:
+    """Busy intervals for the time slots that apply on `day`."""
+    return [
+        (localize(day, time_slot.start_time), localize(day, time_slot.end_time))
+        for time_slot in time_slots
+        if day.weekday() in time_slot.days_of_week
+    ]
+
+
+def _minutes(delta: timedelta) -> int:
+    return int(delta.total_seconds() // 60)
+
+
+class DayAvailability:
+    """Sorted free intervals and used task capacity for a single day."""
+
+    def __init__(self, free: List[Interval]):
+        self.used_minutes = 0
+        self._index(free)
+
+    @classmethod
+    def for_day(cls, day: date, work_start, work_end, busy: Iterable[Interval] = (),
+                time_slots=()) -> 'DayAvailability':
+        """Build the index for a day from work hours, busy intervals and time slots."""
+        day_start = localize(day, work_start)
+        day_end = localize(day, work_end)
+        if day_start >= day_end:
+            return cls([])
+        return cls(free_intervals(day_start, day_end, list(busy) + time_slot_intervals(day, time_slots)))
+
+    def _index(self, free: List[Interval]):
+        self.free = list(free)
+        self.starts = [start for start, _ in free]
+        self.ends = [end for _, end in free]
+        self.lengths = [_minutes(end - start) for start, end in free]
+        self._prefix = None
+        self._longest = None
+
+    @property
+    def prefix(self) -> List[int]:
+        """prefix[i] = free minutes in the first i intervals, built on demand."""
+        if self._prefix is None:
+            self._prefix = [0]
+            for length in self.lengths:
+                self._prefix.append(self._prefix[-1] + length)
+        return self._prefix
+
+    @property
+    def longest(self) -> List[List[int]]:
+        """longest[k][i] = longest interval among lengths[i:i + 2**k], built on demand."""
+        if self._longest is None:
+            self._longest = [self.lengths]
+            width = 1
+            while width * 2 <= len(self.lengths):
+                previous = self._longest[-1]
+                self._longest.append([
+                    max(previous[i], previous[i + width]) for i in range(len(previous) - width)
+                ])
+                width *= 2
+        return self._longest
+
+    def _longest_between(self, first: int, last: int) -> int:
+        """Longest interval among lengths[first:last + 1] in O(1)."""
+        level = (last - first + 1).bit_length() - 1
+        row = self.longest[level]
+        return max(row[first], row[last - (1 << level) + 1])
+
+    @property
+    def total_free_minutes(self) -> int:
+        return self.prefix[-1]
+
+    def free_minutes_between(self, start: datetime, end: datetime) -> int:
+        """Free minutes inside [start, end)."""
+        if start >= end or not self.free:
+            return 0
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end) - 1
+        if first > last:
+            return 0
+        total = self.prefix[last + 1] - self.prefix[first]
+        total -= max(0, _minutes(start - self.starts[first]))
+        total -= max(0, _minutes(self.ends[last] - end))
+        return total
+
+    def first_fit(self, earliest: datetime, minutes: int) -> Optional[datetime]:
+        """Return the first start >= earliest where `minutes` fit, or None."""
+        position = bisect_right(self.ends, earliest)
+        if position == len(self.free):
+            return None
+        # The interval containing `earliest` may only be usable from there on
+        candidate = max(self.starts[position], earliest)
+        if candidate + timedelta(minutes=minutes) <= self.ends[position]:
+            return candidate
+        position += 1
+        last = len(self.free) - 1
+        if position > last or self._longest_between(position, last) < minutes:
+            return None
+        # Binary search for the first interval that is long enough
+        low, high = position, last
+        while low < high:
+            middle = (low + high) // 2
+            if self._longest_between(position, middle) >= minutes:
+                high = middle
+            else:
+                low = middle + 1
+        return self.starts[low]
+
+    def reserve(self, start: datetime, end: datetime, minutes: int = 0):
+        """Mark [start, end) as taken and count `minutes` against the capacity.
+
+        Only the intervals overlapping [start, end) are replaced, which costs
+        O(log m) to find them plus an O(m) list splice. The prefix sums and the
+        O(m log m) range-maximum table are dropped and rebuilt by the next
+        query that needs them; a first_fit() that succeeds inside the interval
+        containing `earliest` never does.
+        """
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end) - 1
+        if first <= last:
+            pieces = subtract_interval(self.free[first:last + 1], start, end)
+            self.free[first:last + 1] = pieces
+            self.starts[first:last + 1] = [piece_start for piece_start, _ in pieces]
+            self.ends[first:last + 1] = [piece_end for _, piece_end in pieces]
+            self.lengths[first:last + 1] = [_minutes(piece_end - piece_start) for piece_start, piece_end in pieces]
+            self._prefix = None
+            self._longest = None
+        self.used_minutes += minutes
+
+    def as_list(self) -> List[dict]:
+        """Free intervals in the planner timezone, for API responses."""
+        return [
+            {'start': start.astimezone(BELGRADE_TZ), 'end': end.astimezone(BELGRADE_TZ), 'minutes': length}
+            for start, end, length in zip(self.starts, self.ends, self.lengths)
+        ]
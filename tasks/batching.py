@@ -0,0 +1,44 @@
+"""Batching for per-row delete signals.
+
+Deleting many rows, directly or through a cascade, sends post_delete once
+per row. Inside ``deferred_deletes()`` the delete handlers only collect
+what they would write, and the collected work is done once, with bulk
+queries, when the block exits without an error. Use it inside the
+transaction that deletes, so the batched writes commit with the deletes.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+_state = threading.local()
+_flushers: List[Callable[[dict], None]] = []
+
+
+def on_flush(func: Callable[[dict], None]):
+    """Register a function that writes a collected batch."""
+    _flushers.append(func)
+    return func
+
+
+def pending() -> Optional[dict]:
+    """The batch being collected, None outside deferred_deletes().
+
+    Maps a key chosen by each handler to a set of collected items.
+    """
+    return getattr(_state, 'batch', None)
+
+
+@contextmanager
+def deferred_deletes():
+    if pending() is not None:
+        # Nested: the outermost block writes the batch
+        yield
+        return
+    batch = _state.batch = defaultdict(set)
+    try:
+        yield
+    finally:
+        _state.batch = None
+    for flush in _flushers:
+        flush(batch)
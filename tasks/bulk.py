@@ -0,0 +1,221 @@
+"""Batch writes for the REST API.
+
+``POST <list endpoint>/bulk/`` takes ``{"create": [...], "update": [...],
+"delete": [ids]}``. Every list is validated item by item through a
+``BulkListSerializer`` and the whole batch is then written with one
+``bulk_create``, one ``bulk_update`` and one delete inside a single
+transaction. The response has one result per item, in request order; if any
+item is invalid nothing is written and the invalid items carry their errors.
+
+Bulk writes send no model signals, so viewsets implement
+``after_bulk_write`` to do what the signals would have done (cache
+versions, sync journal, derived indexes).
+"""
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+from .batching import deferred_deletes
+
+# Most items accepted in one request, over all three operations
+BULK_MAX_ITEMS = 2000
+
+NOT_FOUND = 'Not found.'
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """ListSerializer that writes the whole list with bulk queries.
+
+    For updates pass ``instance`` as a {pk: object} dict; every item then
+    has to carry the "id" of the object it changes.
+    """
+
+    def run_child_validation(self, data):
+        if not isinstance(self.instance, dict):
+            return super().run_child_validation(data)
+        instance = self.instance.get(data.get('id')) if isinstance(data, dict) else None
+        if instance is None:
+            raise serializers.ValidationError({'id': [NOT_FOUND]})
+        self.child.instance = instance
+        attrs = super().run_child_validation(data)
+        # Objects in the same order as validated_data
+        self._targets.append(instance)
+        return attrs
+
+    def is_valid(self, **kwargs):
+        self._targets = []
+        return super().is_valid(**kwargs)
+
+    def _split_many_to_many(self, attrs: dict):
+        names = {field.name for field in self.child.Meta.model._meta.many_to_many}
+        return {name: attrs.pop(name) for name in list(attrs) if name in names}
+
+    def _set_many_to_many(self, objects, related: list, replace: bool):
+        model = self.child.Meta.model
+        for field in model._meta.many_to_many:
+            items = [(obj, values[field.name]) for obj, values in zip(objects, related) if field.name in values]
+            if not items:
+                continue
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            if replace:
+                through.objects.filter(**{f'{source}__in': [obj for obj, _ in items]}).delete()
+            through.objects.bulk_create(
+                [through(**{source: obj, target: value}) for obj, values in items for value in values],
+                ignore_conflicts=True,
+            )
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        related = [self._split_many_to_many(attrs) for attrs in validated_data]
+        objects = model.objects.bulk_create([model(**attrs) for attrs in validated_data])
+        self._set_many_to_many(objects, related, replace=False)
+        return objects
+
+    def update(self, instance, validated_data):
+        related = [self._split_many_to_many(attrs) for attrs in validated_data]
+        objects = self._targets
+        fields = set()
+        for obj, attrs in zip(objects, validated_data):
+            for name, value in attrs.items():
+                setattr(obj, name, value)
+            fields.update(attrs)
+        # bulk_update() skips auto_now, so bump it by hand
+        if any(field.name == 'updated_at' for field in self.child.Meta.model._meta.concrete_fields):
+            now = timezone.now()
+            for obj in objects:
+                obj.updated_at = now
+            fields.add('updated_at')
+        if fields:
+            self.child.Meta.model.objects.bulk_update(objects, sorted(fields))
+        self._set_many_to_many(objects, related, replace=True)
+        return objects
+
+
+def _preload_related_fields(serializer, user, items: list):
+    """Resolve related ids for the whole batch with one query per field.
+
+    Only the user themselves and objects they own are accepted as related
+    objects.
+    """
+    User = get_user_model()
+    for name, field in serializer.fields.items():
+        relation = field.child_relation if isinstance(field, ManyRelatedField) else field
+        if not isinstance(relation, PrimaryKeyRelatedField) or relation.read_only:
+            continue
+        queryset = relation.queryset
+        if queryset.model is User:
+            queryset = User.objects.filter(pk=user.pk)
+        elif any(f.name == 'user' for f in queryset.model._meta.fields):
+            queryset = queryset.filter(user=user)
+        ids = set()
+        for item in items:
+            value = item.get(name) if isinstance(item, dict) else None
+            for pk in (value if isinstance(value, list) else [value]):
+                if isinstance(pk, int) and not isinstance(pk, bool):
+                    ids.add(pk)
+                elif isinstance(pk, str) and pk.isdigit():
+                    ids.add(int(pk))
+        objects = queryset.in_bulk(ids)
+
+        def lookup(data, relation=relation, objects=objects):
+            try:
+                return objects[int(data)]
+            except KeyError:
+                relation.fail('does_not_exist', pk_value=data)
+            except (TypeError, ValueError):
+                relation.fail('incorrect_type', data_type=type(data).__name__)
+
+        relation.to_internal_value = lookup
+
+
+def _by_index(errors) -> dict:
+    """List serializer errors as {item index: errors}.
+
+    Depending on the DRF release and its LIST_SERIALIZER_ERRORS_AS_DICT
+    setting they come as a list with an entry per item or as a dict keyed by
+    index; errors about the list itself are {"non_field_errors": [...]}.
+    """
+    if isinstance(errors, dict):
+        return dict(errors)
+    return {index: item for index, item in enumerate(errors) if item}
+
+
+class BulkWriteMixin:
+    """Adds the ``bulk`` action to a ModelViewSet."""
+
+    def after_bulk_write(self, created, updated):
+        """Stand-in for the model signals; may raise ValidationError to roll back."""
+
+    def _bulk_serializer(self, data, instance=None):
+        serializer = self.get_serializer_class()(
+            instance=instance, data=data, many=True, partial=instance is not None,
+            context=self.get_serializer_context(),
+        )
+        _preload_related_fields(serializer.child, self.request.user, data)
+        return serializer
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        to_create = request.data.get('create') or []
+        to_update = request.data.get('update') or []
+        to_delete = request.data.get('delete') or []
+        if not all(isinstance(items, list) for items in (to_create, to_update, to_delete)):
+            return Response({'error': 'create, update and delete must be lists'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(to_create) + len(to_update) + len(to_delete) > BULK_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {BULK_MAX_ITEMS} items per request'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Items are always written for the requesting user
+        if 'user' in self.get_serializer().fields:
+            to_create = [dict(item, user=request.user.pk) if isinstance(item, dict) else item for item in to_create]
+
+        queryset = self.get_queryset()
+        update_ids = [item.get('id') for item in to_update if isinstance(item, dict)]
+        instances = queryset.in_bulk([pk for pk in update_ids if isinstance(pk, int)])
+        delete_ids = [pk for pk in to_delete if isinstance(pk, int)]
+        deletable = set(queryset.filter(pk__in=delete_ids).values_list('pk', flat=True))
+
+        create_serializer = self._bulk_serializer(to_create)
+        update_serializer = self._bulk_serializer(to_update, instance=instances)
+        errors = {}
+        if to_create and not create_serializer.is_valid():
+            errors['create'] = _by_index(create_serializer.errors)
+        if to_update and not update_serializer.is_valid():
+            errors['update'] = _by_index(update_serializer.errors)
+        if len(set(update_ids)) != len(update_ids):
+            errors.setdefault('update', {})['non_field_errors'] = ['Each id may only be updated once.']
+        missing = {index: {'id': [NOT_FOUND]} for index, pk in enumerate(to_delete) if pk not in deletable}
+        if missing:
+            errors['delete'] = missing
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                created = create_serializer.save() if to_create else []
+                updated = update_serializer.save() if to_update else []
+                if deletable:
+                    with deferred_deletes():
+                        queryset.filter(pk__in=deletable).delete()
+                self.after_bulk_write(created, updated)
+        except serializers.ValidationError as e:
+            return Response({'errors': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError as e:
+            return Response({'errors': {'non_field_errors': [str(e)]}}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Reload through the viewset queryset so its prefetches apply
+        saved = queryset.in_bulk([obj.pk for obj in created + updated])
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        return Response({
+            'create': serializer_class([saved[obj.pk] for obj in created], many=True, context=context).data,
+            'update': serializer_class([saved[obj.pk] for obj in updated], many=True, context=context).data,
+            'delete': [{'id': pk, 'deleted': True} for pk in to_delete],
+        })
@@ -0,0 +1,71 @@
+"""Per-user cached data with versioned keys.
+
+Every user has a version counter per kind of data ("projects", "tasks",
+"relationships", "calendar", "preferences"). Cache keys embed the current
+version, so bumping the counter on a write makes all entries built from the
+old data unreachable without having to find and delete them; they simply
+expire. Template fragments use the same counters through ``DataVersions``.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Project
+
+# How long cached per-user data lives once its version moves on
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(user_id, namespace: str) -> str:
+    return f'tasks:version:{namespace}:{user_id}'
+
+
+def data_version(user_id, namespace: str) -> int:
+    """Current version of a user's data in `namespace`."""
+    key = _version_key(user_id, namespace)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a lost counter never reuses an old version
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(user_id, namespace: str):
+    """Invalidate everything cached for a user's data in `namespace`.
+
+    Runs once the current transaction commits, so a concurrent request can't
+    cache the old rows under the new version.
+    """
+    key = _version_key(user_id, namespace)
+    # A fresh clock value instead of cache.incr(): the file backend's incr is
+    # a non-atomic get-then-set that also resets the timeout. Racing bumps
+    # may overwrite each other, but any of them retires the old version.
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def versioned_key(user_id, namespace: str, *parts) -> str:
+    """Cache key for data derived from a user's `namespace` data."""
+    suffix = ':'.join(str(part) for part in parts)
+    return f'tasks:{namespace}:{user_id}:{data_version(user_id, namespace)}:{suffix}'
+
+
+class DataVersions:
+    """Template access to a user's data versions, e.g. ``cache_versions.tasks``."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def __getitem__(self, namespace: str) -> int:
+        return data_version(self.user_id, namespace)
+
+
+def user_projects(user) -> list:
+    """The user's projects in sidebar order, cached until a project changes."""
+    key = versioned_key(user.pk, 'projects', 'list')
+    projects = cache.get(key)
+    if projects is None:
+        projects = list(Project.objects.filter(user=user).order_by('priority', 'name'))
+        cache.set(key, projects, CACHE_TIMEOUT)
+    return projects
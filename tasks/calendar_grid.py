@@ -0,0 +1,73 @@
+"""Week grid for the calendar page.
+
+Buckets events, scheduled tasks and time slots into (date, hour) cells in a
+single pass so the template only renders what belongs to each cell instead
+of filtering every item for all 168 cells.
+"""
+import math
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+from django.utils import timezone
+
+HOURS = range(24)
+
+
+def _new_cell(day: date, hour: int) -> dict:
+    return {'date': day, 'hour': hour, 'events': [], 'tasks': [], 'time_slots': []}
+
+
+def _place(grid, kind: str, key: str, item, start: datetime, end: datetime):
+    """Add `item` to every cell its [start, end) interval overlaps."""
+    if end <= start:
+        end = start + timedelta(minutes=1)
+    first_hour = start.replace(minute=0, second=0, microsecond=0)
+    cell_start = first_hour
+    while cell_start < end:
+        cell = grid.get((cell_start.date(), cell_start.hour))
+        if cell is not None:
+            starts_here = cell_start == first_hour
+            cell[kind].append({
+                key: item,
+                'starts_here': starts_here,
+                # Minutes into the cell where the item begins
+                'offset_minutes': start.minute if starts_here else 0,
+                # Number of hour rows the item covers from this cell on
+                'span_hours': math.ceil((end - cell_start).total_seconds() / 3600),
+            })
+        cell_start += timedelta(hours=1)
+
+
+def build_week_grid(week_dates: List[date], events, calendar_tasks, time_slots,
+                    work_start: time, work_end: time) -> Tuple[Dict[Tuple[date, int], dict], List[dict]]:
+    """Return the (date, hour) -> cell mapping and the rows the template renders.
+
+    Events are the dicts built by calendar_view, calendar tasks and time slots
+    are model instances. Times are bucketed in the current timezone, matching
+    how the template displays them.
+    """
+    grid = {(day, hour): _new_cell(day, hour) for day in week_dates for hour in HOURS}
+
+    for event in events:
+        _place(grid, 'events', 'event', event,
+               timezone.localtime(event['start_time']), timezone.localtime(event['end_time']))
+
+    for calendar_task in calendar_tasks:
+        _place(grid, 'tasks', 'calendar_task', calendar_task,
+               timezone.localtime(calendar_task.scheduled_start), timezone.localtime(calendar_task.scheduled_end))
+
+    for time_slot in time_slots:
+        for day in week_dates:
+            if day.weekday() in time_slot.days_of_week:
+                _place(grid, 'time_slots', 'time_slot', time_slot,
+                       datetime.combine(day, time_slot.start_time), datetime.combine(day, time_slot.end_time))
+
+    rows = [
+        {
+            'hour': hour,
+            'is_work_hour': work_start.hour <= hour < work_end.hour,
+            'cells': [grid[(day, hour)] for day in week_dates],
+        }
+        for hour in HOURS
+    ]
+    return grid, rows
@@ -0,0 +1,162 @@
+"""Transitive closure index over task precedence.
+
+Every pair of tasks where one has to happen before the other, directly or
+through a chain of relationships, is stored as a TaskClosure row. "Everything
+blocking this task", "everything waiting on it" and "would this edge close a
+cycle" are then single indexed lookups instead of graph walks. The index is
+updated incrementally when a precedence relationship is added or removed;
+relationships removed together (a bulk delete, a deleted task's cascade)
+are folded into one update by ``batching.deferred_deletes()``.
+"""
+from collections import defaultdict
+from itertools import product
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from .dependencies import PRECEDENCE_TYPES
+from .models import Task, TaskClosure, TaskRelationship
+
+
+def relationship_edge(from_id: int, to_id: int, relationship_type: str) -> Optional[Tuple[int, int]]:
+    """(before, after) for a precedence relationship, None for other types."""
+    if relationship_type == 'depends_on':
+        return to_id, from_id
+    if relationship_type == 'blocks':
+        return from_id, to_id
+    return None
+
+
+def _successors(user_id=None, within: Optional[Set[int]] = None,
+                exclude_id: Optional[int] = None) -> Dict[int, Set[int]]:
+    """Precedence edges of a user, or only those leaving one of the tasks in `within`.
+
+    `exclude_id` leaves out one relationship.
+    """
+    if within is None:
+        relationships = TaskRelationship.objects.filter(
+            from_task__user_id=user_id, relationship_type__in=PRECEDENCE_TYPES
+        )
+    else:
+        relationships = TaskRelationship.objects.filter(
+            Q(relationship_type='depends_on', to_task_id__in=within)
+            | Q(relationship_type='blocks', from_task_id__in=within)
+        )
+    if exclude_id is not None:
+        relationships = relationships.exclude(pk=exclude_id)
+    successors = defaultdict(set)
+    for from_id, to_id, relationship_type in relationships.values_list(
+        'from_task_id', 'to_task_id', 'relationship_type'
+    ):
+        before, after = relationship_edge(from_id, to_id, relationship_type)
+        successors[before].add(after)
+    return successors
+
+
+def _reachable(successors: Dict[int, Set[int]], start: int) -> Set[int]:
+    """Tasks reachable from `start` through at least one edge."""
+    seen = set()
+    stack = list(successors.get(start, ()))
+    while stack:
+        task_id = stack.pop()
+        if task_id not in seen:
+            seen.add(task_id)
+            stack.extend(successors.get(task_id, ()))
+    return seen
+
+
+def ancestor_ids(task_id: int) -> Set[int]:
+    return set(TaskClosure.objects.filter(descendant_id=task_id).values_list('ancestor_id', flat=True))
+
+
+def descendant_ids(task_id: int) -> Set[int]:
+    return set(TaskClosure.objects.filter(ancestor_id=task_id).values_list('descendant_id', flat=True))
+
+
+def add_edge(user_id, before: int, after: int):
+    """Index a new `before` -> `after` edge.
+
+    Everything that reaches `before` now reaches everything `after` reaches.
+    """
+    sources = ancestor_ids(before) | {before}
+    targets = descendant_ids(after) | {after}
+    TaskClosure.objects.bulk_create(
+        [TaskClosure(user_id=user_id, ancestor_id=a, descendant_id=d) for a, d in product(sources, targets)],
+        ignore_conflicts=True,
+    )
+
+
+def remove_edges(edges: Iterable[Tuple[int, int]]):
+    """Drop index rows that only held through any of the removed edges.
+
+    Only tasks that reached a removed edge's `before` can lose descendants,
+    and only through tasks they reached before, so the edges leaving that
+    region are loaded once and each such task's reachability is recomputed
+    from them. Removing edges never adds pairs, so the index is only ever
+    deleted from here.
+    """
+    befores = {before for before, _ in edges}
+    if not befores:
+        return
+    sources = befores | set(
+        TaskClosure.objects.filter(descendant_id__in=befores).values_list('ancestor_id', flat=True)
+    )
+    reached = defaultdict(set)
+    for ancestor, descendant in TaskClosure.objects.filter(ancestor_id__in=sources).values_list(
+        'ancestor_id', 'descendant_id'
+    ):
+        reached[ancestor].add(descendant)
+    region = sources.union(*reached.values())
+    successors = _successors(within=region)
+    with transaction.atomic():
+        for source in sources:
+            stale = reached[source] - _reachable(successors, source)
+            if stale:
+                TaskClosure.objects.filter(ancestor_id=source, descendant_id__in=stale).delete()
+
+
+def rebuild(user):
+    """Recompute a user's whole index from their relationships."""
+    successors = _successors(user.pk)
+    rows = [
+        TaskClosure(user_id=user.pk, ancestor_id=source, descendant_id=target)
+        for source in list(successors)
+        for target in _reachable(successors, source)
+    ]
+    with transaction.atomic():
+        TaskClosure.objects.filter(user=user).delete()
+        TaskClosure.objects.bulk_create(rows)
+
+
+def upstream(task):
+    """Every task that has to happen before `task`, directly or not."""
+    return Task.objects.filter(descendant_links__descendant=task).exclude(pk=task.pk)
+
+
+def downstream(task):
+    """Every task that waits on `task`, directly or not."""
+    return Task.objects.filter(ancestor_links__ancestor=task).exclude(pk=task.pk)
+
+
+def would_create_cycle(from_id: int, to_id: int, relationship_type: str,
+                       replacing_id: Optional[int] = None) -> bool:
+    """Whether adding this relationship would make a task (indirectly) wait on itself.
+
+    `replacing_id` is a relationship being edited into this one; paths that
+    only exist through its current edge don't count.
+    """
+    edge = relationship_edge(from_id, to_id, relationship_type)
+    if edge is None:
+        return False
+    before, after = edge
+    if before == after:
+        return True
+    if not TaskClosure.objects.filter(ancestor_id=after, descendant_id=before).exists():
+        return False
+    if replacing_id is None:
+        return True
+    # The index can't tell which paths use the edited edge; walk the edges
+    # of the region reachable from `after` without it
+    region = descendant_ids(after) | {after}
+    return before in _reachable(_successors(within=region, exclude_id=replacing_id), after)
@@ -1,13 +1,22 @@
-from .models import Project
+from django.utils.functional import SimpleLazyObject
+
+from .caching import CACHE_TIMEOUT, DataVersions, user_projects
 
 
 def projects_processor(request):
     """Add projects to all template contexts for the quick add modal"""
     if request.user.is_authenticated:
-        projects = Project.objects.filter(user=request.user).order_by('priority', 'name')
+        # Only loaded if the page renders them and the view did not pass its own
+        user = request.user
+        projects = SimpleLazyObject(lambda: user_projects(user))
+        cache_versions = DataVersions(user.pk)
     else:
         projects = []
+        cache_versions = None
     
     return {
         'projects': projects,
+        # Version counters and timeout for {% cache %} fragments
+        'cache_versions': cache_versions,
+        'cache_timeout': CACHE_TIMEOUT,
     }
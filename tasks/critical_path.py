@@ -0,0 +1,123 @@
+"""Critical path and slack over the task dependency graph.
+
+Every open task is an activity that lasts its estimate. A forward pass in
+topological order gives the earliest start, a backward pass the latest start
+that does not delay the whole chain, and the difference is the slack. Tasks
+with no slack that take part in a dependency chain are critical: any delay
+on them delays everything after them. Both passes are linear in tasks plus
+edges.
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+from django.core.cache import cache
+
+from .caching import CACHE_TIMEOUT, data_version, versioned_key
+from .dependencies import DEFAULT_TASK_MINUTES, OPEN_STATUSES, DependencyGraph
+from .models import Task
+
+
+@dataclass
+class TaskTiming:
+    """Schedule bounds of one task, in minutes from the start of the work."""
+    earliest_start: int
+    latest_start: int
+    duration: int
+    critical: bool = False
+
+    @property
+    def slack(self) -> int:
+        return self.latest_start - self.earliest_start
+
+
+@dataclass
+class CriticalPathAnalysis:
+    timings: Dict[int, TaskTiming] = field(default_factory=dict)
+    # Longest chain of critical tasks, in order
+    path: List[int] = field(default_factory=list)
+    # Total length of the longest chain, in minutes
+    length: int = 0
+    # Tasks in or behind a cycle have no timing
+    cycles: List[List[int]] = field(default_factory=list)
+
+    def slack(self) -> Dict[int, int]:
+        return {task_id: timing.slack for task_id, timing in self.timings.items()}
+
+    def critical(self) -> Dict[int, int]:
+        """{task id: 1} for critical tasks, usable as a scoring column."""
+        return {task_id: 1 for task_id, timing in self.timings.items() if timing.critical}
+
+    def as_dict(self) -> dict:
+        return {
+            'length': self.length,
+            'path': self.path,
+            'cycles': self.cycles,
+            'tasks': [
+                dict(asdict(timing), task_id=task_id, slack=timing.slack)
+                for task_id, timing in self.timings.items()
+            ],
+        }
+
+
+def analyse(graph: DependencyGraph, durations: Dict[int, int]) -> CriticalPathAnalysis:
+    """Earliest/latest start and slack for every task that is not stuck in a cycle."""
+    ordering = graph.topological_order()
+    result = CriticalPathAnalysis(cycles=ordering.cycles)
+    order = ordering.order
+    ordered = set(order)
+
+    earliest_finish: Dict[int, int] = {}
+    for task_id in order:
+        start = max((earliest_finish[p] for p in graph.prerequisites(task_id)), default=0)
+        duration = durations.get(task_id, DEFAULT_TASK_MINUTES)
+        earliest_finish[task_id] = start + duration
+        result.timings[task_id] = TaskTiming(start, start, duration)
+    result.length = max(earliest_finish.values(), default=0)
+
+    for task_id in reversed(order):
+        timing = result.timings[task_id]
+        latest_finish = min(
+            (result.timings[s].latest_start for s in graph.successors[task_id] if s in ordered),
+            default=result.length,
+        )
+        timing.latest_start = latest_finish - timing.duration
+        timing.critical = timing.slack == 0 and bool(
+            graph.successors[task_id] or graph.prerequisites(task_id)
+        )
+
+    # Walk the longest chain from a critical task that starts at zero
+    current = next(
+        (task_id for task_id in order
+         if result.timings[task_id].critical and result.timings[task_id].earliest_start == 0),
+        None,
+    )
+    while current is not None:
+        result.path.append(current)
+        finish = earliest_finish[current]
+        current = next(
+            (s for s in graph.successors[current]
+             if s in ordered and result.timings[s].critical and result.timings[s].earliest_start == finish),
+            None,
+        )
+    return result
+
+
+def analyse_tasks(tasks, graph: DependencyGraph) -> CriticalPathAnalysis:
+    """Analyse already loaded tasks with their dependency graph."""
+    return analyse(graph, {task.id: task.estimate_minutes or DEFAULT_TASK_MINUTES for task in tasks})
+
+
+def critical_path(user) -> dict:
+    """The user's critical path analysis, cached on task and relationship versions."""
+    key = versioned_key(user.pk, 'relationships', 'critical_path', data_version(user.pk, 'tasks'))
+    result = cache.get(key)
+    if result is None:
+        durations = {
+            task_id: estimate or DEFAULT_TASK_MINUTES
+            for task_id, estimate in Task.objects.filter(
+                user=user, status__in=OPEN_STATUSES
+            ).values_list('id', 'estimate_minutes')
+        }
+        result = analyse(DependencyGraph.for_user(user, durations), durations).as_dict()
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,222 @@
+"""Task dependency graph built from TaskRelationship rows.
+
+Edges point from the task that has to happen first to the task that waits
+for it: "A depends_on B" and "B blocks A" both become B -> A.
+"""
+import heapq
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from django.db.models import Q
+
+from .models import TaskRelationship
+
+# Relationship types that impose an order between two tasks
+PRECEDENCE_TYPES = ('depends_on', 'blocks')
+
+# Tasks that still take part in planning
+OPEN_STATUSES = ('todo', 'in_progress')
+
+# Duration used for tasks without an estimate, by the planner and the critical path
+DEFAULT_TASK_MINUTES = 60
+
+
+@dataclass
+class TopologicalOrder:
+    """Result of ordering a dependency graph."""
+    order: List[int] = field(default_factory=list)
+    # Strongly connected groups of task ids that depend on each other
+    cycles: List[List[int]] = field(default_factory=list)
+    # Tasks that are not in a cycle themselves but wait on one
+    blocked: List[int] = field(default_factory=list)
+
+    @property
+    def has_cycles(self) -> bool:
+        return bool(self.cycles)
+
+
+class DependencyGraph:
+    """Precedence graph over a set of task ids."""
+
+    def __init__(self, task_ids: Iterable[int], edges: Iterable[tuple] = ()):
+        self.task_ids: Set[int] = set(task_ids)
+        self.successors: Dict[int, List[int]] = {task_id: [] for task_id in self.task_ids}
+        self.predecessors: Dict[int, List[int]] = {task_id: [] for task_id in self.task_ids}
+        for before, after in edges:
+            self.add_edge(before, after)
+
+    @classmethod
+    def for_user(cls, user, task_ids: Iterable[int]) -> 'DependencyGraph':
+        """Build the graph for a user's tasks with a single query."""
+        graph = cls(task_ids)
+        for from_id, to_id, relationship_type in TaskRelationship.objects.filter(
+            from_task__user=user, relationship_type__in=PRECEDENCE_TYPES
+        ).values_list('from_task_id', 'to_task_id', 'relationship_type'):
+            if relationship_type == 'depends_on':
+                graph.add_edge(to_id, from_id)
+            else:
+                graph.add_edge(from_id, to_id)
+        return graph
+
+    @classmethod
+    def around(cls, user, task_ids: Iterable[int]) -> 'DependencyGraph':
+        """Graph over `task_ids` and their open prerequisites, with a single query.
+
+        Enough to order and place those tasks without loading every other
+        task the user has.
+        """
+        task_ids = set(task_ids)
+        nodes = set(task_ids)
+        edges = []
+        for from_id, to_id, relationship_type, from_status, to_status in TaskRelationship.objects.filter(
+            Q(from_task_id__in=task_ids) | Q(to_task_id__in=task_ids),
+            from_task__user=user, relationship_type__in=PRECEDENCE_TYPES,
+        ).values_list('from_task_id', 'to_task_id', 'relationship_type', 'from_task__status', 'to_task__status'):
+            if relationship_type == 'depends_on':
+                edge, before_status = (to_id, from_id), to_status
+            else:
+                edge, before_status = (from_id, to_id), from_status
+            if edge[1] in task_ids and before_status in OPEN_STATUSES:
+                nodes.add(edge[0])
+            edges.append(edge)
+        return cls(nodes, edges)
+
+    def add_edge(self, before: int, after: int):
+        """Record that `before` has to finish before `after` can start."""
+        if before not in self.task_ids or after not in self.task_ids:
+            return
+        if after in self.successors[before]:
+            return
+        self.successors[before].append(after)
+        self.predecessors[after].append(before)
+
+    def prerequisites(self, task_id: int) -> List[int]:
+        """Tasks that have to be done before `task_id`."""
+        return self.predecessors.get(task_id, [])
+
+    def descendants(self, task_ids: Iterable[int]) -> Set[int]:
+        """Every task that transitively waits on one of `task_ids`."""
+        found = set()
+        stack = list(task_ids)
+        while stack:
+            for successor in self.successors.get(stack.pop(), []):
+                if successor not in found:
+                    found.add(successor)
+                    stack.append(successor)
+        return found
+
+    def downstream_counts(self) -> Dict[int, int]:
+        """Number of tasks that transitively wait on each task.
+
+        One pass in reverse topological order, merging the successors'
+        reachable sets as integer bitsets. Tasks in or behind a cycle fall
+        back to a plain traversal.
+        """
+        ordering = self.topological_order()
+        bit = {task_id: 1 << position for position, task_id in enumerate(self.task_ids)}
+        reachable: Dict[int, int] = {}
+        counts: Dict[int, int] = {}
+        for task_id in reversed(ordering.order):
+            mask = 0
+            for successor in self.successors[task_id]:
+                if successor in reachable:
+                    mask |= bit[successor] | reachable[successor]
+                else:
+                    # Successor waits on a cycle and was never ordered
+                    mask |= bit[successor]
+                    for descendant in self.descendants([successor]):
+                        mask |= bit[descendant]
+            reachable[task_id] = mask
+            counts[task_id] = bin(mask).count('1')
+        for task_id in self.task_ids:
+            if task_id not in counts:
+                counts[task_id] = len(self.descendants([task_id]) - {task_id})
+        return counts
+
+    def topological_order(self, key: Optional[Callable[[int], object]] = None,
+                          task_ids: Optional[Iterable[int]] = None) -> TopologicalOrder:
+        """Order tasks so every task comes after its prerequisites.
+
+        Kahn's algorithm with a heap: among the tasks that are ready, the one
+        with the lowest `key` goes first. Runs in O((V + E) log V). Tasks that
+        can never become ready are reported as cycles or blocked instead of
+        being dropped silently. `task_ids` restricts ordering to a subgraph.
+        """
+        key = key or (lambda task_id: 0)
+        nodes = self.task_ids if task_ids is None else self.task_ids & set(task_ids)
+
+        in_degree = {
+            task_id: sum(1 for p in self.predecessors[task_id] if p in nodes)
+            for task_id in nodes
+        }
+        heap = [(key(task_id), task_id) for task_id, degree in in_degree.items() if degree == 0]
+        heapq.heapify(heap)
+
+        result = TopologicalOrder()
+        while heap:
+            _, task_id = heapq.heappop(heap)
+            result.order.append(task_id)
+            for successor in self.successors[task_id]:
+                if successor not in in_degree:
+                    continue
+                in_degree[successor] -= 1
+                if in_degree[successor] == 0:
+                    heapq.heappush(heap, (key(successor), successor))
+
+        remaining = {task_id for task_id, degree in in_degree.items() if degree > 0}
+        if remaining:
+            result.cycles = self._cycles(remaining)
+            in_cycle = {task_id for cycle in result.cycles for task_id in cycle}
+            result.blocked = sorted(remaining - in_cycle, key=key)
+        return result
+
+    def _cycles(self, nodes: Set[int]) -> List[List[int]]:
+        """Strongly connected components with a cycle, using iterative Tarjan."""
+        index: Dict[int, int] = {}
+        low: Dict[int, int] = {}
+        on_stack: Set[int] = set()
+        stack: List[int] = []
+        cycles = []
+        counter = 0
+
+        for root in sorted(nodes):
+            if root in index:
+                continue
+            work = [(root, iter(self.successors[root]))]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, successors = work[-1]
+                advanced = False
+                for successor in successors:
+                    if successor not in nodes:
+                        continue
+                    if successor not in index:
+                        index[successor] = low[successor] = counter
+                        counter += 1
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self.successors[successor])))
+                        advanced = True
+                        break
+                    if successor in on_stack:
+                        low[node] = min(low[node], index[successor])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in self.successors[node]:
+                        cycles.append(sorted(component))
+        return cycles
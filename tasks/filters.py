@@ -0,0 +1,61 @@
+"""FilterSets for the API list endpoints.
+
+The filters follow the composite indexes declared on the models (owner
+first, then the filtered column), so a filtered page stays a range scan.
+"""
+import django_filters
+
+from .models import CalendarTask, Event, FocusSession, Task
+
+
+class TaskFilter(django_filters.FilterSet):
+    status = django_filters.MultipleChoiceFilter(choices=Task.STATUS_CHOICES)
+    priority = django_filters.MultipleChoiceFilter(choices=Task.PRIORITY_CHOICES)
+    priority_min = django_filters.NumberFilter(field_name='priority', lookup_expr='gte')
+    priority_max = django_filters.NumberFilter(field_name='priority', lookup_expr='lte')
+    project = django_filters.NumberFilter(field_name='project_id')
+    no_project = django_filters.BooleanFilter(field_name='project', lookup_expr='isnull')
+    due_after = django_filters.IsoDateTimeFilter(field_name='due_at', lookup_expr='gte')
+    due_before = django_filters.IsoDateTimeFilter(field_name='due_at', lookup_expr='lt')
+    has_due = django_filters.BooleanFilter(field_name='due_at', lookup_expr='isnull', exclude=True)
+    # Tasks carrying any of the given tag names
+    tag = django_filters.BaseInFilter(field_name='tags__name', distinct=True)
+    updated_after = django_filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='gt')
+
+    class Meta:
+        model = Task
+        fields = []
+
+
+class EventFilter(django_filters.FilterSet):
+    start_after = django_filters.IsoDateTimeFilter(field_name='start_time', lookup_expr='gte')
+    start_before = django_filters.IsoDateTimeFilter(field_name='start_time', lookup_expr='lt')
+    is_recurring = django_filters.BooleanFilter()
+    updated_after = django_filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='gt')
+
+    class Meta:
+        model = Event
+        fields = []
+
+
+class FocusSessionFilter(django_filters.FilterSet):
+    task = django_filters.NumberFilter(field_name='task_id')
+    kind = django_filters.ChoiceFilter(choices=FocusSession.KIND_CHOICES)
+    started_after = django_filters.IsoDateTimeFilter(field_name='start_time', lookup_expr='gte')
+    started_before = django_filters.IsoDateTimeFilter(field_name='start_time', lookup_expr='lt')
+    updated_after = django_filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='gt')
+
+    class Meta:
+        model = FocusSession
+        fields = []
+
+
+class CalendarTaskFilter(django_filters.FilterSet):
+    task = django_filters.NumberFilter(field_name='task_id')
+    date_from = django_filters.DateFilter(field_name='calendar_date', lookup_expr='gte')
+    date_to = django_filters.DateFilter(field_name='calendar_date', lookup_expr='lte')
+    updated_after = django_filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='gt')
+
+    class Meta:
+        model = CalendarTask
+        fields = []
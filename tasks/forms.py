@@ -1,5 +1,6 @@
 from django import forms
 from .models import Task, Project, Tag, TaskRelationship, Event, TimeSlot, UserPreferences, Sketch
+from .recurrence import parse_rrule
 
 
 class TaskForm(forms.ModelForm):
@@ -38,7 +39,7 @@ class EventForm(forms.ModelForm):
         fields = [
             'title', 'description', 'start_time', 'end_time', 
             'is_recurring', 'recurrence_type', 'recurrence_interval',
-            'weekdays', 'end_date', 'max_occurrences'
+            'weekdays', 'end_date', 'max_occurrences', 'recurrence_pattern'
         ]
         widgets = {
             'start_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
@@ -47,6 +48,7 @@ class EventForm(forms.ModelForm):
             'recurrence_interval': forms.NumberInput(attrs={'min': 1, 'max': 365}),
             'end_date': forms.DateInput(attrs={'type': 'date'}),
             'max_occurrences': forms.NumberInput(attrs={'min': 1, 'max': 1000}),
+            'recurrence_pattern': forms.Textarea(attrs={'rows': 2, 'placeholder': 'FREQ=WEEKLY;BYDAY=MO,WE'}),
         }
     
     def __init__(self, *args, **kwargs):
@@ -67,6 +69,19 @@ class EventForm(forms.ModelForm):
         if self.instance and self.instance.pk:
             if self.instance.weekdays:
                 self.fields['weekdays'].initial = [str(day) for day in self.instance.weekdays]
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('is_recurring') and cleaned_data.get('recurrence_type') == 'custom':
+            pattern = cleaned_data.get('recurrence_pattern', '').strip()
+            if not pattern:
+                self.add_error('recurrence_pattern', 'Enter a recurrence rule for custom recurrence.')
+            else:
+                try:
+                    parse_rrule(pattern)
+                except ValueError as e:
+                    self.add_error('recurrence_pattern', f'Invalid recurrence rule: {e}')
+        return cleaned_data
 
 class TimeSlotForm(forms.ModelForm):
     class Meta:
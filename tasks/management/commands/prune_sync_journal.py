@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from tasks.sync import SYNC_RETENTION, prune_journal
+
+
+class Command(BaseCommand):
+    help = 'Delete delta sync journal entries older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=SYNC_RETENTION.days,
+            help='Keep entries from the last N days (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune_journal(timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} sync journal entries'))
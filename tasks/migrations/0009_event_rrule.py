@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_event_occurrences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='recurrence_pattern',
+            field=models.TextField(blank=True, help_text='RFC 5545 RRULE (plus optional EXDATE lines) for custom recurrence'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_closure(apps, schema_editor):
+    """Index the precedence relationships that already exist"""
+    TaskRelationship = apps.get_model('tasks', 'TaskRelationship')
+    TaskClosure = apps.get_model('tasks', 'TaskClosure')
+    successors = {}
+    owners = {}
+    for from_id, to_id, relationship_type, user_id in TaskRelationship.objects.filter(
+        relationship_type__in=['depends_on', 'blocks']
+    ).values_list('from_task_id', 'to_task_id', 'relationship_type', 'from_task__user_id'):
+        before, after = (to_id, from_id) if relationship_type == 'depends_on' else (from_id, to_id)
+        successors.setdefault(before, set()).add(after)
+        owners[before] = user_id
+    rows = []
+    for source in successors:
+        seen = set()
+        stack = list(successors[source])
+        while stack:
+            task_id = stack.pop()
+            if task_id not in seen:
+                seen.add(task_id)
+                stack.extend(successors.get(task_id, ()))
+        rows.extend(
+            TaskClosure(user_id=owners[source], ancestor_id=source, descendant_id=target) for target in seen
+        )
+    TaskClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0010_timeslot_calendartask_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='tasks.task')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='tasks.task')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='tasks_taskc_descend_63a27b_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0011_task_closure'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='focussession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='calendartask',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='tasks_calen_user_id_e4eee0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calendartask',
+            index=models.Index(fields=['user', 'calendar_date'], name='tasks_calen_user_id_e5e979_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='tasks_event_user_id_8b8e88_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['user', 'start_time'], name='tasks_event_user_id_b4d19d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='focussession',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='tasks_focus_user_id_ec05a5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='focussession',
+            index=models.Index(fields=['user', 'start_time'], name='tasks_focus_user_id_d2b649_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='tasks_task_user_id_b4f7e4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'status', 'priority'], name='tasks_task_user_id_e76401_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'due_at'], name='tasks_task_user_id_9672ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'project', 'status'], name='tasks_task_user_id_d94a44_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def drop_occurrences(apps, schema_editor):
+    """Occurrences were dated in UTC; let them be rebuilt on demand in the planner timezone"""
+    EventOccurrence = apps.get_model('tasks', 'EventOccurrence')
+    Event = apps.get_model('tasks', 'Event')
+    EventOccurrence.objects.all().delete()
+    Event.objects.update(occurrences_start=None, occurrences_end=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0013_sync_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_occurrences, migrations.RunPython.noop),
+    ]
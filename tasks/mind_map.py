@@ -0,0 +1,128 @@
+"""Adjacency index and server-side layout for the task mind map.
+
+Edges are loaded as plain id tuples, connected components and a layered
+layout are computed once, and the result is cached per user until a task or
+relationship changes. Both the mind map page and its JSON endpoint read it.
+"""
+from typing import Dict, List
+
+from django.core.cache import cache
+
+from .caching import CACHE_TIMEOUT, data_version, versioned_key
+from .dependencies import OPEN_STATUSES, PRECEDENCE_TYPES, DependencyGraph
+from .models import Task, TaskRelationship
+
+# Layout grid in pixels
+MARGIN = 50
+LAYER_WIDTH = 180
+ROW_HEIGHT = 110
+COMPONENT_GAP = 100
+
+
+def _layout_edge(from_id: int, to_id: int, relationship_type: str):
+    """Direction an edge is drawn in, left to right, or None for undirected links."""
+    if relationship_type == 'blocks':
+        return from_id, to_id
+    if relationship_type in ('depends_on', 'subtask_of'):
+        return to_id, from_id
+    return None
+
+
+def build_mind_map(tasks: List[dict], edges: List[tuple]) -> dict:
+    """Lay out `tasks` (dicts with at least an id, in display order) and `edges`.
+
+    Every task gets a component, a layer (longest chain of directed edges
+    leading to it) and x/y coordinates. Components are placed side by side
+    in order of their first task.
+    """
+    order = [task['id'] for task in tasks]
+    position = {task_id: index for index, task_id in enumerate(order)}
+    neighbours: Dict[int, List[int]] = {task_id: [] for task_id in order}
+    successors: Dict[int, List[int]] = {task_id: [] for task_id in order}
+    in_degree = {task_id: 0 for task_id in order}
+    edges = [edge for edge in edges if edge[0] in position and edge[1] in position]
+
+    for from_id, to_id, relationship_type in edges:
+        neighbours[from_id].append(to_id)
+        neighbours[to_id].append(from_id)
+        directed = _layout_edge(from_id, to_id, relationship_type)
+        if directed and directed[0] != directed[1]:
+            successors[directed[0]].append(directed[1])
+            in_degree[directed[1]] += 1
+
+    # Connected components, ignoring direction
+    component_of: Dict[int, int] = {}
+    components: List[List[int]] = []
+    for task_id in order:
+        if task_id in component_of:
+            continue
+        component_of[task_id] = len(components)
+        members = [task_id]
+        stack = [task_id]
+        while stack:
+            for other in neighbours[stack.pop()]:
+                if other not in component_of:
+                    component_of[other] = len(components)
+                    members.append(other)
+                    stack.append(other)
+        members.sort(key=position.get)
+        components.append(members)
+
+    # Longest-path layering; tasks in a cycle keep the layer they reached
+    layer = {task_id: 0 for task_id in order}
+    ready = [task_id for task_id in order if in_degree[task_id] == 0]
+    while ready:
+        task_id = ready.pop()
+        for successor in successors[task_id]:
+            layer[successor] = max(layer[successor], layer[task_id] + 1)
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                ready.append(successor)
+
+    nodes = []
+    task_by_id = {task['id']: task for task in tasks}
+    x_offset = MARGIN
+    for index, members in enumerate(components):
+        rows: Dict[int, int] = {}
+        for task_id in members:
+            row = rows.get(layer[task_id], 0)
+            rows[layer[task_id]] = row + 1
+            nodes.append(dict(
+                task_by_id[task_id],
+                component=index,
+                layer=layer[task_id],
+                x=x_offset + layer[task_id] * LAYER_WIDTH,
+                y=MARGIN + row * ROW_HEIGHT,
+            ))
+        x_offset += (max(rows) + 1) * LAYER_WIDTH + COMPONENT_GAP
+
+    graph = DependencyGraph(order)
+    for from_id, to_id, relationship_type in edges:
+        if relationship_type in PRECEDENCE_TYPES:
+            graph.add_edge(*_layout_edge(from_id, to_id, relationship_type))
+
+    return {
+        'nodes': nodes,
+        'edges': [list(edge) for edge in edges],
+        'components': components,
+        'cycles': graph.topological_order().cycles,
+    }
+
+
+def mind_map(user) -> dict:
+    """The user's mind map for open tasks, cached on task and relationship versions."""
+    key = versioned_key(user.pk, 'relationships', 'mind_map', data_version(user.pk, 'tasks'))
+    result = cache.get(key)
+    if result is None:
+        tasks = list(
+            Task.objects.filter(user=user, status__in=OPEN_STATUSES)
+            .order_by('priority', 'id')
+            .values('id', 'title', 'priority', 'status', 'project_id')
+        )
+        edges = list(
+            TaskRelationship.objects.filter(from_task__user=user)
+            .values_list('from_task_id', 'to_task_id', 'relationship_type')
+        )
+        result = build_mind_map(tasks, edges)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
@@ -2,7 +2,9 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.utils.text import slugify
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+
+from .recurrence import iter_occurrences
 
 class Project(models.Model):
     name = models.CharField(max_length=200)
@@ -58,6 +60,15 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination on (updated_at, id) and the API filters
+            models.Index(fields=['user', 'updated_at', 'id']),
+            models.Index(fields=['user', 'status', 'priority']),
+            models.Index(fields=['user', 'due_at']),
+            models.Index(fields=['user', 'project', 'status']),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -80,6 +91,39 @@ class TaskRelationship(models.Model):
     def __str__(self):
         return f"{self.from_task} {self.get_relationship_type_display()} {self.to_task}"
 
+class TaskClosure(models.Model):
+    """Transitive closure of task precedence: `ancestor` has to happen before `descendant`"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    ancestor = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='ancestor_links')
+    
+    class Meta:
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor']),
+        ]
+    
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id}"
+
+class SyncChange(models.Model):
+    """Journal of changed and deleted rows for delta sync; the id is the change token"""
+    # No database constraint: deleting a user journals the cascaded deletes of
+    # their rows after the user's own journal has been collected
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.id} {self.model} {self.object_id}{' (deleted)' if self.deleted else ''}"
+
 class FocusSession(models.Model):
     KIND_CHOICES = [
         ('work', 'Work'),
@@ -91,6 +135,13 @@ class FocusSession(models.Model):
     kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='work')
     start_time = models.DateTimeField(auto_now_add=True)
     end_time = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id']),
+            models.Index(fields=['user', 'start_time']),
+        ]
     
     @property
     def duration_minutes(self):
@@ -142,10 +193,21 @@ class Event(models.Model):
     end_date = models.DateField(null=True, blank=True, help_text="End date for recurring events")
     max_occurrences = models.IntegerField(null=True, blank=True, help_text="Maximum number of occurrences")
     
-    # Legacy field for backward compatibility
-    recurrence_pattern = models.CharField(max_length=100, blank=True, help_text="Cron-like pattern for recurring events")
+    # Used by the 'custom' recurrence type
+    recurrence_pattern = models.TextField(blank=True, help_text="RFC 5545 RRULE (plus optional EXDATE lines) for custom recurrence")
+    
+    # Date range currently materialized in EventOccurrence
+    occurrences_start = models.DateField(null=True, blank=True, editable=False)
+    occurrences_end = models.DateField(null=True, blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id']),
+            models.Index(fields=['user', 'start_time']),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.start_time.strftime('%Y-%m-%d %H:%M')})"
@@ -154,82 +216,29 @@ class Event(models.Model):
         """Generate recurring event instances for a date range"""
         if not self.is_recurring or self.recurrence_type == 'none':
             return [self]
-        
-        events = []
-        current_date = self.start_time.date()
-        current_time = self.start_time.time()
-        end_time = self.end_time.time()
-        occurrence_count = 0
-        
-        # Calculate the maximum date to check (either end_date or end_date parameter)
-        max_date = end_date
-        if self.end_date:
-            max_date = min(end_date, self.end_date)
-        
-        # For weekly events, we need to track weeks
-        week_count = 0
-        current_week_start = current_date - timedelta(days=current_date.weekday())
-        
-        while current_date <= max_date:
-            # Check if we've reached max occurrences
-            if self.max_occurrences and occurrence_count >= self.max_occurrences:
-                break
-            
-            # Check if this date should have an event based on recurrence rules
-            should_create = False
-            
-            if self.recurrence_type == 'daily':
-                should_create = True
-            elif self.recurrence_type == 'weekly':
-                weekday = current_date.weekday()
-                # Only create if it's a selected weekday and we're in the right week interval
-                if weekday in self.weekdays and week_count % self.recurrence_interval == 0:
-                    should_create = True
-            elif self.recurrence_type == 'monthly':
-                # Same day of month
-                should_create = current_date.day == self.start_time.day
-            elif self.recurrence_type == 'yearly':
-                # Same day and month
-                should_create = (current_date.day == self.start_time.day and 
-                               current_date.month == self.start_time.month)
-            
-            if should_create and current_date >= start_date:
-                # Create event instance with timezone-aware datetimes
-                event_start = timezone.make_aware(datetime.combine(current_date, current_time))
-                event_end = timezone.make_aware(datetime.combine(current_date, end_time))
-                
-                events.append({
-                    'title': self.title,
-                    'description': self.description,
-                    'start_time': event_start,
-                    'end_time': event_end,
-                    'is_recurring_instance': True,
-                    'original_event': self,
-                })
-                occurrence_count += 1
-            
-            # Move to next occurrence based on recurrence type and interval
-            if self.recurrence_type == 'daily':
-                current_date += timedelta(days=self.recurrence_interval)
-            elif self.recurrence_type == 'weekly':
-                # For weekly, move to next day
-                current_date += timedelta(days=1)
-                
-                # Check if we've moved to a new week
-                new_week_start = current_date - timedelta(days=current_date.weekday())
-                if new_week_start > current_week_start:
-                    week_count += 1
-                    current_week_start = new_week_start
-            elif self.recurrence_type == 'monthly':
-                # Move to next month
-                if current_date.month == 12:
-                    current_date = current_date.replace(year=current_date.year + 1, month=1)
-                else:
-                    current_date = current_date.replace(month=current_date.month + 1)
-            elif self.recurrence_type == 'yearly':
-                current_date = current_date.replace(year=current_date.year + self.recurrence_interval)
-        
-        return events
+        return list(self.iter_recurring_events(start_date, end_date))
+    
+    def iter_recurring_events(self, start_date, end_date):
+        """Lazily yield recurring event instances for a date range"""
+        return iter_occurrences(self, start_date, end_date)
+
+class EventOccurrence(models.Model):
+    """Materialized occurrence of a recurring event"""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='occurrences')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    occurrence_date = models.DateField()
+    
+    class Meta:
+        ordering = ['start_time']
+        unique_together = ['event', 'start_time']
+        indexes = [
+            models.Index(fields=['user', 'occurrence_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event.title} ({self.start_time.strftime('%Y-%m-%d %H:%M')})"
 
 class TimeSlot(models.Model):
     """Model for time slots when user is not available (breaks, etc.)"""
@@ -249,6 +258,7 @@ class TimeSlot(models.Model):
     days_of_week = models.JSONField(default=list, help_text="List of days (0=Monday, 6=Sunday)")
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.name} ({self.start_time} - {self.end_time})"
@@ -261,9 +271,14 @@ class CalendarTask(models.Model):
     calendar_date = models.DateField()
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['task', 'calendar_date']
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id']),
+            models.Index(fields=['user', 'calendar_date']),
+        ]
     
     def __str__(self):
         return f"{self.task.title} on {self.calendar_date} ({self.scheduled_start.strftime('%H:%M')}-{self.scheduled_end.strftime('%H:%M')})"
@@ -286,8 +301,8 @@ class UserPreferences(models.Model):
         preferences, created = cls.objects.get_or_create(
             user=user,
             defaults={
-                'work_start_time': '09:00',
-                'work_end_time': '17:00',
+                'work_start_time': time(9, 0),
+                'work_end_time': time(17, 0),
                 'daily_work_hours': 6,
             }
         )
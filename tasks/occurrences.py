@@ -0,0 +1,112 @@
+"""Materialized occurrences of recurring events.
+
+Recurring events are expanded into EventOccurrence rows over a rolling
+horizon so the calendar and the scheduler can read them with a plain indexed
+date-range query. Each event remembers which date range is materialized;
+the range is rebuilt when the event is saved and extended on demand when a
+caller asks for dates outside it.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import BELGRADE_TZ
+from .caching import bump_version
+from .models import Event, EventOccurrence
+from .recurrence import iter_occurrences
+
+# Materialized window around today when an event is saved
+PAST_DAYS = 31
+HORIZON_DAYS = 92
+
+
+def recurring_events(user):
+    """Events that are expanded into occurrences."""
+    return Event.objects.filter(user=user, is_recurring=True).exclude(recurrence_type='none')
+
+
+def single_events(user):
+    """Events that are shown as-is and never expanded."""
+    return Event.objects.filter(user=user).filter(Q(is_recurring=False) | Q(recurrence_type='none'))
+
+
+def _build(event, start: date, end: date):
+    return [
+        EventOccurrence(
+            event=event,
+            user_id=event.user_id,
+            start_time=instance['start_time'],
+            end_time=instance['end_time'],
+            # Dated like the planner buckets time, not in the server timezone
+            occurrence_date=instance['start_time'].astimezone(BELGRADE_TZ).date(),
+        )
+        for instance in iter_occurrences(event, start, end)
+    ]
+
+
+def refresh_occurrences(event):
+    """Rebuild an event's occurrences around today after it changed."""
+    today = timezone.now().astimezone(BELGRADE_TZ).date()
+    start = today - timedelta(days=PAST_DAYS)
+    end = today + timedelta(days=HORIZON_DAYS)
+    with transaction.atomic():
+        EventOccurrence.objects.filter(event=event).delete()
+        if event.is_recurring and event.recurrence_type != 'none':
+            EventOccurrence.objects.bulk_create(_build(event, start, end))
+            Event.objects.filter(pk=event.pk).update(occurrences_start=start, occurrences_end=end)
+        else:
+            start = end = None
+            Event.objects.filter(pk=event.pk).update(occurrences_start=None, occurrences_end=None)
+    event.occurrences_start = start
+    event.occurrences_end = end
+
+
+def ensure_occurrences(user, start: date, end: date):
+    """Make sure every recurring event of the user is materialized over [start, end]."""
+    stale = recurring_events(user).filter(
+        start_time__date__lte=end
+    ).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=start)
+    ).filter(
+        Q(occurrences_start__isnull=True) | Q(occurrences_end__isnull=True)
+        | Q(occurrences_start__gt=start) | Q(occurrences_end__lt=end)
+    )
+
+    materialized = False
+    for event in stale:
+        reset = event.occurrences_start is None or event.occurrences_end is None
+        if reset:
+            missing = [(start, end)]
+            new_start, new_end = start, end
+        else:
+            missing = []
+            if start < event.occurrences_start:
+                missing.append((start, event.occurrences_start - timedelta(days=1)))
+            if end > event.occurrences_end:
+                missing.append((event.occurrences_end + timedelta(days=1), end))
+            new_start = min(start, event.occurrences_start)
+            new_end = max(end, event.occurrences_end)
+
+        with transaction.atomic():
+            if reset:
+                EventOccurrence.objects.filter(event=event).delete()
+            for missing_start, missing_end in missing:
+                occurrences = _build(event, missing_start, missing_end)
+                if occurrences:
+                    EventOccurrence.objects.bulk_create(occurrences, ignore_conflicts=True)
+                    materialized = True
+            Event.objects.filter(pk=event.pk).update(occurrences_start=new_start, occurrences_end=new_end)
+
+    # Once per call, however many events were extended
+    if materialized:
+        bump_version(user.pk, 'calendar')
+
+
+def occurrences_between(user, start: date, end: date):
+    """Occurrences of the user's recurring events dated within [start, end]."""
+    ensure_occurrences(user, start, end)
+    return EventOccurrence.objects.filter(
+        user=user, occurrence_date__gte=start, occurrence_date__lte=end
+    ).select_related('event')
@@ -0,0 +1,345 @@
+"""In-memory calendar planning engine.
+
+Loads everything the scheduler needs (preferences, open tasks, dependencies,
+time slots and events) up front, builds a sorted free-interval index per day
+and places every task without touching the database. The caller persists the
+resulting ``CalendarPlan``.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import BELGRADE_TZ, DayAvailability, localize
+from .batching import deferred_deletes
+from .caching import bump_version
+from .critical_path import analyse_tasks, critical_path
+from .dependencies import DEFAULT_TASK_MINUTES, OPEN_STATUSES, DependencyGraph
+from .models import Task, TaskClosure, TimeSlot, CalendarTask, UserPreferences, EventOccurrence
+from .occurrences import single_events, occurrences_between
+from .scoring import CALENDAR_WEIGHTS, score_tasks
+from .sync import record_changes
+
+# Use 70% of the daily working hours for tasks
+DAILY_CAPACITY_RATIO = 0.7
+# How many days to look ahead for a slot before giving up on a task
+MAX_DAYS_PER_TASK = 30
+# Rows per INSERT/UPDATE statement when persisting a plan
+PERSIST_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class Placement:
+    """A single task placed on the calendar."""
+    task_id: int
+    calendar_date: date
+    scheduled_start: datetime
+    scheduled_end: datetime
+
+
+@dataclass
+class CalendarPlan:
+    """Result of a planning run, ready to be persisted as CalendarTask rows."""
+    user: object
+    placements: List[Placement] = field(default_factory=list)
+    # Groups of task ids that depend on each other and could not be placed
+    cycles: List[List[int]] = field(default_factory=list)
+
+    def to_calendar_tasks(self) -> List[CalendarTask]:
+        """Return unsaved CalendarTask instances for every placement."""
+        return [
+            CalendarTask(
+                task_id=placement.task_id,
+                scheduled_start=placement.scheduled_start,
+                scheduled_end=placement.scheduled_end,
+                calendar_date=placement.calendar_date,
+                user=self.user,
+            )
+            for placement in self.placements
+        ]
+
+
+class CalendarPlanner:
+    """Place a user's open tasks onto their calendar in memory."""
+
+    def __init__(self, user, now: Optional[datetime] = None, task_ids=None, reserved_minutes: int = 0):
+        """`task_ids` restricts loading to those tasks and their dependency
+        neighbourhood; `reserved_minutes` is calendar time already taken by
+        placements that stay put, so the event horizon reaches past them.
+        """
+        self.user = user
+        self.now = (now or timezone.now()).astimezone(BELGRADE_TZ)
+
+        preferences = UserPreferences.get_or_create_for_user(user)
+        self.work_start = preferences.work_start_time
+        self.work_end = preferences.work_end_time
+        self.daily_capacity_minutes = int(preferences.daily_work_hours * 60 * DAILY_CAPACITY_RATIO)
+
+        tasks = Task.objects.filter(user=user, status__in=OPEN_STATUSES)
+        if task_ids is not None:
+            tasks = tasks.filter(id__in=task_ids)
+        self.tasks = list(tasks.select_related('project').order_by('priority', 'due_at'))
+        # Position in the (priority, due_at) ordering breaks score ties
+        self.positions = {task.id: position for position, task in enumerate(self.tasks)}
+        if task_ids is None:
+            self.graph = DependencyGraph.for_user(user, self.positions)
+            critical = analyse_tasks(self.tasks, self.graph).critical()
+        else:
+            self.graph = DependencyGraph.around(user, self.positions)
+            # The critical path spans the whole graph; reuse the cached analysis
+            critical = {timing['task_id']: 1 for timing in critical_path(user)['tasks'] if timing['critical']}
+        self.scores = score_tasks(
+            self.tasks, CALENDAR_WEIGHTS, now=self.now,
+            dependencies={task.id: len(self.graph.prerequisites(task.id)) for task in self.tasks},
+            critical=critical,
+        )
+
+        self.time_slots = list(TimeSlot.objects.filter(user=user, is_active=True))
+
+        # Far enough ahead to hold every task plus the per-task search window
+        total_minutes = reserved_minutes + sum(task.estimate_minutes or DEFAULT_TASK_MINUTES for task in self.tasks)
+        days_needed = total_minutes // max(self.daily_capacity_minutes, 1) + 1
+        horizon_start = localize(self.now.date(), datetime.min.time())
+        horizon_end = self.now.date() + timedelta(days=days_needed + MAX_DAYS_PER_TASK)
+
+        # Bucket one-off events and recurring occurrences by local date once
+        # instead of querying per day
+        self.events_by_date: Dict[date, List[Tuple[datetime, datetime]]] = {}
+        busy = list(single_events(user).filter(end_time__gt=horizon_start).values_list('start_time', 'end_time'))
+        busy += occurrences_between(
+            user, self.now.date() - timedelta(days=1), horizon_end
+        ).values_list('start_time', 'end_time')
+        for start, end in busy:
+            start = start.astimezone(BELGRADE_TZ)
+            end = end.astimezone(BELGRADE_TZ)
+            day = start.date()
+            while day <= end.date():
+                self.events_by_date.setdefault(day, []).append((start, end))
+                day += timedelta(days=1)
+
+        self.days: Dict[date, DayAvailability] = {}
+
+    def day(self, day: date) -> DayAvailability:
+        """Return the availability index for a day, building it on first use."""
+        index = self.days.get(day)
+        if index is None:
+            index = self.days[day] = DayAvailability.for_day(
+                day, self.work_start, self.work_end, self.events_by_date.get(day, []), self.time_slots
+            )
+        return index
+
+    def next_work_day(self, day: date) -> datetime:
+        return localize(day + timedelta(days=1), self.work_start)
+
+    def normalize(self, moment: datetime) -> datetime:
+        """Clamp a moment into working hours, rolling over to the next day if needed."""
+        moment = moment.astimezone(BELGRADE_TZ)
+        if moment.time() < self.work_start:
+            return localize(moment.date(), self.work_start)
+        if moment.time() >= self.work_end:
+            return self.next_work_day(moment.date())
+        return moment
+
+    def place(self, task: Task, earliest: datetime) -> Placement:
+        """Place a task at the first fitting gap from `earliest`, within daily capacity."""
+        duration = task.estimate_minutes or DEFAULT_TASK_MINUTES
+        cursor = self.normalize(earliest)
+
+        for _ in range(MAX_DAYS_PER_TASK):
+            day = cursor.date()
+            index = self.day(day)
+            if self.daily_capacity_minutes - index.used_minutes >= duration:
+                start = index.first_fit(cursor, duration)
+                if start is not None:
+                    end = start + timedelta(minutes=duration)
+                    index.reserve(start, end, duration)
+                    return Placement(task.id, day, start, end)
+            cursor = self.next_work_day(day)
+
+        # Could not fit it anywhere: put it at the end of the last day tried
+        day = cursor.date()
+        end = localize(day, self.work_end)
+        start = end - timedelta(minutes=duration)
+        self.day(day).reserve(start, end, duration)
+        return Placement(task.id, day, start, end)
+
+    def plan(self, only=None, fixed=()) -> CalendarPlan:
+        """Place open tasks in dependency order, lowest score first.
+
+        `only` limits planning to a set of task ids. `fixed` is an iterable of
+        existing CalendarTask rows that stay where they are; their time is
+        reserved and they count as placed for dependency purposes.
+        """
+        plan = CalendarPlan(user=self.user)
+        ends: Dict[int, datetime] = {}
+        for row in fixed:
+            minutes = int((row.scheduled_end - row.scheduled_start).total_seconds() // 60)
+            self.day(row.calendar_date).reserve(row.scheduled_start, row.scheduled_end, minutes)
+            ends[row.task_id] = row.scheduled_end
+
+        tasks = {task.id: task for task in self.tasks if only is None or task.id in only}
+        ordering = self.graph.topological_order(
+            key=lambda task_id: (self.scores[task_id], self.positions[task_id]),
+            task_ids=tasks,
+        )
+        plan.cycles = ordering.cycles
+        cursor = self.normalize(self.now)
+
+        # Prerequisites always come first; a task whose prerequisite is
+        # outside this run and not on the calendar cannot be placed
+        for task_id in ordering.order:
+            prerequisite_ids = self.graph.prerequisites(task_id)
+            if any(dep_id not in ends for dep_id in prerequisite_ids):
+                continue
+
+            earliest = max((ends[dep_id] for dep_id in prerequisite_ids), default=cursor)
+            placement = self.place(tasks[task_id], earliest)
+            plan.placements.append(placement)
+            ends[task_id] = placement.scheduled_end
+            cursor = self.normalize(placement.scheduled_end)
+
+        return plan
+
+
+def persist_plan(plan: CalendarPlan, task_ids=None) -> Dict[str, int]:
+    """Write a plan by diffing it against the stored CalendarTask rows.
+
+    Only rows that changed are touched: stale rows are deleted, moved rows are
+    updated and new placements are inserted, all in one transaction. When
+    `task_ids` is given only rows for those tasks are considered, so the rest
+    of the calendar is left alone.
+    """
+    existing = CalendarTask.objects.filter(user=plan.user)
+    if task_ids is not None:
+        existing = existing.filter(task_id__in=task_ids)
+
+    rows_by_task: Dict[int, List[CalendarTask]] = {}
+    for row in existing.order_by('calendar_date'):
+        rows_by_task.setdefault(row.task_id, []).append(row)
+
+    now = timezone.now()
+    to_create, to_update, to_delete = [], [], []
+    for placement in plan.placements:
+        rows = rows_by_task.pop(placement.task_id, [])
+        if not rows:
+            to_create.append(placement)
+            continue
+        row, extra_rows = rows[0], rows[1:]
+        to_delete.extend(r.id for r in extra_rows)
+        if (row.calendar_date, row.scheduled_start, row.scheduled_end) != (
+            placement.calendar_date, placement.scheduled_start, placement.scheduled_end
+        ):
+            row.calendar_date = placement.calendar_date
+            row.scheduled_start = placement.scheduled_start
+            row.scheduled_end = placement.scheduled_end
+            # bulk_update() skips auto_now, so bump it by hand
+            row.updated_at = now
+            to_update.append(row)
+    for rows in rows_by_task.values():
+        to_delete.extend(r.id for r in rows)
+
+    with transaction.atomic():
+        if to_delete:
+            # Tombstones for the deleted rows are journaled in one write
+            with deferred_deletes():
+                CalendarTask.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            CalendarTask.objects.bulk_update(
+                to_update, ['calendar_date', 'scheduled_start', 'scheduled_end', 'updated_at'],
+                batch_size=PERSIST_BATCH_SIZE,
+            )
+        if to_create:
+            created = CalendarTask.objects.bulk_create(
+                CalendarPlan(plan.user, to_create).to_calendar_tasks(),
+                batch_size=PERSIST_BATCH_SIZE,
+            )
+        else:
+            created = []
+        # Bulk writes send no signals, so journal them for delta sync here
+        record_changes(plan.user.pk, CalendarTask, [row.id for row in to_update + created])
+
+    if to_create or to_update or to_delete:
+        bump_version(plan.user.pk, 'calendar')
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(to_delete)}
+
+
+def build_calendar_plan(user, now: Optional[datetime] = None) -> CalendarPlan:
+    """Plan all open tasks for a user without writing to the database."""
+    return CalendarPlanner(user, now=now).plan()
+
+
+def event_dates(start: datetime, end: datetime) -> List[date]:
+    """Local dates covered by the interval [start, end]."""
+    day = start.astimezone(BELGRADE_TZ).date()
+    last = end.astimezone(BELGRADE_TZ).date()
+    dates = []
+    while day <= last:
+        dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def reschedule(user, task_ids=(), dates=(), weekdays=()) -> Optional[Dict[str, int]]:
+    """Repair the calendar after a single change instead of regenerating it.
+
+    Replans the given tasks, every task placed on one of the affected days
+    (`dates` or any date falling on one of `weekdays`) and everything that
+    depends on them downstream, read from the closure index. Only those tasks
+    and their prerequisites are loaded; all other placements are kept as-is
+    and only reserve their time. Does nothing for users who have never
+    generated a calendar.
+    """
+    existing = list(CalendarTask.objects.filter(user=user))
+    if not existing:
+        return None
+
+    today = timezone.now().astimezone(BELGRADE_TZ).date()
+    dates = set(dates)
+    weekdays = set(weekdays)
+
+    affected = set(task_ids)
+    for row in existing:
+        if row.calendar_date < today:
+            continue
+        if row.calendar_date in dates or row.calendar_date.weekday() in weekdays:
+            affected.add(row.task_id)
+    if not affected:
+        return {'created': 0, 'updated': 0, 'deleted': 0}
+    affected |= set(
+        TaskClosure.objects.filter(ancestor_id__in=affected).values_list('descendant_id', flat=True)
+    )
+
+    fixed = [row for row in existing if row.task_id not in affected]
+    reserved = sum(int((row.scheduled_end - row.scheduled_start).total_seconds() // 60) for row in fixed)
+    planner = CalendarPlanner(user, task_ids=affected, reserved_minutes=reserved)
+    plan = planner.plan(only=affected, fixed=fixed)
+    return persist_plan(plan, task_ids=affected)
+
+
+def events_affected_dates(events) -> List[date]:
+    """Upcoming local dates on which the given events block time.
+
+    Recurring events are read from their materialized occurrences, so call
+    this before deleting them.
+    """
+    today = timezone.now().astimezone(BELGRADE_TZ).date()
+    dates = []
+    recurring_ids = []
+    for event in events:
+        if event.is_recurring and event.recurrence_type != 'none':
+            recurring_ids.append(event.id)
+        else:
+            dates.extend(event_dates(event.start_time, event.end_time))
+    if recurring_ids:
+        for start, end in EventOccurrence.objects.filter(
+            event_id__in=recurring_ids, occurrence_date__gte=today - timedelta(days=1)
+        ).values_list('start_time', 'end_time'):
+            dates.extend(event_dates(start, end))
+    return [day for day in dates if day >= today]
+
+
+def reschedule_events(user, events) -> Optional[Dict[str, int]]:
+    """Repair the calendar for the days touched by the given events."""
+    return reschedule(user, dates=events_affected_dates(events))
@@ -0,0 +1,81 @@
+"""Set-based project reordering.
+
+Project priority is both the sidebar order and a scoring term, so values stay
+small integers. A full reorder writes every changed priority with one
+``bulk_update``. Moving a single project takes the first free value after
+its new predecessor; only when the next project is in the way are it and
+everything after it shifted, with one UPDATE.
+
+Neither path sends signals, so both journal the rows for delta sync and
+bump the projects cache version themselves, in the same transaction as the
+priority writes.
+"""
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+
+from .caching import bump_version
+from .models import Project
+from .sync import record_changes
+
+
+def _changed(user, project_ids):
+    record_changes(user.pk, Project, project_ids)
+    bump_version(user.pk, 'projects')
+
+
+def reorder_projects(user, priorities: Dict[int, int]) -> int:
+    """Apply {project id: priority} for the user's projects; returns rows written.
+
+    Raises Project.DoesNotExist if an id is not one of the user's projects.
+    """
+    projects = Project.objects.filter(user=user).in_bulk(list(priorities))
+    if len(projects) != len(priorities):
+        raise Project.DoesNotExist
+    changed = []
+    for project_id, priority in priorities.items():
+        project = projects[project_id]
+        if project.priority != priority:
+            project.priority = priority
+            changed.append(project)
+    if changed:
+        with transaction.atomic():
+            Project.objects.bulk_update(changed, ['priority'])
+            _changed(user, [project.id for project in changed])
+    return len(changed)
+
+
+def move_project(user, project_id: int, after_id: Optional[int] = None) -> dict:
+    """Place a project right after `after_id`, or first when it is None.
+
+    Returns the new priority and the ids of the projects that had to move
+    out of the way.
+    """
+    with transaction.atomic():
+        order: List[tuple] = list(
+            Project.objects.select_for_update().filter(user=user)
+            .order_by('priority', 'name', 'id').values_list('id', 'priority')
+        )
+        ids = [pk for pk, _ in order]
+        if project_id not in ids or (after_id is not None and after_id not in ids):
+            raise Project.DoesNotExist
+        if after_id == project_id:
+            return {'priority': dict(order)[project_id], 'shifted': []}
+
+        others = [(pk, priority) for pk, priority in order if pk != project_id]
+        position = 0 if after_id is None else [pk for pk, _ in others].index(after_id) + 1
+        before, after = others[:position], others[position:]
+        if before:
+            priority = before[-1][1] + 1
+        else:
+            priority = max(after[0][1] - 1, 0) if after else 0
+
+        # Shift the rest only when the next project does not leave room
+        shift = max(0, priority + 1 - after[0][1]) if after else 0
+        shifted = [pk for pk, _ in after] if shift else []
+        if shifted:
+            Project.objects.filter(pk__in=shifted).update(priority=F('priority') + shift)
+        Project.objects.filter(pk=project_id).update(priority=priority)
+        _changed(user, [project_id] + shifted)
+    return {'priority': priority, 'shifted': shifted}
@@ -0,0 +1,473 @@
+"""Recurrence expansion for calendar events.
+
+Every rule jumps straight to the first candidate inside the requested window
+with date arithmetic instead of walking the series day by day, so expanding
+one week costs the same for a series that started yesterday or years ago.
+Occurrences are numbered from the start of the series, which is what
+`max_occurrences` (or COUNT) limits.
+
+Both the legacy recurrence fields and RFC 5545 RRULE strings (for
+``recurrence_type='custom'``) compile into the same immutable
+``RecurrenceRule``. Compiled rules are kept in a per-process LRU cache keyed
+by event id and ``updated_at``.
+"""
+import calendar
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import FrozenSet, Iterator, List, Optional, Tuple
+
+from .availability import BELGRADE_TZ, localize
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+LEGACY_FREQUENCIES = {
+    'daily': 'DAILY',
+    'weekly': 'WEEKLY',
+    'monthly': 'MONTHLY',
+    'yearly': 'YEARLY',
+}
+RULE_CACHE_SIZE = 1024
+
+_BYDAY_RE = re.compile(r'^([+-]?\d{1,2})?(MO|TU|WE|TH|FR|SA|SU)$')
+_PROPERTY_RE = re.compile(r'^(RRULE|EXDATE|DTSTART)[;:]', re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class RecurrenceRule:
+    """Compiled, hashable recurrence rule (date granularity)."""
+    freq: str
+    interval: int = 1
+    count: Optional[int] = None
+    until: Optional[date] = None
+    # (ordinal, weekday) pairs, ordinal 0 means every such weekday
+    byday: Tuple[Tuple[int, int], ...] = ()
+    bymonthday: Tuple[int, ...] = ()
+    bymonth: Tuple[int, ...] = ()
+    bysetpos: Tuple[int, ...] = ()
+    exdates: FrozenSet[date] = frozenset()
+
+    @property
+    def is_simple(self) -> bool:
+        """True when the closed-form generators below can expand the rule."""
+        if self.bymonthday or self.bymonth or self.bysetpos:
+            return False
+        if any(ordinal for ordinal, _ in self.byday):
+            return False
+        return not self.byday or self.freq == 'WEEKLY'
+
+
+def _parse_date(value: str) -> date:
+    value = value.strip()
+    if 'T' in value:
+        moment = datetime.strptime(value.rstrip('Z')[:15], '%Y%m%dT%H%M%S')
+        if value.endswith('Z'):
+            moment = moment.replace(tzinfo=dt_timezone.utc).astimezone(BELGRADE_TZ)
+        return moment.date()
+    return datetime.strptime(value[:8], '%Y%m%d').date()
+
+
+def _parse_int_list(value: str, low: int, high: int, name: str) -> Tuple[int, ...]:
+    numbers = []
+    for part in value.split(','):
+        number = int(part)
+        if number == 0 or not low <= abs(number) <= high:
+            raise ValueError(f'{name} value out of range: {part}')
+        numbers.append(number)
+    return tuple(numbers)
+
+
+def parse_rrule(text: str) -> RecurrenceRule:
+    """Parse an RFC 5545 recurrence definition.
+
+    Accepts a bare ``FREQ=...;...`` rule or content lines such as
+    ``RRULE:...`` and ``EXDATE:...``. Supports FREQ (DAILY to YEARLY),
+    INTERVAL, COUNT, UNTIL, BYDAY, BYMONTHDAY, BYMONTH, BYSETPOS and EXDATE.
+    Raises ValueError for anything else, including DTSTART: the series
+    always starts at the event's own start time.
+    """
+    parts = {}
+    exdates = set()
+    for line in re.split(r'[\r\n]+', text.strip()):
+        line = line.strip()
+        if not line:
+            continue
+        match = _PROPERTY_RE.match(line)
+        if match:
+            name, value = match.group(1).upper(), line.split(':', 1)[-1]
+        elif '=' in line:
+            name, value = 'RRULE', line
+        else:
+            raise ValueError(f'Unsupported recurrence line: {line}')
+        if name == 'DTSTART':
+            raise ValueError("DTSTART is not supported; the series starts at the event's start time")
+        if name == 'EXDATE':
+            exdates.update(_parse_date(item) for item in value.split(',') if item.strip())
+        elif name == 'RRULE':
+            for item in value.split(';'):
+                if not item.strip():
+                    continue
+                key, _, item_value = item.partition('=')
+                parts[key.strip().upper()] = item_value.strip().upper()
+
+    freq = parts.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f'Unsupported FREQ: {freq}')
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        raise ValueError('COUNT and UNTIL cannot both be set')
+
+    byday = []
+    for item in filter(None, parts.pop('BYDAY', '').split(',')):
+        match = _BYDAY_RE.match(item)
+        if not match:
+            raise ValueError(f'Invalid BYDAY value: {item}')
+        ordinal = int(match.group(1) or 0)
+        if ordinal and freq not in ('MONTHLY', 'YEARLY'):
+            raise ValueError('BYDAY ordinals are only valid for MONTHLY and YEARLY rules')
+        byday.append((ordinal, WEEKDAY_CODES.index(match.group(2))))
+
+    interval = int(parts.pop('INTERVAL', 1))
+    if interval < 1:
+        raise ValueError('INTERVAL must be positive')
+    count = parts.pop('COUNT', None)
+    if count is not None and (not count.isdigit() or int(count) < 1):
+        raise ValueError('COUNT must be a positive number')
+    until = parts.pop('UNTIL', None)
+    bymonthday = parts.pop('BYMONTHDAY', None)
+    bymonth = parts.pop('BYMONTH', None)
+    bysetpos = parts.pop('BYSETPOS', None)
+    parts.pop('WKST', None)
+    if parts:
+        raise ValueError(f'Unsupported rule parts: {", ".join(sorted(parts))}')
+
+    return RecurrenceRule(
+        freq=freq,
+        interval=interval,
+        count=int(count) if count else None,
+        until=_parse_date(until) if until else None,
+        byday=tuple(byday),
+        bymonthday=_parse_int_list(bymonthday, 1, 31, 'BYMONTHDAY') if bymonthday else (),
+        bymonth=tuple(abs(m) for m in _parse_int_list(bymonth, 1, 12, 'BYMONTH')) if bymonth else (),
+        bysetpos=_parse_int_list(bysetpos, 1, 366, 'BYSETPOS') if bysetpos else (),
+        exdates=frozenset(exdates),
+    )
+
+
+def compile_rule(event) -> Optional[RecurrenceRule]:
+    """Build the rule for an event from its recurrence fields, or None if it doesn't repeat."""
+    if not event.is_recurring or event.recurrence_type == 'none':
+        return None
+
+    if event.recurrence_type == 'custom':
+        if not event.recurrence_pattern:
+            return None
+        rule = parse_rrule(event.recurrence_pattern)
+    elif event.recurrence_type in LEGACY_FREQUENCIES:
+        freq = LEGACY_FREQUENCIES[event.recurrence_type]
+        byday = ()
+        if freq == 'WEEKLY':
+            byday = tuple((0, weekday) for weekday in sorted({int(day) for day in event.weekdays or []}))
+        rule = RecurrenceRule(freq=freq, interval=max(1, event.recurrence_interval or 1), byday=byday)
+    else:
+        return None
+
+    # The event's own limits apply on top of the rule's
+    count = rule.count or event.max_occurrences or None
+    until = rule.until
+    if event.end_date:
+        until = min(until, event.end_date) if until else event.end_date
+    return replace(rule, count=count, until=until)
+
+
+class _RuleCache:
+    """Thread-safe LRU of compiled rules keyed by (event id, updated_at)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.rules = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, event) -> Optional[RecurrenceRule]:
+        if event.pk is None or getattr(event, 'updated_at', None) is None:
+            return compile_rule(event)
+        key = (event.pk, event.updated_at)
+        with self.lock:
+            if key in self.rules:
+                self.rules.move_to_end(key)
+                return self.rules[key]
+        rule = compile_rule(event)
+        with self.lock:
+            self.rules[key] = rule
+            self.rules.move_to_end(key)
+            while len(self.rules) > self.maxsize:
+                self.rules.popitem(last=False)
+        return rule
+
+    def clear(self):
+        with self.lock:
+            self.rules.clear()
+
+
+rule_cache = _RuleCache(RULE_CACHE_SIZE)
+
+
+def event_rule(event) -> Optional[RecurrenceRule]:
+    """Compiled rule for an event, served from the per-process cache.
+
+    Invalid custom rules expand to nothing rather than breaking the calendar.
+    """
+    try:
+        return rule_cache.get(event)
+    except ValueError:
+        return None
+
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def _daily(start: date, interval: int, window_start: date, last: date) -> Iterator[Tuple[int, date]]:
+    index = max(0, _ceil_div((window_start - start).days, interval))
+    day = start + timedelta(days=index * interval)
+    while day <= last:
+        yield index, day
+        index += 1
+        day += timedelta(days=interval)
+
+
+def _weekly(start: date, interval: int, weekdays, window_start: date, last: date) -> Iterator[Tuple[int, date]]:
+    weekdays = sorted({int(weekday) for weekday in weekdays}) or [start.weekday()]
+    first_week = start - timedelta(days=start.weekday())
+    first_week_count = sum(1 for weekday in weekdays if weekday >= start.weekday())
+
+    # First active week (every `interval` weeks) that ends on or after the window start
+    week = max(0, _ceil_div((window_start - first_week).days - 6, 7 * interval))
+    while True:
+        week_start = first_week + timedelta(weeks=week * interval)
+        if week_start > last:
+            return
+        index = 0 if week == 0 else first_week_count + (week - 1) * len(weekdays)
+        for weekday in weekdays:
+            day = week_start + timedelta(days=weekday)
+            if day < start:
+                continue
+            if day > last:
+                return
+            yield index, day
+            index += 1
+        week += 1
+
+
+def _has_day(year: int, month: int, day: int) -> bool:
+    return day <= calendar.monthrange(year, month)[1]
+
+
+def _add_months(start: date, months: int) -> Tuple[int, int]:
+    total = start.year * 12 + start.month - 1 + months
+    return total // 12, total % 12 + 1
+
+
+def _monthly(start: date, interval: int, window_start: date, last: date) -> Iterator[Tuple[int, date]]:
+    """Every `interval` months on the start day; months without that day are skipped."""
+    months_to_window = (window_start.year - start.year) * 12 + window_start.month - start.month
+    step = max(0, _ceil_div(months_to_window, interval))
+
+    # Days 29-31 don't exist in every month, so count the skipped ones
+    if start.day <= 28:
+        index = step
+    else:
+        index = sum(1 for s in range(step) if _has_day(*_add_months(start, s * interval), start.day))
+
+    while True:
+        year, month = _add_months(start, step * interval)
+        if date(year, month, 1) > last:
+            return
+        if _has_day(year, month, start.day):
+            day = date(year, month, start.day)
+            if day > last:
+                return
+            yield index, day
+            index += 1
+        step += 1
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _nth_weekdays(first: date, last: date, byday) -> List[date]:
+    """Dates in [first, last] matching BYDAY entries, honouring ordinals."""
+    days = []
+    for ordinal, weekday in byday:
+        offset = (weekday - first.weekday()) % 7
+        matches = []
+        day = first + timedelta(days=offset)
+        while day <= last:
+            matches.append(day)
+            day += timedelta(days=7)
+        if ordinal == 0:
+            days.extend(matches)
+        elif abs(ordinal) <= len(matches):
+            days.append(matches[ordinal - 1 if ordinal > 0 else ordinal])
+    return days
+
+
+def _month_days(year: int, month: int, rule: RecurrenceRule, start: date) -> List[date]:
+    """Candidates for one month of a MONTHLY (or BYMONTH-expanded YEARLY) rule."""
+    length = calendar.monthrange(year, month)[1]
+    first, last = date(year, month, 1), date(year, month, length)
+    if rule.bymonthday:
+        days = [
+            date(year, month, monthday if monthday > 0 else length + monthday + 1)
+            for monthday in rule.bymonthday if abs(monthday) <= length
+        ]
+        if rule.byday:
+            weekdays = {weekday for _, weekday in rule.byday}
+            days = [day for day in days if day.weekday() in weekdays]
+        return days
+    if rule.byday:
+        return _nth_weekdays(first, last, rule.byday)
+    return [date(year, month, start.day)] if start.day <= length else []
+
+
+def _period_candidates(rule: RecurrenceRule, start: date, period: int) -> List[date]:
+    """Sorted candidate dates for the period `period` (in units of FREQ from the start)."""
+    if rule.freq == 'DAILY':
+        day = start + timedelta(days=period)
+        days = [day]
+        if rule.bymonthday:
+            length = calendar.monthrange(day.year, day.month)[1]
+            wanted = {monthday if monthday > 0 else length + monthday + 1 for monthday in rule.bymonthday}
+            days = [d for d in days if d.day in wanted]
+        if rule.byday:
+            days = [d for d in days if d.weekday() in {weekday for _, weekday in rule.byday}]
+    elif rule.freq == 'WEEKLY':
+        week = _week_start(start) + timedelta(weeks=period)
+        weekdays = sorted({weekday for _, weekday in rule.byday}) or [start.weekday()]
+        days = [week + timedelta(days=weekday) for weekday in weekdays]
+    elif rule.freq == 'MONTHLY':
+        year, month = _add_months(start, period)
+        days = _month_days(year, month, rule, start)
+    else:
+        year = start.year + period
+        if rule.bymonth:
+            days = [day for month in rule.bymonth for day in _month_days(year, month, rule, start)]
+        elif rule.bymonthday:
+            days = [day for month in range(1, 13) for day in _month_days(year, month, rule, start)]
+        elif rule.byday:
+            days = _nth_weekdays(date(year, 1, 1), date(year, 12, 31), rule.byday)
+        else:
+            days = [date(year, start.month, start.day)] if _has_day(year, start.month, start.day) else []
+
+    if rule.bymonth and rule.freq != 'YEARLY':
+        days = [day for day in days if day.month in rule.bymonth]
+    days = sorted(set(days))
+    if rule.bysetpos:
+        days = sorted({
+            days[position - 1 if position > 0 else position]
+            for position in rule.bysetpos if abs(position) <= len(days)
+        })
+    return days
+
+
+def _period_of(rule: RecurrenceRule, start: date, day: date) -> int:
+    """Number of FREQ periods between the start's period and the one containing `day`."""
+    if rule.freq == 'DAILY':
+        return (day - start).days
+    if rule.freq == 'WEEKLY':
+        return (_week_start(day) - _week_start(start)).days // 7
+    if rule.freq == 'MONTHLY':
+        return (day.year - start.year) * 12 + day.month - start.month
+    return day.year - start.year
+
+
+def _period_start(rule: RecurrenceRule, start: date, period: int) -> date:
+    if rule.freq == 'DAILY':
+        return start + timedelta(days=period)
+    if rule.freq == 'WEEKLY':
+        return _week_start(start) + timedelta(weeks=period)
+    if rule.freq == 'MONTHLY':
+        return date(*_add_months(start, period), 1)
+    return date(start.year + period, 1, 1)
+
+
+def _general(rule: RecurrenceRule, start: date, window_start: date, last: date) -> Iterator[Tuple[int, date]]:
+    """Expand any supported rule period by period.
+
+    Without COUNT the first period overlapping the window is computed
+    directly. With COUNT every period from the start has to be counted, but
+    the series stops after COUNT occurrences, which bounds the work.
+    """
+    if rule.count:
+        step = 0
+    else:
+        step = max(0, _ceil_div(_period_of(rule, start, window_start), rule.interval))
+    index = 0
+    while True:
+        period = step * rule.interval
+        if _period_start(rule, start, period) > last:
+            return
+        for day in _period_candidates(rule, start, period):
+            if day < start:
+                continue
+            if day > last:
+                return
+            yield index, day
+            index += 1
+        step += 1
+
+
+def expand(rule: RecurrenceRule, start: date, window_start: date, window_end: date) -> Iterator[date]:
+    """Yield the dates of a rule starting on `start` within [window_start, window_end]."""
+    last = min(window_end, rule.until) if rule.until else window_end
+    window_start = max(window_start, start)
+    if window_start > last:
+        return
+
+    if not rule.is_simple:
+        candidates = _general(rule, start, window_start, last)
+    elif rule.freq == 'DAILY':
+        candidates = _daily(start, rule.interval, window_start, last)
+    elif rule.freq == 'WEEKLY':
+        candidates = _weekly(start, rule.interval, [weekday for _, weekday in rule.byday], window_start, last)
+    elif rule.freq == 'MONTHLY':
+        candidates = _monthly(start, rule.interval, window_start, last)
+    else:
+        candidates = _monthly(start, rule.interval * 12, window_start, last)
+
+    for index, day in candidates:
+        if rule.count and index >= rule.count:
+            return
+        if day >= window_start and day not in rule.exdates:
+            yield day
+
+
+def occurrence_dates(event, window_start: date, window_end: date) -> Iterator[date]:
+    """Yield the dates of an event's occurrences within [window_start, window_end]."""
+    rule = event_rule(event)
+    if rule is None:
+        return iter(())
+    start = event.start_time.astimezone(BELGRADE_TZ).date()
+    return expand(rule, start, window_start, window_end)
+
+
+def iter_occurrences(event, window_start: date, window_end: date) -> Iterator[dict]:
+    """Yield calendar entries for an event's occurrences within the window.
+
+    Dates and wall-clock times are those of the planner timezone, so an
+    occurrence keeps its local time across DST changes.
+    """
+    start_time = event.start_time.astimezone(BELGRADE_TZ).time()
+    duration = event.end_time - event.start_time
+    for day in occurrence_dates(event, window_start, window_end):
+        occurrence_start = localize(day, start_time)
+        yield {
+            'title': event.title,
+            'description': event.description,
+            'start_time': occurrence_start,
+            'end_time': occurrence_start + duration,
+            'is_recurring_instance': True,
+            'original_event': event,
+        }
@@ -1,25 +1,107 @@
-from datetime import timedelta
+"""Set-based due date shifting.
+
+The tasks in a scope are selected once, then their due dates and their
+calendar placements are each moved with a single UPDATE ... SET column =
+column + interval, inside one transaction. A dry run only counts what would
+move.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
-from .models import Task
 
+from .availability import BELGRADE_TZ
+from .caching import bump_version
+from .dependencies import OPEN_STATUSES
+from .models import CalendarTask, Task
+from .sync import record_changes
+
+SCOPES = ('today', 'all', 'range', 'project', 'tag', 'dependents', 'task')
+
+
+@dataclass
+class ShiftResult:
+    tasks: int = 0
+    placements: int = 0
+    dry_run: bool = False
+
+
+def shift_queryset(user, scope: str = 'today', start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, project_id: Optional[int] = None,
+                   tag: Optional[str] = None, task_id: Optional[int] = None):
+    """The user's tasks with a due date that a shift in `scope` moves.
 
-def shift_due_dates(minutes: int, scope: str = 'today') -> int:
-    """Shift due_at for tasks by N minutes.
-    scope: 'today' -> only tasks due today; 'all' -> all future tasks.
-    Returns number of tasks updated.
+    'today' and 'all' keep their old meaning (due today, due from now on);
+    'dependents' is every open task that waits on `task_id`, directly or not;
+    'task' is that one task whatever its status. Raises ValueError for an
+    unknown scope or when the parameter the scope needs is missing.
     """
+    if scope not in SCOPES:
+        raise ValueError(f'Unknown scope: {scope}')
+    if scope == 'range' and (start is None or end is None):
+        raise ValueError('A range needs a start and an end')
+    if scope == 'project' and project_id in (None, ''):
+        raise ValueError('The project scope needs a project_id')
+    if scope == 'tag' and not tag:
+        raise ValueError('The tag scope needs a tag')
+    if scope in ('dependents', 'task') and task_id is None:
+        raise ValueError(f'The {scope} scope needs a task_id')
+    qs = Task.objects.filter(user=user, due_at__isnull=False)
+    if scope == 'task':
+        return qs.filter(pk=task_id)
+    qs = qs.filter(status__in=OPEN_STATUSES)
+    if scope == 'today':
+        qs = qs.filter(due_at__date=timezone.localdate())
+    elif scope == 'all':
+        qs = qs.filter(due_at__gte=timezone.now())
+    elif scope == 'range':
+        qs = qs.filter(due_at__gte=start, due_at__lt=end)
+    elif scope == 'project':
+        qs = qs.filter(project_id=project_id)
+    elif scope == 'tag':
+        qs = qs.filter(tags__name=tag)
+    elif scope == 'dependents':
+        qs = qs.filter(ancestor_links__ancestor_id=task_id).exclude(pk=task_id)
+    return qs
+
+
+def shift_due_dates(user, minutes: int, scope: str = 'today', dry_run: bool = False,
+                    **filters) -> ShiftResult:
+    """Shift due_at of the tasks in `scope` and their calendar placements by N minutes."""
+    task_ids = list(shift_queryset(user, scope, **filters).values_list('pk', flat=True).distinct())
+    placements = CalendarTask.objects.filter(user=user, task_id__in=task_ids)
+    if dry_run:
+        return ShiftResult(len(task_ids), placements.count(), dry_run=True)
     if minutes == 0:
-        return 0
+        return ShiftResult()
+
+    delta = timedelta(minutes=minutes)
     now = timezone.now()
-    qs = Task.objects.filter(due_at__isnull=False, status__in=[Task.Status.TODO, Task.Status.IN_PROGRESS])
-    if scope == 'today':
-        today = timezone.localdate()
-        qs = qs.filter(due_at__date=today)
-    else:
-        qs = qs.filter(due_at__gte=now)
-    count = 0
-    for task in qs.iterator():
-        task.due_at = task.due_at + timedelta(minutes=minutes)
-        task.save(update_fields=['due_at', 'updated_at'])
-        count += 1
-    return count 
\ No newline at end of file
+    with transaction.atomic():
+        moved = placements.update(
+            scheduled_start=F('scheduled_start') + delta,
+            scheduled_end=F('scheduled_end') + delta,
+            updated_at=now,
+        )
+        # A placement that crosses midnight moves to another calendar day
+        rows = list(placements.only('id', 'scheduled_start', 'calendar_date'))
+        crossed = []
+        for row in rows:
+            day = row.scheduled_start.astimezone(BELGRADE_TZ).date()
+            if day != row.calendar_date:
+                row.calendar_date = day
+                crossed.append(row)
+        CalendarTask.objects.bulk_update(crossed, ['calendar_date'])
+        Task.objects.filter(pk__in=task_ids).update(due_at=F('due_at') + delta, updated_at=now)
+        # UPDATE sends no signals
+        record_changes(user.pk, Task, task_ids)
+        record_changes(user.pk, CalendarTask, [row.id for row in rows])
+
+    if task_ids:
+        bump_version(user.pk, 'tasks')
+    if moved:
+        bump_version(user.pk, 'calendar')
+    return ShiftResult(len(task_ids), moved)
@@ -0,0 +1,161 @@
+"""Task scoring shared by the dashboard, the calendar planner and the optimal order.
+
+Scores are "lower = do it sooner". Each caller picks a ``ScoreWeights``
+preset; a batch of tasks is scored at once from columnar arrays, with NumPy
+when it is installed and plain Python otherwise. The dashboard evaluates the
+same formula in SQL through ``score_expression``.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from django.db.models import Case, ExpressionWrapper, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+
+@dataclass(frozen=True)
+class ScoreWeights:
+    """Integer weights for every scoring term."""
+    priority: int = 10
+    project_priority: int = 100
+    # Added instead of the project term for tasks without a project
+    no_project: int = 1000
+    # Duration factor: one point per `duration_step` minutes, at most `duration_cap`
+    duration_step: int = 30
+    duration_cap: int = 10
+    no_estimate: int = 5
+    # Added when the task is overdue, due within a day, or due within three days
+    overdue: int = 0
+    due_soon: int = 0
+    due_this_week: int = 0
+    # Per task this one blocks, and per task this one depends on
+    blocking: int = 0
+    dependency: int = 0
+    # Added for tasks on the critical path of their dependency chain
+    critical: int = 0
+
+
+# Dashboard "not scheduled" ordering
+DASHBOARD_WEIGHTS = ScoreWeights()
+# Calendar planner: tasks with more prerequisites and critical tasks get a small boost
+CALENDAR_WEIGHTS = ScoreWeights(dependency=-2, critical=-5)
+# Optimal task order: urgency and blocking matter, projects and duration do not
+OPTIMAL_ORDER_WEIGHTS = ScoreWeights(
+    priority=1, project_priority=0, no_project=0, duration_cap=0, no_estimate=0,
+    overdue=-10, due_soon=-5, due_this_week=-2, blocking=-2, dependency=2, critical=-2,
+)
+
+
+def score_expression(weights: ScoreWeights = DASHBOARD_WEIGHTS):
+    """Priority, project and duration terms of the score as a SQL expression."""
+    return ExpressionWrapper(
+        F('priority') * weights.priority
+        + Coalesce(F('project__priority') * weights.project_priority, Value(weights.no_project))
+        + Case(
+            When(Q(estimate_minutes__isnull=True) | Q(estimate_minutes=0), then=Value(weights.no_estimate)),
+            default=Least(F('estimate_minutes') / weights.duration_step, Value(weights.duration_cap)),
+        ),
+        output_field=IntegerField(),
+    )
+
+
+def task_columns(tasks: Sequence, now: Optional[datetime] = None,
+                 blocking: Optional[Dict[int, int]] = None,
+                 dependencies: Optional[Dict[int, int]] = None,
+                 critical: Optional[Dict[int, int]] = None) -> Dict[str, list]:
+    """Pull the scoring inputs out of a list of tasks, one list per column.
+
+    Projects are read from ``task.project``, so load tasks with
+    ``select_related('project')``.
+    """
+    now = now or timezone.now()
+    blocking = blocking or {}
+    dependencies = dependencies or {}
+    critical = critical or {}
+    return {
+        'priority': [task.priority for task in tasks],
+        'project_priority': [task.project.priority if task.project else None for task in tasks],
+        'estimate': [task.estimate_minutes for task in tasks],
+        'due_days': [(task.due_at - now).days if task.due_at else None for task in tasks],
+        'blocking': [blocking.get(task.id, 0) for task in tasks],
+        'dependencies': [dependencies.get(task.id, 0) for task in tasks],
+        'critical': [critical.get(task.id, 0) for task in tasks],
+    }
+
+
+def _score_python(columns: Dict[str, list], weights: ScoreWeights) -> List[int]:
+    scores = []
+    for priority, project_priority, estimate, due_days, blocking, dependencies, critical in zip(
+        columns['priority'], columns['project_priority'], columns['estimate'],
+        columns['due_days'], columns['blocking'], columns['dependencies'], columns['critical'],
+    ):
+        score = priority * weights.priority
+        if project_priority is None:
+            score += weights.no_project
+        else:
+            score += project_priority * weights.project_priority
+        if estimate:
+            score += min(estimate // weights.duration_step, weights.duration_cap)
+        else:
+            score += weights.no_estimate
+        if due_days is not None:
+            if due_days < 0:
+                score += weights.overdue
+            elif due_days <= 1:
+                score += weights.due_soon
+            elif due_days <= 3:
+                score += weights.due_this_week
+        score += blocking * weights.blocking + dependencies * weights.dependency
+        score += critical * weights.critical
+        scores.append(score)
+    return scores
+
+
+def _score_numpy(columns: Dict[str, list], weights: ScoreWeights) -> List[int]:
+    def column(name):
+        values = columns[name]
+        present = np.array([value is not None for value in values], dtype=bool)
+        filled = np.array([value or 0 for value in values], dtype=np.int64)
+        return filled, present
+
+    project_priority, has_project = column('project_priority')
+    estimate, _ = column('estimate')
+    due_days, has_due = column('due_days')
+
+    scores = np.asarray(columns['priority'], dtype=np.int64) * weights.priority
+    scores += np.where(has_project, project_priority * weights.project_priority, weights.no_project)
+    scores += np.where(
+        estimate != 0, np.minimum(estimate // weights.duration_step, weights.duration_cap), weights.no_estimate
+    )
+    scores += np.select(
+        [has_due & (due_days < 0), has_due & (due_days <= 1), has_due & (due_days <= 3)],
+        [weights.overdue, weights.due_soon, weights.due_this_week],
+        0,
+    )
+    scores += np.asarray(columns['blocking'], dtype=np.int64) * weights.blocking
+    scores += np.asarray(columns['dependencies'], dtype=np.int64) * weights.dependency
+    scores += np.asarray(columns['critical'], dtype=np.int64) * weights.critical
+    return scores.tolist()
+
+
+def score_columns(columns: Dict[str, list], weights: ScoreWeights) -> List[int]:
+    """Score every row of `columns` in one batch."""
+    if np is not None and columns['priority']:
+        return _score_numpy(columns, weights)
+    return _score_python(columns, weights)
+
+
+def score_tasks(tasks: Iterable, weights: ScoreWeights, now: Optional[datetime] = None,
+                blocking: Optional[Dict[int, int]] = None,
+                dependencies: Optional[Dict[int, int]] = None,
+                critical: Optional[Dict[int, int]] = None) -> Dict[int, int]:
+    """Return {task id: score} for a batch of tasks, ready to use as sort keys."""
+    tasks = list(tasks)
+    scores = score_columns(task_columns(tasks, now, blocking, dependencies, critical), weights)
+    return {task.id: score for task, score in zip(tasks, scores)}
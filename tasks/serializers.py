@@ -1,5 +1,8 @@
 from rest_framework import serializers
+from .bulk import BulkListSerializer
+from .closure import would_create_cycle
 from .models import Project, Tag, Task, FocusSession, TaskRelationship, Event, TimeSlot, CalendarTask
+from .recurrence import parse_rrule
 
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -24,6 +27,7 @@ class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
 
 
 class FocusSessionSerializer(serializers.ModelSerializer):
@@ -36,12 +40,38 @@ class TaskRelationshipSerializer(serializers.ModelSerializer):
     class Meta:
         model = TaskRelationship
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
+    
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # Partial updates keep the fields they don't send
+        from_task = attrs.get('from_task', getattr(self.instance, 'from_task', None))
+        to_task = attrs.get('to_task', getattr(self.instance, 'to_task', None))
+        relationship_type = attrs.get('relationship_type', getattr(self.instance, 'relationship_type', None))
+        if would_create_cycle(
+            from_task.id, to_task.id, relationship_type,
+            replacing_id=self.instance.pk if self.instance is not None else None,
+        ):
+            raise serializers.ValidationError('This relationship would create a dependency cycle.')
+        return attrs
 
 # New calendar serializers
 class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
         fields = '__all__'
+        list_serializer_class = BulkListSerializer
+    
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        recurrence_type = attrs.get('recurrence_type', getattr(self.instance, 'recurrence_type', None))
+        pattern = attrs.get('recurrence_pattern', getattr(self.instance, 'recurrence_pattern', ''))
+        if recurrence_type == 'custom' and pattern:
+            try:
+                parse_rrule(pattern)
+            except ValueError as e:
+                raise serializers.ValidationError({'recurrence_pattern': str(e)})
+        return attrs
 
 class TimeSlotSerializer(serializers.ModelSerializer):
     class Meta:
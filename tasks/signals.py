@@ -0,0 +1,158 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import closure
+from .batching import on_flush, pending
+from .caching import bump_version
+from .models import Event, Project, SyncChange, Task, TaskRelationship, TimeSlot, UserPreferences
+from .occurrences import refresh_occurrences
+from .sync import MODEL_NAMES, write_journal
+
+
+@receiver(post_save, sender=Event)
+def refresh_event_occurrences(sender, instance, raw=False, **kwargs):
+    """Keep the materialized occurrences in sync with the event's rule"""
+    if raw:
+        return
+    refresh_occurrences(instance)
+
+
+# The invalidation handlers below only schedule their version bumps:
+# bump_version() runs on commit, so a rolled back write invalidates nothing
+# and no request can cache pre-commit rows under the new version.
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project_list(sender, instance, **kwargs):
+    """Drop the cached project list of the project's owner"""
+    bump_version(instance.user_id, 'projects')
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_tasks(sender, instance, **kwargs):
+    bump_version(instance.user_id, 'tasks')
+
+
+@receiver(post_save, sender=TaskRelationship)
+@receiver(post_delete, sender=TaskRelationship)
+def invalidate_relationships(sender, instance, signal, **kwargs):
+    batch = pending()
+    if signal is post_delete and batch is not None:
+        # The owner is looked up once per batch, not through from_task per link
+        batch['relationships'].add((instance.from_task_id, instance.pk))
+        return
+    bump_version(instance.from_task.user_id, 'relationships')
+
+
+@receiver(post_delete, sender=Task)
+def remember_task_owner(sender, instance, **kwargs):
+    """Keep the owner of a task deleted in a batch; the row is gone by the flush"""
+    batch = pending()
+    if batch is not None:
+        batch['task_owners'].add((instance.pk, instance.user_id))
+
+
+@on_flush
+def flush_relationship_deletes(batch):
+    """Bump versions and queue tombstones for the relationships deleted in a batch.
+
+    Owners come from the tasks deleted in the same batch, the rest from one
+    query. Registered before journal_deletes, which writes the tombstones.
+    """
+    deleted = batch.get('relationships')
+    if not deleted:
+        return
+    task_ids = {task_id for task_id, _ in deleted}
+    owners = {task_id: user_id for task_id, user_id in batch.get('task_owners', ()) if task_id in task_ids}
+    missing = task_ids - set(owners)
+    if missing:
+        owners.update(Task.objects.filter(pk__in=missing).values_list('id', 'user_id'))
+    for user_id in set(owners.values()):
+        bump_version(user_id, 'relationships')
+    name = MODEL_NAMES[TaskRelationship]
+    batch['journal'].update((owners[task_id], name, pk) for task_id, pk in deleted if task_id in owners)
+
+
+@receiver(post_save, sender=TaskRelationship)
+def index_relationship(sender, instance, created, raw=False, **kwargs):
+    """Add a new precedence edge to the closure index; edits rebuild it"""
+    if raw:
+        return
+    if not created:
+        closure.rebuild(instance.from_task.user)
+        return
+    edge = closure.relationship_edge(instance.from_task_id, instance.to_task_id, instance.relationship_type)
+    if edge:
+        closure.add_edge(instance.from_task.user_id, *edge)
+
+
+@receiver(post_delete, sender=TaskRelationship)
+def unindex_relationship(sender, instance, **kwargs):
+    """Drop a removed precedence edge from the closure index, once per batch"""
+    edge = closure.relationship_edge(instance.from_task_id, instance.to_task_id, instance.relationship_type)
+    if not edge:
+        return
+    batch = pending()
+    if batch is None:
+        closure.remove_edges([edge])
+    else:
+        batch['closure'].add(edge)
+
+
+@on_flush
+def unindex_relationships(batch):
+    if batch.get('closure'):
+        closure.remove_edges(batch['closure'])
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+def invalidate_calendar(sender, instance, **kwargs):
+    bump_version(instance.user_id, 'calendar')
+
+
+@receiver(post_save, sender=UserPreferences)
+def invalidate_preferences(sender, instance, **kwargs):
+    bump_version(instance.user_id, 'preferences')
+
+
+
+def _sync_owner(instance):
+    if isinstance(instance, TaskRelationship):
+        return instance.from_task.user_id
+    return instance.user_id
+
+
+def journal_save(sender, instance, raw=False, **kwargs):
+    """Record saves of synced rows for delta sync"""
+    if raw:
+        return
+    write_journal([SyncChange(user_id=_sync_owner(instance), model=MODEL_NAMES[sender], object_id=instance.pk)])
+
+
+def journal_delete(sender, instance, **kwargs):
+    """Record a tombstone for deleted synced rows, once per batch"""
+    batch = pending()
+    if batch is not None and sender is TaskRelationship:
+        # Queued by flush_relationship_deletes once the owners are known
+        return
+    entry = (_sync_owner(instance), MODEL_NAMES[sender], instance.pk)
+    if batch is None:
+        write_journal([SyncChange(user_id=entry[0], model=entry[1], object_id=entry[2], deleted=True)])
+    else:
+        batch['journal'].add(entry)
+
+
+@on_flush
+def journal_deletes(batch):
+    write_journal([
+        SyncChange(user_id=user_id, model=name, object_id=object_id, deleted=True)
+        for user_id, name, object_id in sorted(batch.get('journal', ()))
+    ])
+
+
+for synced_model in MODEL_NAMES:
+    post_save.connect(journal_save, sender=synced_model)
+    post_delete.connect(journal_delete, sender=synced_model)
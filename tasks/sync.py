@@ -0,0 +1,155 @@
+"""Delta sync for offline clients.
+
+Every save and delete of a synced row appends a SyncChange entry, from
+signals for single rows and explicitly for bulk writes. Entry ids only grow,
+so the id of the last entry a client has seen is its change token: the next
+sync reads the journal after that id and returns the current version of
+every row mentioned, plus tombstones for rows that were deleted. A sync
+without a token returns a full snapshot and the token to continue from.
+
+A token only works if no entry with a lower id can still commit after a
+client has read a higher one. SQLite runs one writer at a time, so ids
+commit in order. On PostgreSQL a transaction that journals a user's rows
+first takes a per-user advisory lock, which orders that user's entries by
+commit. Other backends with concurrent writers would need the same before
+tokens can be trusted.
+
+Entries older than SYNC_RETENTION are pruned by ``manage.py
+prune_sync_journal``. A token from before the pruned range gets a full
+snapshot instead of a delta.
+"""
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import CalendarTask, Event, Project, SyncChange, Task, TaskRelationship, TimeSlot
+from .serializers import (
+    CalendarTaskSerializer, EventSerializer, ProjectSerializer, TaskRelationshipSerializer,
+    TaskSerializer, TimeSlotSerializer,
+)
+
+# Journal entries read per sync call; clients call again while `more` is set
+SYNC_BATCH_SIZE = 1000
+
+# Journal name -> (model, serializer, lookup from a row to its owner)
+SYNCED_MODELS = {
+    'project': (Project, ProjectSerializer, 'user'),
+    'task': (Task, TaskSerializer, 'user'),
+    'task_relationship': (TaskRelationship, TaskRelationshipSerializer, 'from_task__user'),
+    'event': (Event, EventSerializer, 'user'),
+    'time_slot': (TimeSlot, TimeSlotSerializer, 'user'),
+    'calendar_task': (CalendarTask, CalendarTaskSerializer, 'user'),
+}
+MODEL_NAMES = {model: name for name, (model, _, _) in SYNCED_MODELS.items()}
+
+# How long journal entries are kept for delta syncs
+SYNC_RETENTION = timedelta(days=30)
+
+
+def write_journal(entries: List[SyncChange]):
+    """Append journal entries so each user's entries commit in id order."""
+    if not entries:
+        return
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for user_id in sorted({entry.user_id for entry in entries}):
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [user_id])
+        SyncChange.objects.bulk_create(entries)
+
+
+def record_changes(user_id, model, object_ids: Iterable[int], deleted: bool = False):
+    """Journal saves (or deletes) of rows that did not go through signals."""
+    name = MODEL_NAMES[model]
+    write_journal([
+        SyncChange(user_id=user_id, model=name, object_id=object_id, deleted=deleted)
+        for object_id in object_ids
+    ])
+
+
+def current_token(user) -> int:
+    return SyncChange.objects.filter(user=user).aggregate(token=Max('id'))['token'] or 0
+
+
+def oldest_token() -> int:
+    """Oldest token the journal can still answer with a delta."""
+    first = SyncChange.objects.aggregate(first=Min('id'))['first']
+    return first - 1 if first else 0
+
+
+def prune_journal(retention: timedelta = SYNC_RETENTION) -> int:
+    """Delete journal entries older than `retention`; returns how many.
+
+    Entries go strictly by id, so every token below the oldest kept entry is
+    expired and every one above it still sees all later changes. The newest
+    entry is always kept: SQLite hands out the ids of deleted trailing rows
+    again, which would reuse tokens.
+    """
+    cutoff = timezone.now() - retention
+    last = SyncChange.objects.aggregate(last=Max('id'))['last']
+    if last is None:
+        return 0
+    first_kept = SyncChange.objects.filter(changed_at__gte=cutoff).aggregate(first=Min('id'))['first']
+    deleted, _ = SyncChange.objects.filter(id__lt=min(first_kept or last, last)).delete()
+    return deleted
+
+
+def _rows(user, name: str, ids: Optional[Iterable[int]] = None) -> list:
+    model, serializer_class, owner = SYNCED_MODELS[name]
+    queryset = model.objects.filter(**{owner: user}).order_by('pk')
+    if name == 'task':
+        queryset = queryset.prefetch_related('tags')
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    return serializer_class(queryset, many=True).data
+
+
+def snapshot(user) -> dict:
+    """Every synced row of a user and the token to sync from afterwards."""
+    # Read the token first: anything that changes meanwhile is sent again next time
+    token = current_token(user)
+    return {
+        'token': token,
+        'full': True,
+        'more': False,
+        'changes': {name: _rows(user, name) for name in SYNCED_MODELS},
+        'deleted': {name: [] for name in SYNCED_MODELS},
+    }
+
+
+def changes_since(user, since: int, limit: int = SYNC_BATCH_SIZE) -> dict:
+    """Rows changed or deleted after token `since`, at most `limit` journal entries at a time.
+
+    A token older than the pruned journal gets a full snapshot.
+    """
+    if since < oldest_token():
+        return snapshot(user)
+    entries = list(
+        SyncChange.objects.filter(user=user, id__gt=since)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'deleted')[:limit + 1]
+    )
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Only the last entry per row matters
+    latest: Dict[tuple, bool] = {}
+    for _, name, object_id, deleted in entries:
+        latest[name, object_id] = deleted
+
+    changed = {name: [] for name in SYNCED_MODELS}
+    deleted = {name: [] for name in SYNCED_MODELS}
+    for (name, object_id), was_deleted in latest.items():
+        if name in SYNCED_MODELS:
+            (deleted if was_deleted else changed)[name].append(object_id)
+
+    return {
+        'token': entries[-1][0] if entries else since,
+        'full': False,
+        'more': more,
+        'changes': {name: _rows(user, name, ids) if ids else [] for name, ids in changed.items()},
+        'deleted': {name: sorted(ids) for name, ids in deleted.items()},
+    }
@@ -1,6 +1,1073 @@
-from django.test import TestCase
+import json
+import random
+from datetime import date, datetime, time, timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import closure, scoring, utils
+from .availability import BELGRADE_TZ, DayAvailability, localize, subtract_interval
+from .batching import deferred_deletes
+from .caching import data_version
+from .critical_path import analyse
+from .dependencies import DependencyGraph
+from .forms import EventForm
+from .mind_map import COMPONENT_GAP, LAYER_WIDTH, MARGIN, ROW_HEIGHT, build_mind_map, mind_map
+from .models import (
+    CalendarTask, Event, EventOccurrence, Project, SyncChange, Tag, Task, TaskClosure,
+    TaskRelationship,
+)
+from .occurrences import HORIZON_DAYS, PAST_DAYS, ensure_occurrences, occurrences_between
+from .planner import CalendarPlan, CalendarPlanner, Placement, persist_plan, reschedule
+from .project_order import move_project, reorder_projects
+from .recurrence import expand, iter_occurrences, parse_rrule
+from .scheduling import shift_due_dates, shift_queryset
+from .scoring import (
+    CALENDAR_WEIGHTS, DASHBOARD_WEIGHTS, OPTIMAL_ORDER_WEIGHTS, score_expression, score_tasks,
+    task_columns,
+)
+from .sync import SYNC_RETENTION, current_token, prune_journal
+from .utils import create_quick_add_tasks, parse_quick_add
+
+# Keep tests away from the file cache in BASE_DIR
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 
 class SmokeTest(TestCase):
 	def test_truth(self):
 		self.assertTrue(True)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CacheInvalidationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+
+    def test_signal_bumps_version_on_commit(self):
+        before = data_version(self.user.pk, 'projects')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Project.objects.create(user=self.user, name='Home')
+            self.assertEqual(data_version(self.user.pk, 'projects'), before)
+        self.assertTrue(callbacks)
+        self.assertNotEqual(data_version(self.user.pk, 'projects'), before)
+
+    def test_rolled_back_write_keeps_version(self):
+        before = data_version(self.user.pk, 'projects')
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Project.objects.create(user=self.user, name='Home')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(data_version(self.user.pk, 'projects'), before)
+
+    def delete_with_links(self, links):
+        hub = Task.objects.create(user=self.user, title='hub')
+        for number in range(links):
+            other = Task.objects.create(user=self.user, title=f'other {number}')
+            TaskRelationship.objects.create(
+                from_task=other if number % 2 else hub, to_task=hub if number % 2 else other,
+                relationship_type='related_to',
+            )
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic(), deferred_deletes():
+                hub.delete()
+        return len(queries)
+
+    def test_batched_relationship_deletes_look_up_owners_once(self):
+        before = data_version(self.user.pk, 'relationships')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.delete_with_links(2), self.delete_with_links(8))
+        self.assertNotEqual(data_version(self.user.pk, 'relationships'), before)
+
+        # Links whose tasks survive get their owner from one query
+        first, second = (Task.objects.create(user=self.user, title=title) for title in ('first', 'second'))
+        link = TaskRelationship.objects.create(from_task=first, to_task=second, relationship_type='blocks')
+        with transaction.atomic(), deferred_deletes():
+            TaskRelationship.objects.filter(pk=link.pk).delete()
+        tombstones = SyncChange.objects.filter(model='task_relationship', deleted=True)
+        self.assertEqual(tombstones.count(), 11)
+        self.assertEqual(set(tombstones.values_list('user_id', flat=True)), {self.user.pk})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ClosureTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.a, self.b, self.c, self.d = (
+            Task.objects.create(user=self.user, title=title) for title in 'abcd'
+        )
+        # a -> b -> c, a -> c directly as well, d on its own
+        self.link(self.a, self.b)
+        self.link(self.b, self.c)
+        self.ac = self.link(self.a, self.c)
+
+    def link(self, before, after):
+        return TaskRelationship.objects.create(from_task=before, to_task=after, relationship_type='blocks')
+
+    def pairs(self):
+        return set(TaskClosure.objects.values_list('ancestor__title', 'descendant__title'))
+
+    def test_index_follows_added_edges(self):
+        self.assertEqual(self.pairs(), {('a', 'b'), ('b', 'c'), ('a', 'c')})
+        self.assertTrue(closure.would_create_cycle(self.c.id, self.a.id, 'blocks'))
+        self.assertTrue(closure.would_create_cycle(self.a.id, self.c.id, 'depends_on'))
+        self.assertFalse(closure.would_create_cycle(self.c.id, self.a.id, 'related_to'))
+
+    def test_removing_a_redundant_edge_keeps_pairs(self):
+        self.ac.delete()
+        self.assertEqual(self.pairs(), {('a', 'b'), ('b', 'c'), ('a', 'c')})
+
+    def test_deleting_a_task_drops_its_pairs(self):
+        with transaction.atomic(), deferred_deletes():
+            self.b.delete()
+        self.assertEqual(self.pairs(), {('a', 'c')})
+        self.ac.delete()
+        self.assertEqual(self.pairs(), set())
+
+    def test_batched_relationship_delete(self):
+        with transaction.atomic(), deferred_deletes():
+            TaskRelationship.objects.filter(from_task=self.a).delete()
+            # Nothing is unindexed until the block exits
+            self.assertIn(('a', 'c'), self.pairs())
+        self.assertEqual(self.pairs(), {('b', 'c')})
+
+    def test_relationship_picker_relies_on_the_cycle_check(self):
+        self.client.force_login(self.user)
+        url = f'/tasks/{self.c.pk}/relationships/'
+        response = self.client.get(url)
+        self.assertEqual(set(response.context['available_tasks']), {self.a, self.b, self.d})
+
+        # c blocks a would close a cycle; c related_to a cannot
+        self.client.post(url, {'to_task': self.a.pk, 'relationship_type': 'blocks'})
+        self.assertFalse(TaskRelationship.objects.filter(from_task=self.c).exists())
+        self.client.post(url, {'to_task': self.a.pk, 'relationship_type': 'related_to'})
+        self.assertTrue(TaskRelationship.objects.filter(from_task=self.c, relationship_type='related_to').exists())
+        self.assertEqual(self.pairs(), {('a', 'b'), ('b', 'c'), ('a', 'c')})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.tasks = [Task.objects.create(user=self.user, title=f'task {i}', priority=i % 4 + 1) for i in range(12)]
+        # Ties on updated_at must not lose or repeat rows
+        Task.objects.filter(pk__in=[task.pk for task in self.tasks[:6]]).update(updated_at=timezone.now())
+        self.client.force_login(self.user)
+
+    def test_plain_list_is_unpaged(self):
+        response = self.client.get('/api/tasks/', {'ordering': '-priority'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 12)
+        self.assertEqual(response.json()[0]['priority'], 4)
+
+    def test_pages_cover_every_row_once(self):
+        seen = []
+        url = '/api/tasks/?page_size=5'
+        while url:
+            data = self.client.get(url).json()
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(sorted(seen), sorted(task.pk for task in self.tasks))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_ordering_is_rejected_when_paged(self):
+        response = self.client.get('/api/tasks/', {'page_size': 5, 'ordering': 'title'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/tasks/', {'cursor': 'nope'}).status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.client.force_login(self.user)
+
+    def sync(self, since=None):
+        return self.client.get('/api/sync/', {'since': since} if since is not None else {}).json()
+
+    def test_snapshot_then_delta(self):
+        task = Task.objects.create(user=self.user, title='Write report')
+        snapshot = self.sync()
+        self.assertTrue(snapshot['full'])
+        self.assertEqual([row['id'] for row in snapshot['changes']['task']], [task.pk])
+
+        task.title = 'Write the report'
+        task.save()
+        other = Task.objects.create(user=self.user, title='Call back')
+        delta = self.sync(snapshot['token'])
+        self.assertFalse(delta['full'])
+        self.assertEqual({row['id'] for row in delta['changes']['task']}, {task.pk, other.pk})
+        self.assertEqual(self.sync(delta['token'])['changes']['task'], [])
+
+    def test_cascade_tombstones_are_written_once(self):
+        first = Task.objects.create(user=self.user, title='a')
+        second = Task.objects.create(user=self.user, title='b')
+        relationship = TaskRelationship.objects.create(from_task=first, to_task=second, relationship_type='blocks')
+        token = self.sync()['token']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.delete(f'/api/tasks/{first.pk}/')
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT') and 'syncchange' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        delta = self.sync(token)
+        self.assertEqual(delta['deleted']['task'], [first.pk])
+        self.assertEqual(delta['deleted']['task_relationship'], [relationship.pk])
+
+    def test_pruned_token_gets_a_full_resync(self):
+        Task.objects.create(user=self.user, title='old')
+        token = self.sync()['token']
+        Task.objects.create(user=self.user, title='new')
+        SyncChange.objects.update(changed_at=timezone.now() - SYNC_RETENTION - timedelta(days=1))
+        Task.objects.create(user=self.user, title='newest')
+        self.assertEqual(prune_journal(), 2)
+        self.assertTrue(self.sync(token)['full'])
+        self.assertFalse(self.sync(current_token(self.user))['full'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkEndpointTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        other = User.objects.create_user('other')
+        self.project = Project.objects.create(user=self.user, name='Home', slug='home')
+        self.foreign_project = Project.objects.create(user=other, name='Theirs', slug='theirs')
+        self.client.force_login(self.user)
+
+    def bulk(self, endpoint, **payload):
+        return self.client.post(f'/api/{endpoint}/bulk/', json.dumps(payload), content_type='application/json')
+
+    def tasks(self, count):
+        return [Task.objects.create(user=self.user, title=f'task {i}') for i in range(count)]
+
+    def test_create_update_delete(self):
+        keep, change, drop = self.tasks(3)
+        response = self.bulk(
+            'tasks',
+            create=[{'title': 'new', 'project': self.project.pk}],
+            update=[{'id': change.pk, 'priority': 1}],
+            delete=[drop.pk],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['create'][0]['title'], 'new')
+        self.assertEqual(Task.objects.get(pk=change.pk).priority, 1)
+        self.assertFalse(Task.objects.filter(pk=drop.pk).exists())
+        self.assertEqual(Task.objects.filter(user=self.user).count(), 3)
+
+    def test_invalid_items_write_nothing(self):
+        task, = self.tasks(1)
+        response = self.bulk(
+            'tasks',
+            create=[{'title': 'fine'}, {'title': 'theirs', 'project': self.foreign_project.pk}],
+            update=[{'id': task.pk, 'priority': 'x'}, {'id': 0, 'title': 'missing'}],
+            delete=[0],
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(set(errors['create']), {'1'})
+        self.assertEqual(set(errors['update']), {'0', '1'})
+        self.assertEqual(set(errors['delete']), {'0'})
+        self.assertFalse(Task.objects.filter(title='fine').exists())
+
+    def test_duplicate_update_ids(self):
+        task, = self.tasks(1)
+        response = self.bulk('tasks', update=[{'id': task.pk}, {'id': task.pk}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json()['errors']['update'])
+
+    def test_cycle_within_created_batch_is_rejected(self):
+        a, b, c = self.tasks(3)
+        response = self.bulk('task-relationships', create=[
+            {'from_task': a.pk, 'to_task': b.pk, 'relationship_type': 'blocks'},
+            {'from_task': b.pk, 'to_task': c.pk, 'relationship_type': 'blocks'},
+            {'from_task': c.pk, 'to_task': a.pk, 'relationship_type': 'blocks'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']['create']), ['2'])
+        self.assertFalse(TaskRelationship.objects.exists())
+        self.assertFalse(TaskClosure.objects.exists())
+
+    def test_updates_are_checked_for_cycles(self):
+        a, b, c = self.tasks(3)
+        ab = TaskRelationship.objects.create(from_task=a, to_task=b, relationship_type='blocks')
+        bc = TaskRelationship.objects.create(from_task=b, to_task=c, relationship_type='blocks')
+        # Turning a -> b around only loses the path through the edited edge
+        response = self.bulk('task-relationships', update=[{'id': ab.pk, 'from_task': b.pk, 'to_task': a.pk}])
+        self.assertEqual(response.status_code, 200)
+        # c -> b would close b -> c
+        response = self.bulk('task-relationships', update=[{'id': ab.pk, 'from_task': c.pk, 'to_task': b.pk}])
+        self.assertEqual(response.status_code, 400)
+        # Each edit is fine alone, together they close a -> c -> a
+        response = self.bulk('task-relationships', update=[
+            {'id': ab.pk, 'from_task': a.pk, 'to_task': c.pk},
+            {'id': bc.pk, 'from_task': c.pk, 'to_task': a.pk},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']['update']), {'0', '1'})
+        self.assertEqual(
+            set(TaskClosure.objects.values_list('ancestor_id', 'descendant_id')), {(b.pk, a.pk), (b.pk, c.pk)}
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShiftDueDatesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.now = timezone.now()
+        self.project = Project.objects.create(user=self.user, name='Home', slug='home')
+        self.tag = Tag.objects.create(name='errand')
+        today = timezone.make_aware(datetime.combine(timezone.localdate(), time(12)))
+        self.due_today = self.task('today', today)
+        self.future = self.task('future', self.now + timedelta(days=3), project=self.project)
+        self.past = self.task('past', self.now - timedelta(days=3))
+        self.future.tags.add(self.tag)
+        self.done = self.task('done', self.now + timedelta(days=1), status='done', project=self.project)
+        TaskRelationship.objects.create(from_task=self.past, to_task=self.future, relationship_type='blocks')
+
+    def task(self, title, due_at, **fields):
+        return Task.objects.create(user=self.user, title=title, due_at=due_at, **fields)
+
+    def scope(self, scope, **filters):
+        return set(shift_queryset(self.user, scope, **filters).values_list('title', flat=True))
+
+    def test_today(self):
+        self.assertEqual(self.scope('today'), {'today'})
+
+    def test_all_is_everything_due_from_now_on(self):
+        self.assertEqual(self.scope('all') - {'today'}, {'future'})
+
+    def test_range(self):
+        start, end = self.now - timedelta(days=4), self.now - timedelta(days=2)
+        self.assertEqual(self.scope('range', start=start, end=end), {'past'})
+
+    def test_project_skips_closed_tasks(self):
+        self.assertEqual(self.scope('project', project_id=self.project.pk), {'future'})
+
+    def test_tag(self):
+        self.assertEqual(self.scope('tag', tag='errand'), {'future'})
+
+    def test_dependents(self):
+        self.assertEqual(self.scope('dependents', task_id=self.past.pk), {'future'})
+
+    def test_single_task_whatever_its_status(self):
+        self.assertEqual(self.scope('task', task_id=self.done.pk), {'done'})
+
+    def test_missing_parameters_are_rejected(self):
+        for scope in ('range', 'project', 'tag', 'dependents', 'task', 'soon'):
+            with self.assertRaises(ValueError):
+                shift_queryset(self.user, scope)
+        self.client.force_login(self.user)
+        response = self.client.post('/api/schedule/shift/', {'scope': 'tag', 'minutes': 30})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Task.objects.get(pk=self.future.pk).due_at, self.future.due_at)
+
+    def test_shift_moves_due_dates_and_placements(self):
+        start = self.future.due_at.astimezone(BELGRADE_TZ).replace(hour=23, minute=40)
+        placement = CalendarTask.objects.create(
+            user=self.user, task=self.future, scheduled_start=start, scheduled_end=start + timedelta(minutes=15),
+            calendar_date=start.date(),
+        )
+        dry = shift_due_dates(self.user, 30, 'tag', dry_run=True, tag='errand')
+        self.assertEqual((dry.tasks, dry.placements), (1, 1))
+        self.assertEqual(Task.objects.get(pk=self.future.pk).due_at, self.future.due_at)
+
+        result = shift_due_dates(self.user, 30, 'tag', tag='errand')
+        self.assertEqual((result.tasks, result.placements), (1, 1))
+        self.assertEqual(Task.objects.get(pk=self.future.pk).due_at, self.future.due_at + timedelta(minutes=30))
+        placement.refresh_from_db()
+        self.assertEqual(placement.scheduled_start, start + timedelta(minutes=30))
+        # Crossed midnight, so it moved to the next calendar day
+        self.assertEqual(placement.calendar_date, start.date() + timedelta(days=1))
+
+
+class QuickAddTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.client.force_login(self.user)
+        self.project = Project.objects.create(user=self.user, name='Backend', slug='backend')
+
+    def test_title_is_taken_literally(self):
+        self.client.post('/quick-add/', {'title': 'Fix #123 @backend p1'})
+        task = Task.objects.get(user=self.user)
+        self.assertEqual(task.title, 'Fix #123 @backend p1')
+        self.assertIsNone(task.project)
+        self.assertFalse(task.tags.exists())
+
+    def test_batch_lines_are_parsed_with_form_defaults(self):
+        self.client.post('/quick-add/', {
+            'title': '', 'priority': '4', 'tags': 'inbox',
+            'batch': 'cache bug @Backend #perf p2 est:45m\n\n  write notes  \n',
+        })
+        tasks = {task.title: task for task in Task.objects.filter(user=self.user)}
+        self.assertEqual(set(tasks), {'cache bug', 'write notes'})
+        bug, notes = tasks['cache bug'], tasks['write notes']
+        self.assertEqual((bug.project, bug.priority, bug.estimate_minutes), (self.project, 2, 45))
+        self.assertEqual(set(bug.tags.values_list('name', flat=True)), {'perf', 'inbox'})
+        self.assertEqual((notes.project, notes.priority), (None, 4))
+        self.assertEqual(set(notes.tags.values_list('name', flat=True)), {'inbox'})
+
+
+class SketchFormTest(TestCase):
+    def test_only_own_project_is_prefilled(self):
+        self.user = User.objects.create_user('owner')
+        self.client.force_login(self.user)
+        self.project = Project.objects.create(user=self.user, name='Backend', slug='backend')
+        other = Project.objects.create(user=User.objects.create_user('other'), name='Theirs', slug='theirs')
+        self.assertEqual(self.client.get(f'/sketches/new/?project={self.project.pk}').status_code, 200)
+        self.assertEqual(self.client.get(f'/sketches/new/?project={other.pk}').status_code, 404)
+        self.assertEqual(self.client.get('/sketches/new/?project=abc').status_code, 404)
+
+
+class CalendarPlannerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        # A Monday morning, before working hours
+        self.now = BELGRADE_TZ.localize(datetime(2030, 1, 7, 7, 0))
+
+    def task(self, title, **fields):
+        return Task.objects.create(user=self.user, title=title, estimate_minutes=30, **fields)
+
+    def test_prerequisites_are_placed_first(self):
+        first = self.task('first', priority=5)
+        second = self.task('second', priority=1)
+        TaskRelationship.objects.create(from_task=first, to_task=second, relationship_type='blocks')
+        plan = CalendarPlanner(self.user, now=self.now).plan()
+        placed = {placement.task_id: placement for placement in plan.placements}
+        self.assertEqual(set(placed), {first.pk, second.pk})
+        self.assertGreaterEqual(placed[second.pk].scheduled_start, placed[first.pk].scheduled_end)
+        self.assertGreaterEqual(placed[first.pk].scheduled_start, self.now)
+
+    def test_tasks_in_a_cycle_are_not_placed(self):
+        a, b, free = self.task('a'), self.task('b'), self.task('free')
+        TaskRelationship.objects.create(from_task=a, to_task=b, relationship_type='blocks')
+        TaskRelationship.objects.create(from_task=a, to_task=b, relationship_type='depends_on')
+        plan = CalendarPlanner(self.user, now=self.now).plan()
+        self.assertEqual([placement.task_id for placement in plan.placements], [free.pk])
+        self.assertEqual([sorted(cycle) for cycle in plan.cycles], [sorted([a.pk, b.pk])])
+
+
+class DependencyGraphTest(TestCase):
+    def test_topological_order_prefers_lowest_key(self):
+        graph = DependencyGraph([1, 2, 3, 4], [(3, 1), (1, 2)])
+        order = graph.topological_order(key=lambda task_id: task_id)
+        self.assertEqual(order.order, [3, 1, 2, 4])
+        self.assertFalse(order.has_cycles)
+
+    def test_cycles_and_blocked_tasks_are_reported(self):
+        graph = DependencyGraph([1, 2, 3, 4], [(1, 2), (2, 1), (2, 3)])
+        order = graph.topological_order()
+        self.assertEqual(order.order, [4])
+        self.assertEqual([sorted(cycle) for cycle in order.cycles], [[1, 2]])
+        self.assertEqual(order.blocked, [3])
+
+    def test_depends_on_points_the_other_way(self):
+        user = User.objects.create_user('owner')
+        first, second = (Task.objects.create(user=user, title=title) for title in ('first', 'second'))
+        TaskRelationship.objects.create(from_task=second, to_task=first, relationship_type='depends_on')
+        graph = DependencyGraph.for_user(user, [first.pk, second.pk])
+        self.assertEqual(graph.topological_order().order, [first.pk, second.pk])
+
+
+class RecurrenceExpansionTest(TestCase):
+    def dates(self, window_start, window_end, **fields):
+        start = BELGRADE_TZ.localize(datetime.combine(fields.pop('start'), time(9)))
+        event = Event(title='Event', start_time=start, end_time=start + timedelta(hours=1), is_recurring=True, **fields)
+        return [
+            occurrence['start_time'].astimezone(BELGRADE_TZ).date()
+            for occurrence in event.get_recurring_events(window_start, window_end)
+        ]
+
+    def test_weekly_on_weekdays_every_other_week(self):
+        # 2030-01-07 is a Monday
+        self.assertEqual(
+            self.dates(date(2030, 1, 1), date(2030, 1, 31), start=date(2030, 1, 7),
+                       recurrence_type='weekly', recurrence_interval=2, weekdays=[0, 3]),
+            [date(2030, 1, 7), date(2030, 1, 10), date(2030, 1, 21), date(2030, 1, 24)],
+        )
+
+    def test_monthly_skips_months_without_the_day(self):
+        self.assertEqual(
+            self.dates(date(2030, 1, 1), date(2030, 5, 31), start=date(2030, 1, 31), recurrence_type='monthly'),
+            [date(2030, 1, 31), date(2030, 3, 31), date(2030, 5, 31)],
+        )
+
+    def test_max_occurrences_counts_from_the_series_start(self):
+        fields = {'start': date(2030, 1, 1), 'recurrence_type': 'daily', 'max_occurrences': 5}
+        self.assertEqual(self.dates(date(2030, 1, 4), date(2030, 12, 31), **fields),
+                         [date(2030, 1, 4), date(2030, 1, 5)])
+        self.assertEqual(self.dates(date(2030, 1, 6), date(2030, 12, 31), **fields), [])
+
+    def test_end_date(self):
+        self.assertEqual(
+            self.dates(date(2030, 1, 1), date(2033, 12, 31), start=date(2030, 1, 1),
+                       recurrence_type='yearly', end_date=date(2031, 6, 1)),
+            [date(2030, 1, 1), date(2031, 1, 1)],
+        )
+
+
+class RecurrenceRuleTest(TestCase):
+    def dates(self, text, start, window_start, window_end):
+        return list(expand(parse_rrule(text), start, window_start, window_end))
+
+    def test_count_and_exdate(self):
+        text = 'RRULE:FREQ=DAILY;COUNT=4\nEXDATE:20300102'
+        self.assertEqual(
+            self.dates(text, date(2030, 1, 1), date(2030, 1, 1), date(2030, 12, 31)),
+            [date(2030, 1, 1), date(2030, 1, 3), date(2030, 1, 4)],
+        )
+        # COUNT is counted from the start of the series, not the window
+        self.assertEqual(self.dates(text, date(2030, 1, 1), date(2030, 1, 4), date(2030, 12, 31)), [date(2030, 1, 4)])
+
+    def test_monthly_setpos(self):
+        self.assertEqual(
+            self.dates('FREQ=MONTHLY;BYDAY=FR;BYSETPOS=-1', date(2030, 1, 1), date(2030, 1, 1), date(2030, 3, 31)),
+            [date(2030, 1, 25), date(2030, 2, 22), date(2030, 3, 29)],
+        )
+
+    def test_unsupported_rules_are_rejected(self):
+        for text in ('DTSTART:20300101T090000Z\nRRULE:FREQ=DAILY', 'FREQ=DAILY;COUNT=0', 'FREQ=DAILY;COUNT=x',
+                     'FREQ=HOURLY', 'FREQ=DAILY;BYHOUR=9'):
+            with self.assertRaises(ValueError):
+                parse_rrule(text)
+        form = EventForm(data={
+            'title': 'Standup', 'start_time': '2030-01-07T09:00', 'end_time': '2030-01-07T09:15',
+            'is_recurring': True, 'recurrence_type': 'custom', 'recurrence_interval': 1,
+            'recurrence_pattern': 'DTSTART:20300101T090000Z\nRRULE:FREQ=DAILY',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('DTSTART', form.errors['recurrence_pattern'][0])
+
+
+class CriticalPathTest(TestCase):
+    def test_longest_chain_and_slack(self):
+        # 1 -> 2 -> 4 takes 60 minutes, 1 -> 3 -> 4 only 40
+        graph = DependencyGraph([1, 2, 3, 4, 5], [(1, 2), (1, 3), (2, 4), (3, 4)])
+        result = analyse(graph, {1: 10, 2: 30, 3: 10, 4: 20, 5: 5})
+        self.assertEqual(result.length, 60)
+        self.assertEqual(result.path, [1, 2, 4])
+        self.assertEqual(result.slack()[3], 20)
+        # A task without dependencies is never critical
+        self.assertFalse(result.timings[5].critical)
+
+    def test_cycles_are_left_out(self):
+        graph = DependencyGraph([1, 2, 3], [(1, 2), (2, 1)])
+        result = analyse(graph, {1: 10, 2: 10, 3: 15})
+        self.assertEqual(set(result.timings), {3})
+        self.assertEqual([sorted(cycle) for cycle in result.cycles], [[1, 2]])
+
+
+class RescheduleTest(TestCase):
+    def test_unaffected_calendar_is_not_touched(self):
+        user = User.objects.create_user('owner')
+        task = Task.objects.create(user=user, title='placed')
+        start = timezone.now() + timedelta(days=1)
+        CalendarTask.objects.create(
+            user=user, task=task, scheduled_start=start, scheduled_end=start + timedelta(minutes=30),
+            calendar_date=start.astimezone(BELGRADE_TZ).date(),
+        )
+        with self.assertNumQueries(1):
+            result = reschedule(user, dates=[start.date() + timedelta(days=30)])
+        self.assertEqual(result, {'created': 0, 'updated': 0, 'deleted': 0})
+
+
+class PersistPlanTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.start = BELGRADE_TZ.localize(datetime(2030, 1, 7, 9, 0))
+        self.kept, self.moved, self.dropped, self.new = (
+            Task.objects.create(user=self.user, title=title) for title in ('kept', 'moved', 'dropped', 'new')
+        )
+        self.rows = {
+            task.pk: CalendarTask.objects.create(
+                user=self.user, task=task, calendar_date=self.start.date(),
+                scheduled_start=self.start + timedelta(hours=offset),
+                scheduled_end=self.start + timedelta(hours=offset, minutes=30),
+            )
+            for offset, task in enumerate((self.kept, self.moved, self.dropped))
+        }
+
+    def placement(self, task, hours):
+        start = self.start + timedelta(hours=hours)
+        return Placement(task.pk, start.date(), start, start + timedelta(minutes=30))
+
+    def test_only_changed_rows_are_written(self):
+        kept = self.rows[self.kept.pk]
+        plan = CalendarPlan(self.user, [self.placement(self.kept, 0), self.placement(self.moved, 5),
+                                        self.placement(self.new, 6)])
+        result = persist_plan(plan)
+        self.assertEqual(result, {'created': 1, 'updated': 1, 'deleted': 1})
+
+        rows = {row.task_id: row for row in CalendarTask.objects.filter(user=self.user)}
+        self.assertEqual(set(rows), {self.kept.pk, self.moved.pk, self.new.pk})
+        # Unchanged rows keep their id and are not rewritten
+        self.assertEqual((rows[self.kept.pk].pk, rows[self.kept.pk].updated_at), (kept.pk, kept.updated_at))
+        self.assertEqual(rows[self.moved.pk].pk, self.rows[self.moved.pk].pk)
+        self.assertEqual(rows[self.moved.pk].scheduled_start, self.start + timedelta(hours=5))
+
+        # Persisting the same plan again writes nothing
+        self.assertEqual(persist_plan(plan), {'created': 0, 'updated': 0, 'deleted': 0})
+
+    def test_task_ids_limit_the_diff(self):
+        plan = CalendarPlan(self.user, [self.placement(self.moved, 5)])
+        self.assertEqual(persist_plan(plan, task_ids=[self.moved.pk]), {'created': 0, 'updated': 1, 'deleted': 0})
+        self.assertEqual(CalendarTask.objects.filter(user=self.user).count(), 3)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OccurrencesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.today = timezone.now().astimezone(BELGRADE_TZ).date()
+        self.start = BELGRADE_TZ.localize(datetime.combine(self.today, time(9)))
+
+    def event(self, **fields):
+        return Event.objects.create(
+            user=self.user, title='Standup', start_time=self.start, end_time=self.start + timedelta(minutes=15),
+            is_recurring=True, recurrence_type='daily', **fields
+        )
+
+    def dates(self, event):
+        return list(EventOccurrence.objects.filter(event=event).values_list('occurrence_date', flat=True))
+
+    def test_saving_materializes_around_today(self):
+        event = self.event()
+        event.refresh_from_db()
+        self.assertEqual(event.occurrences_start, self.today - timedelta(days=PAST_DAYS))
+        self.assertEqual(event.occurrences_end, self.today + timedelta(days=HORIZON_DAYS))
+        dates = self.dates(event)
+        self.assertEqual((dates[0], dates[-1], len(dates)), (self.today, event.occurrences_end, HORIZON_DAYS + 1))
+
+    def test_range_is_extended_on_demand(self):
+        event = self.event()
+        first = EventOccurrence.objects.filter(event=event).order_by('start_time').first()
+        end = self.today + timedelta(days=HORIZON_DAYS + 10)
+        occurrences = list(occurrences_between(self.user, end - timedelta(days=2), end))
+        self.assertEqual([occurrence.occurrence_date for occurrence in occurrences],
+                         [end - timedelta(days=2), end - timedelta(days=1), end])
+        event.refresh_from_db()
+        self.assertEqual(event.occurrences_end, end)
+        self.assertEqual(len(self.dates(event)), HORIZON_DAYS + 11)
+        # Rows that were already there are kept
+        self.assertTrue(EventOccurrence.objects.filter(pk=first.pk).exists())
+
+    def test_one_version_bump_per_extension(self):
+        for _ in range(3):
+            self.event()
+        end = self.today + timedelta(days=HORIZON_DAYS + 10)
+        with self.captureOnCommitCallbacks() as callbacks:
+            ensure_occurrences(self.user, self.today, end)
+        self.assertEqual(len(callbacks), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            ensure_occurrences(self.user, self.today, end)
+        self.assertEqual(callbacks, [])
+
+    def test_edit_rebuilds_occurrences(self):
+        event = self.event()
+        event.recurrence_type = 'weekly'
+        event.weekdays = [self.today.weekday()]
+        event.start_time += timedelta(hours=2)
+        event.end_time += timedelta(hours=2)
+        event.save()
+        occurrences = EventOccurrence.objects.filter(event=event)
+        self.assertEqual(occurrences.count(), HORIZON_DAYS // 7 + 1)
+        for occurrence in occurrences:
+            self.assertEqual(occurrence.occurrence_date.weekday(), self.today.weekday())
+            self.assertEqual(occurrence.start_time.astimezone(BELGRADE_TZ).time(), time(11))
+
+        event.is_recurring = False
+        event.save()
+        event.refresh_from_db()
+        self.assertEqual(self.dates(event), [])
+        self.assertIsNone(event.occurrences_start)
+
+    def test_occurrences_keep_local_time_across_dst(self):
+        start = BELGRADE_TZ.localize(datetime(2030, 3, 29, 9, 0))
+        event = Event(title='Standup', start_time=start, end_time=start + timedelta(minutes=15),
+                      is_recurring=True, recurrence_type='daily')
+        occurrences = list(iter_occurrences(event, date(2030, 3, 29), date(2030, 4, 1)))
+        self.assertEqual(len(occurrences), 4)
+        for occurrence in occurrences:
+            self.assertEqual(occurrence['start_time'].astimezone(BELGRADE_TZ).time(), time(9, 0))
+            self.assertEqual(occurrence['end_time'] - occurrence['start_time'], timedelta(minutes=15))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CalendarWeekETagTest(TestCase):
+    url = '/api/calendar/week/'
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+        self.client.force_login(self.user)
+        start = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.event = Event.objects.create(
+            user=self.user, title='Review', start_time=start, end_time=start + timedelta(hours=1)
+        )
+        task = Task.objects.create(user=self.user, title='Write')
+        self.placement = CalendarTask.objects.create(
+            user=self.user, task=task, calendar_date=start.date(),
+            scheduled_start=start + timedelta(hours=2), scheduled_end=start + timedelta(hours=3),
+        )
+
+    def etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_matching_etag_gets_304(self):
+        etag = self.etag()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_event_edit_changes_the_etag(self):
+        etag = self.etag()
+        self.event.title = 'Design review'
+        self.event.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['events'][0]['title'], 'Design review')
+
+    def test_placement_edit_changes_the_etag(self):
+        etag = self.etag()
+        self.placement.scheduled_end += timedelta(minutes=30)
+        self.placement.save()
+        self.assertNotEqual(self.etag(), etag)
+        etag = self.etag()
+        self.placement.delete()
+        self.assertNotEqual(self.etag(), etag)
+
+
+class DayAvailabilityTest(TestCase):
+    def setUp(self):
+        self.day = date(2030, 1, 7)
+
+    def at(self, hour, minute=0):
+        return localize(self.day, time(hour, minute))
+
+    def index(self, *busy):
+        busy = [(self.at(*start), self.at(*end)) for start, end in busy]
+        return DayAvailability.for_day(self.day, time(9), time(17), busy)
+
+    def test_free_minutes_between(self):
+        # Free 9-10, 11-12:30, 13-17
+        index = self.index(((10,), (11,)), ((12, 30), (13,)))
+        self.assertEqual(index.total_free_minutes, 60 + 90 + 240)
+        self.assertEqual(index.free_minutes_between(self.at(9, 30), self.at(11, 30)), 30 + 30)
+        self.assertEqual(index.free_minutes_between(self.at(10), self.at(11)), 0)
+        self.assertEqual(index.free_minutes_between(self.at(8), self.at(18)), index.total_free_minutes)
+
+    def test_first_fit_skips_short_gaps(self):
+        # Free 9-9:20, 9:30-10, 11-11:45, 12-14, 15-17
+        index = self.index(((9, 20), (9, 30)), ((10,), (11,)), ((11, 45), (12,)), ((14,), (15,)))
+        self.assertEqual(index.first_fit(self.at(9), 20), self.at(9))
+        self.assertEqual(index.first_fit(self.at(9), 30), self.at(9, 30))
+        self.assertEqual(index.first_fit(self.at(9, 40), 30), self.at(11))
+        self.assertEqual(index.first_fit(self.at(9), 100), self.at(12))
+        self.assertEqual(index.first_fit(self.at(12, 30), 100), self.at(15))
+        self.assertIsNone(index.first_fit(self.at(9), 180))
+        self.assertIsNone(index.first_fit(self.at(17), 10))
+
+    def test_reserve_splits_only_the_overlapping_intervals(self):
+        index = self.index(((12,), (13,)))
+        index.first_fit(self.at(9), 60)
+        index.reserve(self.at(10), self.at(10, 30), 30)
+        index.reserve(self.at(11, 45), self.at(13, 15), 30)
+        self.assertEqual(index.free, [
+            (self.at(9), self.at(10)), (self.at(10, 30), self.at(11, 45)), (self.at(13, 15), self.at(17)),
+        ])
+        self.assertEqual(index.used_minutes, 60)
+        self.assertEqual(index.total_free_minutes, 60 + 75 + 225)
+        self.assertEqual(index.first_fit(self.at(9, 30), 70), self.at(10, 30))
+        self.assertEqual(index.first_fit(self.at(9, 30), 90), self.at(13, 15))
+
+    def test_matches_a_linear_scan(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            busy = []
+            for _ in range(rng.randint(0, 12)):
+                start = rng.randrange(8 * 60, 18 * 60)
+                busy.append((self.at(start // 60, start % 60),
+                             self.at(*divmod(min(start + rng.randint(5, 90), 23 * 60), 60))))
+            index = DayAvailability.for_day(self.day, time(9), time(17), busy)
+            free = list(index.free)
+            for _ in range(10):
+                earliest = self.at(*divmod(rng.randrange(8 * 60, 18 * 60), 60))
+                minutes = rng.randint(5, 240)
+                expected = next((max(start, earliest) for start, end in free
+                                 if max(start, earliest) + timedelta(minutes=minutes) <= end), None)
+                self.assertEqual(index.first_fit(earliest, minutes), expected)
+                if expected is not None and rng.random() < 0.5:
+                    end = expected + timedelta(minutes=minutes)
+                    index.reserve(expected, end)
+                    free = subtract_interval(free, expected, end)
+                    self.assertEqual(index.free, free)
+                    self.assertEqual(index.total_free_minutes,
+                                     sum(int((end - start).total_seconds() // 60) for start, end in free))
+
+
+class TaskListDataMixin:
+    """Projects with tagged, dated and linked tasks, for query count tests."""
+
+    def populate(self, projects=5, tasks_per_project=4):
+        self.user = User.objects.create_user('owner')
+        self.client.force_login(self.user)
+        tag = Tag.objects.create(name='errand')
+        now = timezone.now()
+        previous = None
+        for number in range(projects):
+            project = Project.objects.create(user=self.user, name=f'Project {number}', slug=f'project-{number}')
+            for position in range(tasks_per_project):
+                task = Task.objects.create(
+                    user=self.user, title=f'Task {number}.{position}', project=project, estimate_minutes=30,
+                    due_at=now + timedelta(hours=position - 1) if position else None,
+                )
+                task.tags.add(tag)
+                if previous:
+                    relationship_type = 'blocks' if position % 2 else 'depends_on'
+                    TaskRelationship.objects.create(from_task=previous, to_task=task, relationship_type=relationship_type)
+                previous = task
+        Task.objects.create(user=self.user, title='Loose end')
+        # Measure the view, not a warm fragment cache
+        cache.clear()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DashboardTest(TaskListDataMixin, TestCase):
+    def test_constant_query_count(self):
+        self.populate()
+        # Session, user, tasks, their tags and the project list
+        with self.assertNumQueries(5):
+            response = self.client.get('/')
+        self.assertEqual(len(response.context['overdue']), 5)
+        listed = response.context['overdue'] + response.context['scheduled'] + response.context['not_scheduled']
+        self.assertEqual(len(listed), 21)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OptimalTaskOrderTest(TaskListDataMixin, TestCase):
+    def test_constant_query_count(self):
+        self.populate()
+        # Session, user, tasks with their link counts, the dependency edges and the project list
+        with self.assertNumQueries(5):
+            response = self.client.get('/optimal-order/')
+        tasks = response.context['optimal_tasks']
+        self.assertEqual(len(tasks), 21)
+        position = {task.id: index for index, task in enumerate(tasks)}
+        for relationship in TaskRelationship.objects.all():
+            before, after = relationship.from_task_id, relationship.to_task_id
+            if relationship.relationship_type == 'depends_on':
+                before, after = after, before
+            self.assertLess(position[before], position[after])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AllTasksTest(TaskListDataMixin, TestCase):
+    def groups(self, **params):
+        response = self.client.get('/all-tasks/', params)
+        return [
+            (group['project'].name if group['project'] else None, len(group['tasks']), group['total'])
+            for group in response.context['project_groups']
+        ]
+
+    def test_constant_query_count(self):
+        self.populate()
+        # Session, user, tasks, their tags and the project list
+        with self.assertNumQueries(5):
+            response = self.client.get('/all-tasks/')
+        self.assertEqual(len(response.context['project_groups']), 6)
+
+    @patch('tasks.views.ALL_TASKS_PER_PROJECT', 2)
+    def test_expand(self):
+        self.populate(projects=2, tasks_per_project=3)
+        Task.objects.create(user=self.user, title='Another loose end')
+        Task.objects.create(user=self.user, title='And another')
+        first = Project.objects.get(name='Project 0')
+        self.assertEqual(self.groups(), [('Project 0', 2, 3), ('Project 1', 2, 3), (None, 2, 3)])
+        self.assertEqual(self.groups(expand=first.pk), [('Project 0', 3, 3), ('Project 1', 2, 3), (None, 2, 3)])
+        self.assertEqual(self.groups(expand='none'), [('Project 0', 2, 3), ('Project 1', 2, 3), (None, 3, 3)])
+        self.assertEqual(self.groups(expand='all'), [('Project 0', 3, 3), ('Project 1', 3, 3), (None, 3, 3)])
+        # Filters apply before the per-project limit
+        self.assertEqual(self.groups(project=first.pk, expand='all'), [('Project 0', 3, 3)])
+
+
+class ScoringTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('owner')
+        self.now = timezone.now()
+        projects = [None] + [
+            Project.objects.create(user=user, name=f'P{priority}', slug=f'p{priority}', priority=priority)
+            for priority in (0, 2, 7)
+        ]
+        rng = random.Random(12)
+        for number in range(60):
+            due_hours = rng.choice([None, -50, -1, 5, 30, 60, 80, 200])
+            Task.objects.create(
+                user=user, title=f'Task {number}', priority=rng.randint(1, 5), project=rng.choice(projects),
+                estimate_minutes=rng.choice([None, 0, 15, 45, 120, 400]),
+                due_at=self.now + timedelta(hours=due_hours) if due_hours is not None else None,
+            )
+        self.tasks = list(Task.objects.select_related('project').order_by('id'))
+        self.blocking = {task.id: rng.randint(0, 3) for task in self.tasks}
+        self.dependencies = {task.id: rng.randint(0, 3) for task in self.tasks}
+
+    def baseline_dashboard(self, task):
+        # The scoring loop the dashboard had before scoring.py
+        score = task.priority * 10
+        score += task.project.priority * 100 if task.project else 1000
+        score += min(task.estimate_minutes // 30, 10) if task.estimate_minutes else 5
+        return score
+
+    def baseline_optimal_order(self, task):
+        # The scoring loop optimal_task_order had before scoring.py
+        score = task.priority
+        if task.due_at:
+            days_until_due = (task.due_at - self.now).days
+            if days_until_due < 0:
+                score -= 10
+            elif days_until_due <= 1:
+                score -= 5
+            elif days_until_due <= 3:
+                score -= 2
+        return score - self.blocking[task.id] * 2 + self.dependencies[task.id] * 2
+
+    def test_dashboard_scores_match_sql_and_baseline(self):
+        scores = score_tasks(self.tasks, DASHBOARD_WEIGHTS, now=self.now)
+        in_sql = dict(Task.objects.annotate(score=score_expression(DASHBOARD_WEIGHTS)).values_list('id', 'score'))
+        self.assertEqual(scores, in_sql)
+        self.assertEqual(scores, {task.id: self.baseline_dashboard(task) for task in self.tasks})
+
+    def test_optimal_order_scores_match_baseline(self):
+        scores = score_tasks(self.tasks, OPTIMAL_ORDER_WEIGHTS, now=self.now,
+                             blocking=self.blocking, dependencies=self.dependencies)
+        self.assertEqual(scores, {task.id: self.baseline_optimal_order(task) for task in self.tasks})
+
+    @skipUnless(scoring.np is not None, 'NumPy is not installed')
+    def test_numpy_matches_python(self):
+        columns = task_columns(self.tasks, self.now, self.blocking, self.dependencies,
+                               {task.id: task.id % 2 for task in self.tasks})
+        for weights in (DASHBOARD_WEIGHTS, CALENDAR_WEIGHTS, OPTIMAL_ORDER_WEIGHTS):
+            self.assertEqual(scoring._score_numpy(columns, weights), scoring._score_python(columns, weights))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MindMapTest(TestCase):
+    def test_components_layers_and_cycles(self):
+        tasks = [{'id': task_id} for task_id in range(1, 8)]
+        edges = [
+            (1, 2, 'blocks'), (3, 2, 'depends_on'),
+            (4, 5, 'related_to'), (5, 6, 'blocks'), (6, 5, 'blocks'),
+            # Tasks that are not shown are ignored
+            (7, 99, 'blocks'),
+        ]
+        result = build_mind_map(tasks, edges)
+        self.assertEqual(result['components'], [[1, 2, 3], [4, 5, 6], [7]])
+        self.assertEqual([sorted(cycle) for cycle in result['cycles']], [[5, 6]])
+        self.assertEqual(len(result['edges']), 5)
+        nodes = {node['id']: node for node in result['nodes']}
+        self.assertEqual({task_id: nodes[task_id]['layer'] for task_id in nodes},
+                         {1: 0, 2: 1, 3: 2, 4: 0, 5: 0, 6: 0, 7: 0})
+        # A row per layer, components side by side
+        self.assertEqual([(nodes[task_id]['x'], nodes[task_id]['y']) for task_id in (1, 2, 3)],
+                         [(MARGIN, MARGIN), (MARGIN + LAYER_WIDTH, MARGIN), (MARGIN + 2 * LAYER_WIDTH, MARGIN)])
+        second = MARGIN + 3 * LAYER_WIDTH + COMPONENT_GAP
+        self.assertEqual([(nodes[task_id]['x'], nodes[task_id]['y']) for task_id in (4, 5, 6)],
+                         [(second, MARGIN + row * ROW_HEIGHT) for row in range(3)])
+        self.assertEqual(nodes[7]['x'], second + LAYER_WIDTH + COMPONENT_GAP)
+
+    def test_only_open_tasks_are_shown(self):
+        user = User.objects.create_user('owner')
+        open_task = Task.objects.create(user=user, title='open')
+        done = Task.objects.create(user=user, title='done', status='done')
+        TaskRelationship.objects.create(from_task=open_task, to_task=done, relationship_type='blocks')
+        result = mind_map(user)
+        self.assertEqual([node['id'] for node in result['nodes']], [open_task.pk])
+        self.assertEqual(result['edges'], [])
+
+
+class ProjectOrderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner')
+
+    def projects(self, *priorities):
+        return [
+            Project.objects.create(user=self.user, name=name, slug=name.lower(), priority=priority)
+            for name, priority in zip('ABCDE', priorities)
+        ]
+
+    def priorities(self):
+        return dict(Project.objects.filter(user=self.user).values_list('name', 'priority'))
+
+    def journaled(self, token):
+        return sorted(SyncChange.objects.filter(id__gt=token).values_list('object_id', flat=True))
+
+    def test_reorder_writes_only_changed_rows(self):
+        a, b, c = self.projects(0, 1, 2)
+        token = current_token(self.user)
+        self.assertEqual(reorder_projects(self.user, {a.pk: 2, b.pk: 1, c.pk: 0}), 2)
+        self.assertEqual(self.priorities(), {'A': 2, 'B': 1, 'C': 0})
+        self.assertEqual(self.journaled(token), sorted([a.pk, c.pk]))
+        self.assertEqual(reorder_projects(self.user, {a.pk: 2}), 0)
+
+        other = Project.objects.create(user=User.objects.create_user('other'), name='X', slug='x')
+        with self.assertRaises(Project.DoesNotExist):
+            reorder_projects(self.user, {a.pk: 0, other.pk: 1})
+        self.assertEqual(self.priorities()['A'], 2)
+
+    def test_move_into_a_gap(self):
+        a, b, c = self.projects(0, 5, 10)
+        token = current_token(self.user)
+        self.assertEqual(move_project(self.user, c.pk, after_id=a.pk), {'priority': 1, 'shifted': []})
+        self.assertEqual(self.priorities(), {'A': 0, 'B': 5, 'C': 1})
+        self.assertEqual(self.journaled(token), [c.pk])
+
+    def test_move_shifts_the_rest_when_there_is_no_gap(self):
+        a, b, c, d = self.projects(0, 1, 2, 3)
+        self.assertEqual(move_project(self.user, d.pk, after_id=a.pk), {'priority': 1, 'shifted': [b.pk, c.pk]})
+        self.assertEqual(self.priorities(), {'A': 0, 'B': 2, 'C': 3, 'D': 1})
+        self.assertEqual(move_project(self.user, c.pk), {'priority': 0, 'shifted': [a.pk, d.pk, b.pk]})
+        self.assertEqual(self.priorities(), {'A': 1, 'B': 3, 'C': 0, 'D': 2})
+
+    def test_move_is_undone_when_journaling_fails(self):
+        a, b, c = self.projects(0, 1, 2)
+        with patch('tasks.project_order.record_changes', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                move_project(self.user, c.pk, after_id=a.pk)
+        self.assertEqual(self.priorities(), {'A': 0, 'B': 1, 'C': 2})
+
+
+class ResolveProjectsTest(TestCase):
+    def test_taken_slug_is_retried(self):
+        user = User.objects.create_user('owner')
+        Project.objects.create(user=User.objects.create_user('other'), name='Backend', slug='backend')
+        free_slugs = utils._free_slugs
+        calls = []
+
+        def racing(names):
+            # The first pick collides with a slug taken meanwhile
+            calls.append(names)
+            return {name: 'backend' for name in names} if len(calls) == 1 else free_slugs(names)
+
+        with patch('tasks.utils._free_slugs', side_effect=racing):
+            tasks = create_quick_add_tasks(user, parse_quick_add('deploy @Backend'))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(tasks[0].project.slug, 'backend-2')
+        self.assertEqual(tasks[0].project.user, user)
+
+    def test_gives_up_after_repeated_collisions(self):
+        user = User.objects.create_user('owner')
+        Project.objects.create(user=User.objects.create_user('other'), name='Backend', slug='backend')
+        with patch('tasks.utils._free_slugs', return_value={'Backend': 'backend'}):
+            with self.assertRaises(IntegrityError):
+                create_quick_add_tasks(user, parse_quick_add('deploy @Backend'))
+        self.assertFalse(Task.objects.filter(user=user).exists())
@@ -1,10 +1,19 @@
 import re
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
 
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.text import slugify
 
+from .caching import bump_version
 from .models import Task, Project, Tag
+from .sync import record_changes
+
+# Inserts tried when another request takes a chosen project slug first
+SLUG_ATTEMPTS = 3
 
 
 def _parse_relative_date(token: str) -> Optional[datetime]:
@@ -28,42 +37,42 @@ def _parse_relative_date(token: str) -> Optional[datetime]:
     return None
 
 
-def parse_quick_add(text: str) -> Task:
+@dataclass
+class QuickAddLine:
+    """One parsed quick-add line; project and tags are still names."""
+    title: str
+    project: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    priority: Optional[int] = None
+    due_at: Optional[datetime] = None
+    estimate_minutes: Optional[int] = None
+
+
+def parse_quick_add_line(text: str) -> QuickAddLine:
     """Parse text like:
-    "fix cache bug @backend #perf p2 due:tom est:45m start:today link:https://..."
-    Return created Task.
+    "fix cache bug @backend #perf p2 due:tom est:45m"
+    Nothing is looked up or written here.
     """
     text = text.strip()
     if not text:
         raise ValueError('Empty quick-add input')
 
-    # Defaults
+    line = QuickAddLine(title='')
     title_parts = []
-    project: Optional[Project] = None
-    tags = []
-    priority = 3
-    due_at: Optional[datetime] = None
-
-    estimate_minutes = 0
-
-
-    tokens = text.split()
-    for token in tokens:
+    for token in text.split():
         if token.startswith('@') and len(token) > 1:
-            proj_name = token[1:]
-            project, _ = Project.objects.get_or_create(name=proj_name)
+            line.project = token[1:]
             continue
         if token.startswith('#') and len(token) > 1:
-            tag_name = token[1:]
-            tag, _ = Tag.objects.get_or_create(name=tag_name)
-            tags.append(tag)
+            if token[1:] not in line.tags:
+                line.tags.append(token[1:])
             continue
         if re.fullmatch(r'p[1-5]', token, flags=re.IGNORECASE):
-            priority = int(token[1])
+            line.priority = int(token[1])
             continue
         if token.startswith('due:'):
             v = token[4:]
-            due_at = _parse_relative_date(v) or _parse_relative_date(v.replace(':', '-'))
+            line.due_at = _parse_relative_date(v) or _parse_relative_date(v.replace(':', '-'))
             continue
 
         if token.startswith('est:'):
@@ -72,20 +81,116 @@ def parse_quick_add(text: str) -> Task:
             if m:
                 num = int(m.group(1))
                 unit = m.group(2)
-                estimate_minutes = num if unit == 'm' else num * 60
+                line.estimate_minutes = num if unit == 'm' else num * 60
             continue
 
         title_parts.append(token)
 
-    title = ' '.join(title_parts).strip() or text
-
-    task = Task.objects.create(
-        title=title,
-        project=project,
-        priority=priority,
-        due_at=due_at,
-        estimate_minutes=estimate_minutes,
-    )
-    if tags:
-        task.tags.add(*tags)
-    return task 
\ No newline at end of file
+    line.title = ' '.join(title_parts).strip() or text
+    return line
+
+
+def parse_quick_add(text: str) -> List[QuickAddLine]:
+    """Parse every non-empty line of a pasted batch, one task per line."""
+    lines = [parse_quick_add_line(line) for line in text.splitlines() if line.strip()]
+    if not lines:
+        raise ValueError('Empty quick-add input')
+    return lines
+
+
+def resolve_tags(names: Iterable[str]) -> Dict[str, Tag]:
+    """{name: Tag} for all names, creating the missing tags in one insert."""
+    names = set(names)
+    if not names:
+        return {}
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = names - set(tags)
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        tags.update((tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+    return tags
+
+
+def _free_slugs(names: Iterable[str]) -> Dict[str, str]:
+    """A slug per project name that no project uses yet (slugs are global)."""
+    bases = {name: slugify(name) or 'project' for name in names}
+    taken_query = Q()
+    for base in set(bases.values()):
+        taken_query |= Q(slug__startswith=base)
+    taken = set(Project.objects.filter(taken_query).values_list('slug', flat=True))
+    slugs = {}
+    for name, base in bases.items():
+        slug, n = base, 2
+        while slug in taken:
+            slug, n = f'{base}-{n}', n + 1
+        taken.add(slug)
+        slugs[name] = slug
+    return slugs
+
+
+def resolve_projects(user, names: Iterable[str]) -> Dict[str, Project]:
+    """{name: Project} among the user's projects, creating the missing ones in one insert.
+
+    Slugs are picked before the insert, so another request can take one in
+    between; the insert is then retried with fresh slugs, and the
+    IntegrityError is raised once SLUG_ATTEMPTS are used up.
+    """
+    names = set(names)
+    if not names:
+        return {}
+    projects = {project.name: project for project in Project.objects.filter(user=user, name__in=names)}
+    missing = names - set(projects)
+    for attempt in range(SLUG_ATTEMPTS):
+        if not missing:
+            break
+        slugs = _free_slugs(missing)
+        try:
+            with transaction.atomic():
+                Project.objects.bulk_create([Project(user=user, name=name, slug=slugs[name]) for name in missing])
+        except IntegrityError:
+            if attempt == SLUG_ATTEMPTS - 1:
+                raise
+            continue
+        created = list(Project.objects.filter(user=user, name__in=missing))
+        projects.update((project.name, project) for project in created)
+        # bulk_create sends no signals
+        record_changes(user.pk, Project, [project.id for project in created])
+        bump_version(user.pk, 'projects')
+        missing = set()
+    return projects
+
+
+def create_quick_add_tasks(user, lines: List[QuickAddLine], defaults: Optional[dict] = None) -> List[Task]:
+    """Create one task per parsed line with a fixed number of queries.
+
+    `defaults` holds Task field values for whatever a line does not set itself
+    (e.g. the fields of the quick-add form), plus an optional 'tags' list of
+    names added to every task.
+    """
+    defaults = dict(defaults or {})
+    default_tags = defaults.pop('tags', [])
+    tags = resolve_tags(name for line in lines for name in line.tags + default_tags)
+    projects = resolve_projects(user, {line.project for line in lines if line.project})
+
+    tasks = []
+    for line in lines:
+        values = dict(defaults, title=line.title)
+        if line.project:
+            values['project'] = projects[line.project]
+        for name in ('priority', 'due_at', 'estimate_minutes'):
+            if getattr(line, name) is not None:
+                values[name] = getattr(line, name)
+        tasks.append(Task(user=user, **values))
+
+    with transaction.atomic():
+        tasks = Task.objects.bulk_create(tasks)
+        Task.tags.through.objects.bulk_create([
+            Task.tags.through(task_id=task.id, tag_id=tags[name].id)
+            for task, line in zip(tasks, lines)
+            for name in dict.fromkeys(line.tags + default_tags)
+            if name in tags
+        ], ignore_conflicts=True)
+        # bulk_create sends no signals
+        record_changes(user.pk, Task, [task.id for task in tasks])
+    bump_version(user.pk, 'tasks')
+    return tasks
@@ -1,15 +1,19 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.utils import timezone
-from django.db.models import Q, Count, Case, When, IntegerField
+from django.db import transaction
+from django.db.models import Q, F, Count, Case, When, IntegerField, CharField, Value, Window
+from django.db.models.functions import RowNumber
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.text import slugify
+from django.utils.functional import SimpleLazyObject
 from datetime import datetime, timedelta
 import json
 import pytz
+from itertools import groupby
 
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
@@ -18,7 +22,20 @@ from django.urls import reverse_lazy
 
 from .models import Task, Project, Tag, TaskRelationship, FocusSession, Event, TimeSlot, CalendarTask, UserPreferences, Sketch
 from .forms import TaskForm, ProjectForm, TaskRelationshipForm, EventForm, TimeSlotForm, UserPreferencesForm, SketchForm
-from .utils import parse_quick_add
+from .utils import QuickAddLine, create_quick_add_tasks, parse_quick_add
+from . import closure
+from .batching import deferred_deletes
+from .caching import user_projects
+from .calendar_grid import build_week_grid
+from .critical_path import analyse_tasks
+from .dependencies import DependencyGraph
+from .mind_map import mind_map
+from .occurrences import single_events, occurrences_between
+from .scoring import DASHBOARD_WEIGHTS, OPTIMAL_ORDER_WEIGHTS, score_expression, score_tasks
+from .planner import build_calendar_plan, persist_plan, reschedule, reschedule_events, events_affected_dates
+
+# Tasks shown per project on the all tasks page before "show all"
+ALL_TASKS_PER_PROJECT = 50
 
 class CustomLoginView(FormView):
     template_name = 'auth/login.html'
@@ -68,69 +85,42 @@ def dashboard(request):
     project_filter = request.GET.get('project')
     status_filter = request.GET.get('status')
     
-    # Base querysets
-    overdue = Task.objects.filter(
-        user=request.user, 
-        due_at__lt=timezone.now(), 
-        status__in=['todo', 'in_progress']
-    )
-    
-    scheduled = Task.objects.filter(
-        user=request.user,
-        due_at__isnull=False,
-        due_at__gte=timezone.now(),
-        status__in=['todo', 'in_progress']
-    )
+    now = timezone.now()
     
-    not_scheduled = Task.objects.filter(
+    # One query for every open task, bucketed and scored by the database
+    tasks = Task.objects.filter(
         user=request.user,
-        due_at__isnull=True,
         status__in=['todo', 'in_progress']
-    )
+    ).annotate(
+        bucket=Case(
+            When(due_at__isnull=True, then=Value('not_scheduled')),
+            When(due_at__lt=now, then=Value('overdue')),
+            default=Value('scheduled'),
+            output_field=CharField(),
+        ),
+        optimization_score=score_expression(DASHBOARD_WEIGHTS),
+    ).select_related('project').prefetch_related('tags').order_by('id')
     
     # Apply filters
     if priority_filter:
-        overdue = overdue.filter(priority=priority_filter)
-        scheduled = scheduled.filter(priority=priority_filter)
-        not_scheduled = not_scheduled.filter(priority=priority_filter)
+        tasks = tasks.filter(priority=priority_filter)
     
     if project_filter:
-        overdue = overdue.filter(project_id=project_filter)
-        scheduled = scheduled.filter(project_id=project_filter)
-        not_scheduled = not_scheduled.filter(project_id=project_filter)
+        tasks = tasks.filter(project_id=project_filter)
     
     if status_filter:
-        overdue = overdue.filter(status=status_filter)
-        scheduled = scheduled.filter(status=status_filter)
-        not_scheduled = not_scheduled.filter(status=status_filter)
+        tasks = tasks.filter(status=status_filter)
+    
+    overdue, scheduled, not_scheduled = [], [], []
+    buckets = {'overdue': overdue, 'scheduled': scheduled, 'not_scheduled': not_scheduled}
+    for task in tasks:
+        buckets[task.bucket].append(task)
     
     # Sort overdue by priority and due date
-    overdue = overdue.order_by('priority', 'due_at')
+    overdue.sort(key=lambda task: (task.priority, task.due_at))
     
     # Sort scheduled by date, then priority, then time (optimized for 4 hours daily)
-    scheduled = scheduled.order_by('due_at__date', 'priority', 'due_at__time')
-    
-    # Calculate scores for not scheduled tasks
-    for task in not_scheduled:
-        # Base score starts with priority (lower number = higher priority)
-        score = task.priority * 10
-        
-        # Add project priority (lower number = higher priority)
-        if task.project:
-            score += task.project.priority * 100
-        else:
-            score += 1000  # No project gets lowest priority
-        
-        # Add duration factor (shorter tasks get higher priority)
-        if task.estimate_minutes:
-            score += min(task.estimate_minutes // 30, 10)  # Max 10 points for duration
-        else:
-            score += 5  # Default duration score
-        
-        task.optimization_score = score
-    
-    # Sort not scheduled by optimization score
-    not_scheduled = sorted(not_scheduled, key=lambda x: x.optimization_score)
+    scheduled.sort(key=lambda task: (task.due_at.date(), task.priority, task.due_at.time()))
     
     # Optimize scheduled tasks for 4 hours daily (240 minutes)
     optimized_scheduled = []
@@ -157,23 +147,10 @@ def dashboard(request):
             task.due_at = None
             not_scheduled.append(task)
     
-    # Re-sort not scheduled after adding overflow tasks
-    for task in not_scheduled:
-        if not hasattr(task, 'optimization_score'):
-            score = task.priority * 10
-            if task.project:
-                score += task.project.priority * 100
-            else:
-                score += 1000
-            if task.estimate_minutes:
-                score += min(task.estimate_minutes // 30, 10)
-            else:
-                score += 5
-            task.optimization_score = score
-    
-    not_scheduled = sorted(not_scheduled, key=lambda x: x.optimization_score)
+    # Sort not scheduled (including overflow tasks) by optimization score
+    not_scheduled.sort(key=lambda task: task.optimization_score)
     
-    projects = Project.objects.filter(user=request.user).order_by('priority', 'name')
+    projects = user_projects(request.user)
     
     current_filters = {
         'priority': priority_filter,
@@ -187,7 +164,7 @@ def dashboard(request):
         'not_scheduled': not_scheduled,
         'projects': projects,
         'current_filters': current_filters,
-        'now': timezone.now(),
+        'now': now,
     }
     return render(request, 'tasks/dashboard.html', context)
 
@@ -210,19 +187,42 @@ def all_tasks(request):
     if status_filter:
         tasks = tasks.filter(status=status_filter)
     
-    # Group tasks by project
-    projects = Project.objects.filter(user=request.user).order_by('priority', 'name')
-    tasks_by_project = {}
+    # Only the user's own projects are listed, plus tasks without a project
+    tasks = tasks.filter(Q(project__isnull=True) | Q(project__user=request.user))
     
-    for project in projects:
-        project_tasks = tasks.filter(project=project).order_by('priority', 'due_at', 'created_at')
-        if project_tasks.exists():
-            tasks_by_project[project] = project_tasks
+    # Show the first tasks of every project; ?expand=<project id>, "none" or "all" shows the rest
+    expand = request.GET.get('expand')
+    task_order = ['priority', 'due_at', 'created_at']
+    tasks = tasks.annotate(
+        position=Window(RowNumber(), partition_by=[F('project_id')], order_by=task_order),
+        project_total=Window(Count('id'), partition_by=[F('project_id')]),
+    )
+    if expand == 'none':
+        tasks = tasks.filter(Q(position__lte=ALL_TASKS_PER_PROJECT) | Q(project__isnull=True))
+    elif expand and expand.isdigit():
+        tasks = tasks.filter(Q(position__lte=ALL_TASKS_PER_PROJECT) | Q(project_id=expand))
+    elif expand != 'all':
+        tasks = tasks.filter(position__lte=ALL_TASKS_PER_PROJECT)
+    
+    # One query for every listed task, in project priority order with no project last
+    tasks = tasks.select_related('project').prefetch_related('tags').order_by(
+        F('project__priority').asc(nulls_last=True), 'project__name', 'project_id', *task_order
+    )
+    
+    # Group tasks by project
+    project_groups = []
+    for project_id, group in groupby(tasks, key=lambda task: task.project_id):
+        group = list(group)
+        expand_query = request.GET.copy()
+        expand_query['expand'] = project_id or 'none'
+        project_groups.append({
+            'project': group[0].project,
+            'tasks': group,
+            'total': group[0].project_total,
+            'expand_query': expand_query.urlencode(),
+        })
     
-    # Handle tasks without project
-    no_project_tasks = tasks.filter(project__isnull=True).order_by('priority', 'due_at', 'created_at')
-    if no_project_tasks.exists():
-        tasks_by_project[None] = no_project_tasks
+    projects = user_projects(request.user)
     
     current_filters = {
         'priority': priority_filter,
@@ -231,7 +231,7 @@ def all_tasks(request):
     }
     
     context = {
-        'tasks_by_project': tasks_by_project,
+        'project_groups': project_groups,
         'projects': projects,
         'current_filters': current_filters,
         'now': timezone.now(),
@@ -258,18 +258,14 @@ def calendar_view(request):
     for i in range(7):
         week_dates.append(start_of_week + timedelta(days=i))
     
-    # Pre-calculate all 24 hours
-    hours = list(range(24))  # 0:00 to 23:00
-    
     # Get user preferences
     user_preferences = UserPreferences.get_or_create_for_user(request.user)
     
     # Get all events for the week (including recurring events)
     all_events = []
     
-    # Get regular events
-    regular_events = Event.objects.filter(
-        user=request.user,
+    # Get one-off events
+    regular_events = single_events(request.user).filter(
         start_time__date__gte=start_of_week,
         start_time__date__lte=end_of_week
     ).order_by('start_time')
@@ -284,15 +280,16 @@ def calendar_view(request):
             'original_event': event,
         })
     
-    # Get recurring events and generate instances
-    recurring_events = Event.objects.filter(
-        user=request.user,
-        is_recurring=True
-    ).order_by('start_time')
-    
-    for event in recurring_events:
-        recurring_instances = event.get_recurring_events(start_of_week, end_of_week)
-        all_events.extend(recurring_instances)
+    # Get materialized occurrences of recurring events
+    for occurrence in occurrences_between(request.user, start_of_week, end_of_week):
+        all_events.append({
+            'title': occurrence.event.title,
+            'description': occurrence.event.description,
+            'start_time': occurrence.start_time,
+            'end_time': occurrence.end_time,
+            'is_recurring_instance': True,
+            'original_event': occurrence.event,
+        })
     
     # Ensure all events have timezone-aware datetimes before sorting
     for event in all_events:
@@ -312,26 +309,33 @@ def calendar_view(request):
         user=request.user,
         calendar_date__gte=start_of_week,
         calendar_date__lte=end_of_week
-    ).order_by('scheduled_start')
+    ).select_related('task__project').order_by('scheduled_start')
+    
+    # Bucket everything into (date, hour) cells in one pass, only when the
+    # cached grid fragment is missing
+    calendar_rows = SimpleLazyObject(lambda: build_week_grid(
+        week_dates, all_events, calendar_tasks, time_slots,
+        user_preferences.work_start_time, user_preferences.work_end_time
+    )[1])
     
     # Get all available tasks for scheduling
     available_tasks = Task.objects.filter(
         user=request.user,
         status__in=['todo', 'in_progress']
-    ).order_by('priority', 'due_at')
+    ).select_related('project').order_by('priority', 'due_at')
     
     context = {
         'events': all_events,
         'time_slots': time_slots,
         'calendar_tasks': calendar_tasks,
+        'calendar_rows': calendar_rows,
         'available_tasks': available_tasks,
         'start_of_week': start_of_week,
         'end_of_week': end_of_week,
         'today': today,
         'week_dates': week_dates,
-        'hours': hours,
         'user_preferences': user_preferences,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'week_offset': week_offset,
     }
     return render(request, 'tasks/calendar.html', context)
@@ -340,380 +344,26 @@ def calendar_view(request):
 def regenerate_calendar(request):
     """Regenerate calendar schedule for tasks with smart optimization and relationship support"""
     if request.method == 'POST':
-        # Clear existing calendar tasks
-        CalendarTask.objects.filter(user=request.user).delete()
-        
-        # Get user preferences
-        user_preferences = UserPreferences.get_or_create_for_user(request.user)
-        work_start = user_preferences.work_start_time
-        work_end = user_preferences.work_end_time
-        daily_hours = user_preferences.daily_work_hours
-        
-        # Calculate daily capacity in minutes (use 70% of available time for tasks)
-        daily_capacity_minutes = int(daily_hours * 60 * 0.7)
-        
-        # Get all tasks that need scheduling
-        tasks = Task.objects.filter(
-            user=request.user,
-            status__in=['todo', 'in_progress']
-        ).order_by('priority', 'due_at')
-        
-        # Build dependency graph
-        dependency_graph = {}
-        task_dependencies = {}
-        
-        for task in tasks:
-            dependency_graph[task.id] = []
-            task_dependencies[task.id] = []
-        
-        # Get all relationships
-        relationships = TaskRelationship.objects.filter(
-            from_task__in=tasks,
-            to_task__in=tasks
-        )
-        
-        for rel in relationships:
-            if rel.relationship_type == 'depends_on':
-                # task A depends on task B means A cannot start until B is done
-                dependency_graph[rel.from_task.id].append(rel.to_task.id)
-                task_dependencies[rel.from_task.id].append(rel.to_task.id)
-        
-        # Calculate optimization scores for tasks (similar to dashboard)
-        for task in tasks:
-            # Base score starts with priority (lower number = higher priority)
-            score = task.priority * 10
-            
-            # Add project priority (lower number = higher priority)
-            if task.project:
-                score += task.project.priority * 100
-            else:
-                score += 1000  # No project gets lowest priority
-            
-            # Add duration factor (shorter tasks get higher priority)
-            if task.estimate_minutes:
-                score += min(task.estimate_minutes // 30, 10)  # Max 10 points for duration
-            else:
-                score += 5  # Default duration score
-            
-            # Add dependency factor (tasks with more dependencies get higher priority)
-            # But don't penalize too much - just a small boost
-            score -= len(task_dependencies[task.id]) * 2
-            
-            task.optimization_score = score
-        
-        # Sort tasks by optimization score (lower score = higher priority)
-        sorted_tasks = sorted(tasks, key=lambda x: x.optimization_score)
+        # Plan everything in memory, then persist the result
+        plan = build_calendar_plan(request.user)
+        persist_plan(plan)
         
-        # Calculate total task duration
-        total_task_duration = sum(task.estimate_minutes or 60 for task in sorted_tasks)
-        
-        # Estimate how many days we need (with 70% capacity per day)
-        estimated_days_needed = max(1, int(total_task_duration / daily_capacity_minutes) + 1)
-        
-        # Get time slots when user is not available
-        time_slots = TimeSlot.objects.filter(user=request.user, is_active=True)
-        
-        # Get events
-        events = Event.objects.filter(user=request.user)
-        
-        # Get Belgrade timezone
-        belgrade_tz = pytz.timezone('Europe/Belgrade')
-        
-        # Start scheduling from current time in Belgrade timezone
-        current_datetime = timezone.now().astimezone(belgrade_tz)
-        current_date = current_datetime.date()
-        current_time = current_datetime.time()
-        
-        # If current time is before work start, use work start
-        if current_time < work_start:
-            current_time = work_start
-            current_datetime = datetime.combine(current_date, current_time)
-            current_datetime = belgrade_tz.localize(current_datetime)
-        # If current time is after work end, start from next day
-        elif current_time >= work_end:
-            current_date += timedelta(days=1)
-            current_time = work_start
-            current_datetime = datetime.combine(current_date, current_time)
-            current_datetime = belgrade_tz.localize(current_datetime)
-        
-        # Track daily usage to avoid overloading
-        daily_usage = {}
-        
-        # Track when each task is scheduled to respect dependencies
-        task_scheduled_times = {}
-        
-        # Schedule tasks in priority order, respecting dependencies
-        scheduled_task_ids = set()
-        max_attempts_per_task = 30  # Try for 30 days per task
-        max_passes = len(sorted_tasks)  # Prevent infinite loops
-        
-        for pass_num in range(max_passes):
-            tasks_scheduled_this_pass = 0
-            
-            for task in sorted_tasks:
-                if task.id in scheduled_task_ids:
-                    continue  # Already scheduled
-                
-                task_duration = task.estimate_minutes or 60  # Default 1 hour
-                
-                # Check if all dependencies are satisfied
-                dependencies_satisfied = True
-                latest_dependency_end = None
-                
-                for dep_id in task_dependencies[task.id]:
-                    if dep_id in task_scheduled_times:
-                        dep_end = task_scheduled_times[dep_id]
-                        if latest_dependency_end is None or dep_end > latest_dependency_end:
-                            latest_dependency_end = dep_end
-                    else:
-                        dependencies_satisfied = False
-                        break
-                
-                if not dependencies_satisfied:
-                    # Skip this task for now, it will be scheduled later
-                    continue
-                
-                # If we have dependencies, start after the latest dependency ends
-                if latest_dependency_end:
-                    current_datetime = latest_dependency_end
-                    current_date = current_datetime.date()
-                    current_time = current_datetime.time()
-                    
-                    # If dependency ended after work hours, start next day
-                    if current_time >= work_end:
-                        current_date += timedelta(days=1)
-                        current_time = work_start
-                        current_datetime = datetime.combine(current_date, current_time)
-                        current_datetime = belgrade_tz.localize(current_datetime)
-                
-                # Find available slot for this task
-                scheduled = False
-                attempts = 0
-                
-                while not scheduled and attempts < max_attempts_per_task:
-                    # Check if we can fit this task in the current day
-                    day_events = events.filter(start_time__date=current_date)
-                    day_time_slots = [ts for ts in time_slots if current_date.weekday() in ts.days_of_week]
-                    
-                    # Calculate available time for this day
-                    available_time = _calculate_available_time(
-                        current_date, work_start, work_end, day_events, day_time_slots
-                    )
-                    
-                    # Check current day usage
-                    current_day_usage = daily_usage.get(current_date, 0)
-                    remaining_capacity = daily_capacity_minutes - current_day_usage
-                    
-                    # Check if task fits in available time and capacity
-                    if available_time >= task_duration and remaining_capacity >= task_duration:
-                        # Try to schedule the task starting from current time
-                        scheduled = _schedule_task_in_day_from_time(
-                            task, current_date, current_time, work_end, 
-                            day_events, day_time_slots, task_duration, request.user
-                        )
-                        
-                        if scheduled:
-                            # Update daily usage
-                            daily_usage[current_date] = current_day_usage + task_duration
-                            # Record when this task ends for dependency tracking
-                            task_scheduled_times[task.id] = current_datetime + timedelta(minutes=task_duration)
-                            scheduled_task_ids.add(task.id)
-                            tasks_scheduled_this_pass += 1
-                            
-                            # Update current_datetime for next task
-                            current_datetime = task_scheduled_times[task.id]
-                            current_date = current_datetime.date()
-                            current_time = current_datetime.time()
-                            
-                            # If task ended after work hours, move to next day
-                            if current_time >= work_end:
-                                current_date += timedelta(days=1)
-                                current_time = work_start
-                                current_datetime = datetime.combine(current_date, current_time)
-                                current_datetime = belgrade_tz.localize(current_datetime)
-                    
-                    if not scheduled:
-                        # Move to next day
-                        current_date += timedelta(days=1)
-                        current_time = work_start
-                        current_datetime = datetime.combine(current_date, current_time)
-                        current_datetime = belgrade_tz.localize(current_datetime)
-                        attempts += 1
-                
-                if not scheduled:
-                    # If couldn't schedule after max attempts, schedule at the end of the last day
-                    end_datetime = datetime.combine(current_date, work_end) - timedelta(minutes=task_duration)
-                    end_datetime = belgrade_tz.localize(end_datetime)
-                    CalendarTask.objects.create(
-                        task=task,
-                        scheduled_start=end_datetime,
-                        scheduled_end=datetime.combine(current_date, work_end),
-                        calendar_date=current_date,
-                        user=request.user
-                    )
-                    task_scheduled_times[task.id] = belgrade_tz.localize(datetime.combine(current_date, work_end))
-                    scheduled_task_ids.add(task.id)
-                    tasks_scheduled_this_pass += 1
-                    
-                    # Update current_datetime for next task
-                    current_datetime = task_scheduled_times[task.id]
-                    current_date = current_datetime.date()
-                    current_time = current_datetime.time()
-                    
-                    # Move to next day since this task ended at work end
-                    current_date += timedelta(days=1)
-                    current_time = work_start
-                    current_datetime = datetime.combine(current_date, current_time)
-                    current_datetime = belgrade_tz.localize(current_datetime)
-            
-            # If no tasks were scheduled in this pass, we're done
-            if tasks_scheduled_this_pass == 0:
-                break
+        # Tasks that depend on each other in a loop can never be placed
+        if plan.cycles:
+            titles = dict(Task.objects.filter(
+                id__in=[task_id for cycle in plan.cycles for task_id in cycle]
+            ).values_list('id', 'title'))
+            for cycle in plan.cycles:
+                messages.warning(
+                    request,
+                    'Circular dependency, not scheduled: ' + ', '.join(titles[task_id] for task_id in cycle)
+                )
         
         messages.success(request, 'Calendar regenerated successfully with smart optimization and dependency support!')
         return redirect('calendar')
     
     return redirect('calendar')
 
-def _calculate_available_time(date, work_start, work_end, events, time_slots):
-    """Calculate total available time for a given day"""
-    # Start with full working hours
-    total_minutes = (work_end.hour - work_start.hour) * 60 + (work_end.minute - work_start.minute)
-    
-    # Subtract time blocked by events
-    for event in events:
-        event_start = max(event.start_time.time(), work_start)
-        event_end = min(event.end_time.time(), work_end)
-        if event_start < event_end:
-            event_minutes = (event_end.hour - event_start.hour) * 60 + (event_end.minute - event_start.minute)
-            total_minutes -= event_minutes
-    
-    # Subtract time blocked by time slots
-    for time_slot in time_slots:
-        slot_start = max(time_slot.start_time, work_start)
-        slot_end = min(time_slot.end_time, work_end)
-        if slot_start < slot_end:
-            slot_minutes = (slot_end.hour - slot_start.hour) * 60 + (slot_end.minute - slot_start.minute)
-            total_minutes -= slot_minutes
-    
-    return max(0, total_minutes)
-
-def _schedule_task_in_day(task, date, work_start, work_end, events, time_slots, task_duration, user):
-    """Try to schedule a task within a specific day"""
-    current_time = work_start
-    
-    while current_time < work_end:
-        # Calculate end time for this task
-        end_time = datetime.combine(date, current_time) + timedelta(minutes=task_duration)
-        end_time = end_time.time()
-        
-        # Check if task would end after work hours - if so, move to next day
-        if end_time > work_end:
-            return False
-        
-        # Check if this time slot conflicts with events
-        conflicts_with_events = False
-        for event in events:
-            event_start = event.start_time.time()
-            event_end = event.end_time.time()
-            if (current_time < event_end and end_time > event_start):
-                conflicts_with_events = True
-                break
-        
-        if conflicts_with_events:
-            # Move to after this event
-            for event in events:
-                if current_time < event.end_time.time():
-                    current_time = event.end_time.time()
-                    # Check if we're still within work hours after moving
-                    if current_time >= work_end:
-                        return False
-                    break
-            continue
-        
-        # Check if this time slot conflicts with time slots
-        conflicts_with_slots = False
-        for time_slot in time_slots:
-            if (current_time < time_slot.end_time and end_time > time_slot.start_time):
-                conflicts_with_slots = True
-                current_time = time_slot.end_time
-                # Check if we're still within work hours after moving
-                if current_time >= work_end:
-                    return False
-                break
-        
-        if conflicts_with_slots:
-            continue
-        
-        # Found available slot - schedule the task
-        CalendarTask.objects.create(
-            task=task,
-            scheduled_start=datetime.combine(date, current_time),
-            scheduled_end=datetime.combine(date, current_time) + timedelta(minutes=task_duration),
-            calendar_date=date,
-            user=user
-        )
-        return True
-    
-    return False
-
-def _schedule_task_in_day_from_time(task, date, current_time, work_end, events, time_slots, task_duration, user):
-    """Try to schedule a task starting from a specific time within a day"""
-    while current_time < work_end:
-        # Calculate end time for this task
-        end_time = datetime.combine(date, current_time) + timedelta(minutes=task_duration)
-        end_time = end_time.time()
-        
-        # Check if task would end after work hours - if so, move to next day
-        if end_time > work_end:
-            return False
-        
-        # Check if this time slot conflicts with events
-        conflicts_with_events = False
-        for event in events:
-            event_start = event.start_time.time()
-            event_end = event.end_time.time()
-            if (current_time < event_end and end_time > event_start):
-                conflicts_with_events = True
-                break
-        
-        if conflicts_with_events:
-            # Move to after this event
-            for event in events:
-                if current_time < event.end_time.time():
-                    current_time = event.end_time.time()
-                    # Check if we're still within work hours after moving
-                    if current_time >= work_end:
-                        return False
-                    break
-            continue
-        
-        # Check if this time slot conflicts with time slots
-        conflicts_with_slots = False
-        for time_slot in time_slots:
-            if (current_time < time_slot.end_time and end_time > time_slot.start_time):
-                conflicts_with_slots = True
-                current_time = time_slot.end_time
-                # Check if we're still within work hours after moving
-                if current_time >= work_end:
-                    return False
-                break
-        
-        if conflicts_with_slots:
-            continue
-        
-        # Found available slot - schedule the task
-        CalendarTask.objects.create(
-            task=task,
-            scheduled_start=datetime.combine(date, current_time),
-            scheduled_end=datetime.combine(date, current_time) + timedelta(minutes=task_duration),
-            calendar_date=date,
-            user=user
-        )
-        return True
-    
-    return False
-
 @login_required
 def event_create(request):
     """Create a new event"""
@@ -740,6 +390,7 @@ def event_create(request):
                 event.max_occurrences = None
             
             event.save()
+            reschedule_events(request.user, [event])
             messages.success(request, 'Event created successfully!')
             return redirect('calendar')
     else:
@@ -748,7 +399,7 @@ def event_create(request):
     return render(request, 'tasks/event_form.html', {
         'form': form,
         'title': 'Create Event',
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -757,6 +408,8 @@ def event_edit(request, event_id):
     event = get_object_or_404(Event, id=event_id, user=request.user)
     
     if request.method == 'POST':
+        # Remember where the event was so those days get repaired too
+        previous_dates = events_affected_dates([event])
         form = EventForm(request.POST, instance=event)
         if form.is_valid():
             event = form.save(commit=False)
@@ -778,6 +431,7 @@ def event_edit(request, event_id):
                 event.max_occurrences = None
             
             event.save()
+            reschedule(request.user, dates=previous_dates + events_affected_dates([event]))
             messages.success(request, 'Event updated successfully!')
             return redirect('calendar')
     else:
@@ -787,7 +441,7 @@ def event_edit(request, event_id):
         'form': form,
         'title': 'Edit Event',
         'event': event,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -802,6 +456,7 @@ def time_slot_create(request):
             days_of_week = form.cleaned_data.get('days_of_week', [])
             time_slot.days_of_week = [int(day) for day in days_of_week]
             time_slot.save()
+            reschedule(request.user, weekdays=time_slot.days_of_week)
             messages.success(request, 'Time slot created successfully!')
             return redirect('calendar')
     else:
@@ -831,7 +486,7 @@ def list_inbox(request):
     return render(request, 'tasks/list.html', {
         'tasks': tasks, 
         'title': 'Inbox', 
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'now': timezone.now()
     })
 
@@ -841,7 +496,7 @@ def list_today(request):
     return render(request, 'tasks/list.html', {
         'tasks': tasks, 
         'title': 'Today', 
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'now': timezone.now()
     })
 
@@ -851,7 +506,7 @@ def list_upcoming(request):
     return render(request, 'tasks/list.html', {
         'tasks': tasks, 
         'title': 'Upcoming', 
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'now': timezone.now()
     })
 
@@ -861,7 +516,7 @@ def list_done(request):
     return render(request, 'tasks/list.html', {
         'tasks': tasks, 
         'title': 'Done', 
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'now': timezone.now()
     })
 
@@ -890,7 +545,10 @@ def task_detail(request, task_id):
         'task': task,
         'relationships': relationships,
         'incoming_relationships': incoming_relationships,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        # Direct and indirect blockers and dependents from the closure index
+        'upstream_tasks': list(closure.upstream(task).order_by('priority', 'id')),
+        'downstream_tasks': list(closure.downstream(task).order_by('priority', 'id')),
+        'projects': user_projects(request.user),
         'now': timezone.now(),
     }
     return render(request, 'tasks/task_detail.html', context)
@@ -914,7 +572,7 @@ def project_detail(request, slug):
         'project': project,
         'tasks': tasks,
         'status_filter': status_filter,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'now': timezone.now(),
     }
     return render(request, 'tasks/project_detail.html', context)
@@ -940,7 +598,7 @@ def task_create(request):
     return render(request, 'tasks/task_form.html', {
         'form': form, 
         'title': 'Create Task',
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -950,6 +608,7 @@ def task_edit(request, task_id):
         form = TaskForm(request.POST, instance=task, user=request.user)
         if form.is_valid():
             form.save()
+            reschedule(request.user, task_ids=[task.id])
             messages.success(request, 'Task updated successfully!')
             return redirect('task_detail', task_id=task.id)
     else:
@@ -958,7 +617,7 @@ def task_edit(request, task_id):
     return render(request, 'tasks/task_form.html', {
         'form': form, 
         'title': 'Edit Task',
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -978,7 +637,7 @@ def project_create(request):
     return render(request, 'tasks/project_form.html', {
         'form': form, 
         'title': 'Create Project',
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -996,7 +655,7 @@ def project_edit(request, slug):
     return render(request, 'tasks/project_form.html', {
         'form': form, 
         'title': 'Edit Project',
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -1009,26 +668,32 @@ def quick_add(request):
         project_id = request.POST.get('project')
         due_at = request.POST.get('due_at')
         tags = request.POST.get('tags', '')
+        batch = request.POST.get('batch', '')
         
-        if title:
-            task = Task.objects.create(
-                user=request.user,
-                title=title,
-                description=description,
-                priority=int(priority),
-                estimate_minutes=int(estimate_minutes) if estimate_minutes else None,
-                project_id=project_id if project_id else None,
-                due_at=datetime.fromisoformat(due_at.replace('Z', '+00:00')) if due_at else None,
-            )
-            
-            # Handle tags
-            if tags:
-                tag_names = [tag.strip() for tag in tags.split(',') if tag.strip()]
-                for tag_name in tag_names:
-                    tag, created = Tag.objects.get_or_create(name=tag_name)
-                    task.tags.add(tag)
+        # Only the batch box uses quick-add syntax; a title is taken literally
+        if batch.strip():
+            lines = parse_quick_add(batch)
+        elif title and title.strip():
+            lines = [QuickAddLine(title=title.strip())]
+        else:
+            lines = []
+        
+        if lines:
+            # The form fields are defaults for every line
+            defaults = {
+                'description': description,
+                'priority': int(priority),
+                'estimate_minutes': int(estimate_minutes) if estimate_minutes else None,
+                'project': get_object_or_404(Project, id=project_id, user=request.user) if project_id else None,
+                'due_at': datetime.fromisoformat(due_at.replace('Z', '+00:00')) if due_at else None,
+                'tags': [tag.strip() for tag in tags.split(',') if tag.strip()],
+            }
+            created = create_quick_add_tasks(request.user, lines, defaults)
             
-            messages.success(request, 'Task added successfully!')
+            if len(created) == 1:
+                messages.success(request, 'Task added successfully!')
+            else:
+                messages.success(request, f'{len(created)} tasks added successfully!')
             return redirect('dashboard')
     
     return redirect('dashboard')
@@ -1079,13 +744,17 @@ def task_relationships(request, task_id):
         if form.is_valid():
             relationship = form.save(commit=False)
             relationship.from_task = task
-            relationship.save()
-            messages.success(request, 'Relationship created successfully!')
-            return redirect('task_relationships', task_id=task.id)
+            if closure.would_create_cycle(task.id, relationship.to_task_id, relationship.relationship_type):
+                messages.error(request, 'That relationship would create a dependency cycle.')
+            else:
+                relationship.save()
+                messages.success(request, 'Relationship created successfully!')
+                return redirect('task_relationships', task_id=task.id)
     else:
         form = TaskRelationshipForm()
     
-    # Get all tasks for the dropdown (excluding current task)
+    # Get all tasks for the dropdown (excluding current task); precedence
+    # links that would close a cycle are rejected above
     available_tasks = Task.objects.filter(user=request.user).exclude(id=task.id)
     
     # Get existing relationships
@@ -1098,7 +767,7 @@ def task_relationships(request, task_id):
         'available_tasks': available_tasks,
         'outgoing_relationships': outgoing_relationships,
         'incoming_relationships': incoming_relationships,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
     }
     return render(request, 'tasks/task_relationships.html', context)
 
@@ -1106,42 +775,48 @@ def task_relationships(request, task_id):
 def optimal_task_order(request):
     """Calculate optimal task order based on dependencies, priorities, and due dates"""
     
-    # Get all user's tasks
-    tasks = Task.objects.filter(user=request.user, status__in=['todo', 'in_progress'])
+    # Get all user's tasks with their relationship counts in one query
+    tasks = list(Task.objects.filter(
+        user=request.user, status__in=['todo', 'in_progress']
+    ).annotate(
+        blocking_count=Count(
+            'outgoing_relationships',
+            filter=Q(outgoing_relationships__relationship_type='blocks'),
+            distinct=True,
+        ),
+        dependency_count=Count(
+            'incoming_relationships',
+            filter=Q(incoming_relationships__relationship_type='depends_on'),
+            distinct=True,
+        ),
+    ).select_related('project'))
+    
+    tasks_by_id = {task.id: task for task in tasks}
+    graph = DependencyGraph.for_user(request.user, tasks_by_id)
+    downstream_counts = graph.downstream_counts()
+    analysis = analyse_tasks(tasks, graph)
+    
+    # Score the whole batch: tasks that block others or sit on the critical path
+    # go first, tasks that depend on others go later
+    scores = score_tasks(
+        tasks, OPTIMAL_ORDER_WEIGHTS,
+        blocking={task.id: task.blocking_count for task in tasks},
+        dependencies={task.id: task.dependency_count for task in tasks},
+        critical=analysis.critical(),
+    )
     
-    # Calculate task scores for ordering
+    # Order by optimal score, but never before a task's prerequisites
     for task in tasks:
-        # Base score starts with priority (lower number = higher priority)
-        score = task.priority
-        
-        # Add urgency based on due date
-        if task.due_at:
-            days_until_due = (task.due_at - timezone.now()).days
-            if days_until_due < 0:  # Overdue
-                score -= 10
-            elif days_until_due <= 1:  # Due today/tomorrow
-                score -= 5
-            elif days_until_due <= 3:  # Due this week
-                score -= 2
-        
-        # Add dependency penalty (tasks that block others get higher priority)
-        blocking_count = TaskRelationship.objects.filter(
-            from_task=task, 
-            relationship_type='blocks'
-        ).count()
-        score -= blocking_count * 2
-        
-        # Add dependency requirement penalty (tasks that depend on others get lower priority)
-        dependency_count = TaskRelationship.objects.filter(
-            to_task=task, 
-            relationship_type='depends_on'
-        ).count()
-        score += dependency_count * 2
-        
-        task.optimal_score = score
+        task.optimal_score = scores[task.id]
+        task.downstream_count = downstream_counts[task.id]
+        task.timing = analysis.timings.get(task.id)
+    
+    ordering = graph.topological_order(key=lambda task_id: (tasks_by_id[task_id].optimal_score, task_id))
     
-    # Sort tasks by optimal score
-    optimal_tasks = sorted(tasks, key=lambda x: x.optimal_score)
+    # Tasks stuck in or behind a cycle go last so they are still listed
+    cycle_ids = [task_id for cycle in ordering.cycles for task_id in cycle]
+    optimal_tasks = [tasks_by_id[task_id] for task_id in ordering.order + ordering.blocked + cycle_ids]
+    dependency_cycles = [[tasks_by_id[task_id] for task_id in cycle] for cycle in ordering.cycles]
     
     # Group tasks by project for better organization
     tasks_by_project = {}
@@ -1154,7 +829,8 @@ def optimal_task_order(request):
     context = {
         'optimal_tasks': optimal_tasks,
         'tasks_by_project': tasks_by_project,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'dependency_cycles': dependency_cycles,
+        'projects': user_projects(request.user),
         'now': timezone.now(),
     }
     return render(request, 'tasks/optimal_order.html', context)
@@ -1187,41 +863,55 @@ def create_project_from_tasks(request):
     
     context = {
         'unassigned_tasks': unassigned_tasks,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
     }
     return render(request, 'tasks/create_project_from_tasks.html', context)
 
 @login_required
 def task_mind_map(request):
     """Show task relationships as a mind map"""
-    tasks = Task.objects.filter(user=request.user, status__in=['todo', 'in_progress'])
+    tasks = Task.objects.filter(user=request.user, status__in=['todo', 'in_progress']).select_related('project')
+    tasks_by_id = {task.id: task for task in tasks}
     
-    # Build relationship graph
+    # Components, layout and cycles come from the cached adjacency index
+    layout = mind_map(request.user)
+    dependency_cycles = [
+        [tasks_by_id[task_id] for task_id in cycle if task_id in tasks_by_id] for cycle in layout['cycles']
+    ]
+    
+    # Build relationship graph in layout order
     task_graph = {}
-    for task in tasks:
-        task_graph[task.id] = {
-            'task': task,
+    for node in layout['nodes']:
+        if node['id'] not in tasks_by_id:
+            continue
+        task_graph[node['id']] = {
+            'task': tasks_by_id[node['id']],
+            'x': node['x'],
+            'y': node['y'],
             'outgoing': [],
             'incoming': [],
         }
     
-    # Add relationships
-    relationships = TaskRelationship.objects.filter(
-        from_task__in=tasks,
-        to_task__in=tasks
-    )
-    
-    # Store actual relationship instances so templates can use display helpers
-    for rel in relationships:
-        if rel.from_task.id in task_graph:
-            task_graph[rel.from_task.id]['outgoing'].append(rel)
-        if rel.to_task.id in task_graph:
-            task_graph[rel.to_task.id]['incoming'].append(rel)
+    # Add relationships from the index, reusing the loaded tasks
+    relationship_labels = dict(TaskRelationship.RELATIONSHIP_TYPES)
+    for from_id, to_id, relationship_type in layout['edges']:
+        if from_id not in task_graph or to_id not in task_graph:
+            continue
+        rel = {
+            'from_task': tasks_by_id[from_id],
+            'to_task': tasks_by_id[to_id],
+            'relationship_type': relationship_type,
+            'get_relationship_type_display': relationship_labels.get(relationship_type, relationship_type),
+        }
+        task_graph[from_id]['outgoing'].append(rel)
+        task_graph[to_id]['incoming'].append(rel)
     
     context = {
         'task_graph': task_graph,
         'tasks': tasks,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'dependency_cycles': dependency_cycles,
+        'mind_map_groups': layout['components'],
+        'projects': user_projects(request.user),
     }
     return render(request, 'tasks/task_mind_map.html', context)
 
@@ -1232,32 +922,39 @@ def event_delete(request, event_id):
     
     if request.method == 'POST':
         delete_type = request.POST.get('delete_type', 'single')
+        affected_dates = []
         
         if delete_type == 'single':
             # Delete only this occurrence
+            affected_dates = events_affected_dates([event])
             event.delete()
             messages.success(request, 'Event deleted successfully!')
         elif delete_type == 'future':
             # Delete this and all future occurrences
-            Event.objects.filter(
+            events_to_delete = Event.objects.filter(
                 user=request.user,
                 title=event.title,
                 start_time__gte=event.start_time
-            ).delete()
+            )
+            affected_dates = events_affected_dates(events_to_delete)
+            events_to_delete.delete()
             messages.success(request, 'Event and all future occurrences deleted!')
         elif delete_type == 'all':
             # Delete all occurrences of this recurring event
-            Event.objects.filter(
+            events_to_delete = Event.objects.filter(
                 user=request.user,
                 title=event.title
-            ).delete()
+            )
+            affected_dates = events_affected_dates(events_to_delete)
+            events_to_delete.delete()
             messages.success(request, 'All occurrences of this event deleted!')
         
+        reschedule(request.user, dates=affected_dates)
         return redirect('calendar')
     
     return render(request, 'tasks/event_delete_confirm.html', {
         'event': event,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -1266,13 +963,15 @@ def time_slot_delete(request, time_slot_id):
     time_slot = get_object_or_404(TimeSlot, id=time_slot_id, user=request.user)
     
     if request.method == 'POST':
+        weekdays = time_slot.days_of_week
         time_slot.delete()
+        reschedule(request.user, weekdays=weekdays)
         messages.success(request, 'Time slot deleted successfully!')
         return redirect('calendar')
     
     return render(request, 'tasks/time_slot_delete_confirm.html', {
         'time_slot': time_slot,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name')
+        'projects': user_projects(request.user)
     })
 
 @login_required
@@ -1292,7 +991,7 @@ def sketch_list(request):
     
     context = {
         'sketches': sketches,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'tasks': Task.objects.filter(user=request.user, status__in=['todo', 'in_progress']).order_by('priority', 'due_at'),
     }
     return render(request, 'tasks/sketch_list.html', context)
@@ -1313,7 +1012,7 @@ def sketch_create(request):
         form = SketchForm(user=request.user)
         # Pre-populate task if task_id is provided in URL
         task_id = request.GET.get('task')
-        if task_id:
+        if task_id and task_id.isdigit():
             try:
                 task = Task.objects.get(id=task_id, user=request.user)
                 form.fields['task'].initial = task
@@ -1323,16 +1022,14 @@ def sketch_create(request):
         # Pre-populate project if project_id is provided in URL
         project_id = request.GET.get('project')
         if project_id:
-            try:
-                project = Project.objects.get(id=project_id)
-                form.fields['project'].initial = project
-            except Project.DoesNotExist:
-                pass
+            if not project_id.isdigit():
+                raise Http404('Invalid project id')
+            form.fields['project'].initial = get_object_or_404(Project, id=project_id, user=request.user)
     
     return render(request, 'tasks/sketch_form.html', {
         'form': form,
         'title': 'Create Sketch',
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'tasks': Task.objects.filter(user=request.user, status__in=['todo', 'in_progress']).order_by('priority', 'due_at'),
     })
 
@@ -1343,7 +1040,7 @@ def sketch_detail(request, sketch_id):
     
     return render(request, 'tasks/sketch_detail.html', {
         'sketch': sketch,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
     })
 
 @login_required
@@ -1369,7 +1066,7 @@ def sketch_edit(request, sketch_id):
         'form': form,
         'sketch': sketch,
         'title': 'Edit Sketch',
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
         'tasks': Task.objects.filter(user=request.user, status__in=['todo', 'in_progress']).order_by('priority', 'due_at'),
     })
 
@@ -1385,7 +1082,7 @@ def sketch_delete(request, sketch_id):
     
     return render(request, 'tasks/sketch_delete_confirm.html', {
         'sketch': sketch,
-        'projects': Project.objects.filter(user=request.user).order_by('priority', 'name'),
+        'projects': user_projects(request.user),
     })
 
 @login_required
@@ -1395,7 +1092,8 @@ def project_delete(request, slug):
     
     if request.method == 'POST':
         project_name = project.name
-        project.delete()
+        with transaction.atomic(), deferred_deletes():
+            project.delete()
         messages.success(request, f'Project "{project_name}" deleted successfully!')
         return redirect('project_list')
     
@@ -1416,7 +1114,8 @@ def task_delete(request, task_id):
     
     if request.method == 'POST':
         task_title = task.title
-        task.delete()
+        with transaction.atomic(), deferred_deletes():
+            task.delete()
         messages.success(request, f'Task "{task_title}" deleted successfully!')
         return redirect('all_tasks')
     
@@ -1439,6 +1138,7 @@ def mark_task_done(request, task_id):
         task = get_object_or_404(Task, id=task_id, user=request.user)
         task.status = 'done'
         task.save()
+        reschedule(request.user, task_ids=[task.id])
         messages.success(request, f'Task "{task.title}" marked as done!')
         
         # Redirect back to the referring page or dashboard
@@ -1457,6 +1157,7 @@ def mark_task_undone(request, task_id):
         task = get_object_or_404(Task, id=task_id, user=request.user)
         task.status = 'todo'
         task.save()
+        reschedule(request.user, task_ids=[task.id])
         messages.success(request, f'Task "{task.title}" marked as todo!')
         
         # Redirect back to the referring page or dashboard